@@ -48,6 +48,7 @@ def quit():
     """
     #pygame.quit() #safe even if pygame was never initialised
     logging.flush()
+    logging.root.stopAsync()  # waits for any queued log entries to be written
     for thisThread in threading.enumerate():
         if hasattr(thisThread,'stop') and hasattr(thisThread,'running'):
             #this is one of our event threads - kill it and wait for success
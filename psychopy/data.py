@@ -6,8 +6,10 @@
 
 from __future__ import absolute_import
 
-from pandas import DataFrame, read_csv
-import cPickle, string, sys, os, time, copy
+from pandas import DataFrame, Series, read_csv
+import cPickle, string, sys, os, time, copy, shutil
+import ast
+import hashlib
 import numpy
 from scipy import optimize, special
 import inspect #so that Handlers can find the script that called them
@@ -25,7 +27,7 @@ try:
 except ImportError:
     haveOpenpyxl=False
 
-from psychopy import logging
+from psychopy import logging, prefs
 from psychopy.tools.arraytools import extendArr, shuffleArray
 from psychopy.tools.fileerrortools import handleFileCollision
 from psychopy.tools.filetools import openOutputFile, genDelimiter
@@ -110,11 +112,13 @@ class ExperimentHandler(object):
         self._paramNamesSoFar=[]
         self.dataNames=[]#names of all the data (eg. resp.keys)
         self.autoLog = autoLog
+        self._entryWriter = None#see streamEntries()
         if dataFileName in ['', None]:
             logging.warning('ExperimentHandler created with no dataFileName parameter. No data will be saved in the event of a crash')
         else:
             checkValidFilePath(dataFileName, makeValid=True) #fail now if we fail at all!
     def __del__(self):
+        self.streamEntries(None)
         if self.dataFileName not in ['', None]:
             if self.autoLog:
                 logging.debug('Saving data for %s ExperimentHandler' %self.name)
@@ -249,8 +253,48 @@ class ExperimentHandler(object):
         if type(self.extraInfo)==dict:
             this.update(self.extraInfo)#NB update() really means mergeFrom()
         self.entries.append(this)
+        if getattr(self, '_entryWriter', None) is not None:
+            self._streamEntry(this)
         #then create new empty entry for n
         self.thisEntry = {}
+    def streamEntries(self, fileName=None, delim=None, fsyncEvery=10,
+                      encoding='utf-8', fileCollisionMethod='rename'):
+        """Write each entry to a wide-format text file (with the same
+        columns as saveAsWideText) as soon as nextEntry() is called, rather
+        than only when the data are saved at the end. Data already written
+        survive a crash of the experiment (or of the computer, for all but
+        the last few entries; see :class:`~psychopy.data.TrialWriter`).
+
+        Columns are added to the file as new loop parameters and data
+        appear, each time copying the rows already written to a file with
+        the longer header (so a new loop or data name late in a long
+        experiment takes a moment). Call with `fileName=None` to stop
+        streaming (and close the file), which also happens when the handler
+        is deleted or aborted.
+
+        e.g.::
+
+            exp = data.ExperimentHandler(dataFileName=fileName)
+            exp.streamEntries(fileName + '_stream.csv')
+        """
+        if getattr(self, '_entryWriter', None) is not None:
+            self._entryWriter.close()
+        self._entryWriter = None
+        if fileName is None:
+            return
+        self._entryWriter = TrialWriter(fileName, delim=delim,
+            fsyncEvery=fsyncEvery, encoding=encoding,
+            fileCollisionMethod=fileCollisionMethod)
+    def _streamEntry(self, entry):
+        """Write an entry (in the column order of saveAsWideText)"""
+        names = self._getAllParamNames()
+        names.extend(self.dataNames)
+        names.extend(self._getExtraInfo()[0])
+        ordered = collections.OrderedDict()
+        for name in names:
+            if name in entry:
+                ordered[name] = entry[name]
+        self._entryWriter.write(ordered)
     def saveAsWideText(self, fileName, delim=None,
                    matrixOnly=False,
                    appendFile=False,
@@ -354,6 +398,7 @@ class ExperimentHandler(object):
         """
         self.savePickle=False
         self.saveWideText=False
+        self.streamEntries(None)
 
 class TrialType(dict):
     """This is just like a dict, except that you can access keys with obj.key
@@ -367,6 +412,267 @@ class TrialType(dict):
             except KeyError:
                 raise AttributeError('TrialType has no attribute (or key) \'%s\'' %(name))
 
+class TrialWriter(object):
+    """Writes entries (dicts of {name: value}) to a wide-format text file one
+    row at a time, as each trial is completed, so that a crash loses at most
+    the trial that was running. Normally made for you by
+    :func:`ExperimentHandler.streamEntries` or
+    :func:`TrialHandler.streamTrials`.
+
+    Each row is handed to the operating system as soon as it is written and
+    the file is fsync'ed (committed to the disk itself) every `fsyncEvery`
+    rows and when the writer is closed. With `fieldNames` the header is fixed
+    and values of other names are ignored; otherwise the header grows as new
+    names appear (rows written earlier simply lack the new columns at the
+    end). A text file's first line can't grow in place, so each new name
+    means copying the whole file (see :meth:`_rewriteHeader`), which takes
+    longer the more rows have been written. Give `fieldNames`, or make sure
+    all the names appear in the first few rows, if that matters.
+
+    :usage:
+
+        writer = data.TrialWriter('myData.csv')
+        writer.write({'resp.key': 'left', 'resp.rt': 0.512})
+        writer.close()
+
+    """
+    def __init__(self, fileName, fieldNames=None, delim=None, fsyncEvery=10,
+                 encoding='utf-8', fileCollisionMethod='rename'):
+        if delim is None:
+            delim = genDelimiter(fileName)
+        self.delim = delim
+        self.encoding = encoding
+        self.fsyncEvery = fsyncEvery
+        self.fixedHeader = fieldNames is not None
+        self.fieldNames = []
+        self._fieldSet = set()
+        self._ignoredNames = set()
+        self.nRows = 0
+        self._nUnsynced = 0
+        self._file = openOutputFile(fileName, append=False, delim=delim,
+                                    fileCollisionMethod=fileCollisionMethod,
+                                    encoding=encoding)
+        self.fileName = self._file.name
+        self._headerWritten = False
+        if fieldNames:
+            self._addFieldNames(fieldNames)
+            self._writeHeader()
+
+    def __getstate__(self):
+        # the handlers that own a writer get pickled; the open file can't be
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def _addFieldNames(self, names):
+        for name in names:
+            if name not in self._fieldSet:
+                self.fieldNames.append(name)
+                self._fieldSet.add(name)
+
+    def _formatValue(self, value):
+        if value is None:
+            return u''
+        if isinstance(value, str):
+            value = value.decode(self.encoding, 'replace')
+        else:
+            value = unicode(value)
+        if self.delim in value or '\n' in value or '"' in value:
+            value = u'"%s"' % value.replace('"', '""')
+        return value
+
+    def _writeHeader(self):
+        self._file.write(self.delim.join(
+            [self._formatValue(name) for name in self.fieldNames]) + u'\n')
+        self._headerWritten = True
+
+    def _rewriteHeader(self):
+        """Replace the header line of the file (after new names have been
+        added) by copying the rows into a new file and renaming it over the
+        old one, so the file on disk is always complete. This copies the
+        whole file, so its cost grows with the number of rows written"""
+        if self._file is sys.stdout:
+            self._writeHeader()  # can't go back, so just repeat it
+            return
+        self._file.close()
+        tmpName = self.fileName + '.tmp'
+        header = self.delim.join(
+            [self._formatValue(name) for name in self.fieldNames]) + u'\n'
+        with open(self.fileName, 'rb') as old:
+            old.readline()  # the old header
+            with open(tmpName, 'wb') as new:
+                new.write(header.encode(self.encoding))
+                shutil.copyfileobj(old, new)
+                new.flush()
+                os.fsync(new.fileno())
+        if sys.platform == 'win32':  # where rename won't replace a file
+            os.remove(self.fileName)
+        os.rename(tmpName, self.fileName)
+        self._file = codecs.open(self.fileName, 'a', encoding=self.encoding)
+
+    def write(self, entry):
+        """Append one row: `entry` is a dict of {name: value} (an
+        OrderedDict also sets the order of any new columns)
+        """
+        if self._file is None:
+            raise ValueError("TrialWriter for %s has been closed"
+                             % self.fileName)
+        newNames = [name for name in entry if name not in self._fieldSet]
+        if newNames:
+            if self.fixedHeader:
+                for name in newNames:
+                    if name not in self._ignoredNames:
+                        self._ignoredNames.add(name)
+                        logging.warning("TrialWriter for %s has a fixed "
+                                        "header; ignoring %r"
+                                        % (self.fileName, name))
+            else:
+                self._addFieldNames(newNames)
+                if self._headerWritten:
+                    self._rewriteHeader()
+        if not self._headerWritten:
+            self._writeHeader()
+        self._file.write(self.delim.join(
+            [self._formatValue(entry.get(name)) for name in self.fieldNames]
+            ) + u'\n')
+        self._file.flush()  # to the OS, so it survives a crash of Python
+        self.nRows += 1
+        self._nUnsynced += 1
+        if self.fsyncEvery and self._nUnsynced >= self.fsyncEvery:
+            self.sync()
+
+    def sync(self):
+        """Make sure that all rows written so far are on the disk"""
+        if self._file is None or self._file is sys.stdout:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._nUnsynced = 0
+
+    def close(self):
+        """Sync and close the file (further writes raise a ValueError)"""
+        if self._file is None:
+            return
+        self.sync()
+        if self._file is not sys.stdout:
+            self._file.close()
+            logging.info('streamed %i rows of data to %s'
+                         % (self.nRows, self.fileName))
+        self._file = None
+
+class ConditionsSource(object):
+    """A conditions list that is kept as a numpy structured array (one record
+    per condition, e.g. memory mapped from a file) rather than as a list of
+    dicts, so that a very large table of conditions needn't be held in
+    memory. Each condition is only made into a :class:`TrialType` when it is
+    fetched (`source[n]`), so it can be given to :class:`TrialHandler` as
+    its `trialList` and the random, sequential and fullRandom methods just
+    shuffle the indices of the conditions.
+
+    Text is stored as utf-8 and returned as unicode, or as a list if it
+    looks like one (e.g. [1, 2]); as from :func:`importConditions`, empty
+    cells of text are NaN.
+
+    Usually made with :func:`ConditionsSource.fromFile`::
+
+        conditions = data.ConditionsSource.fromFile('stimuli.csv')
+        trials = data.TrialHandler(conditions, nReps=1, method='random')
+    """
+    def __init__(self, rows):
+        """
+        :Parameters:
+
+            rows: a numpy structured array, with a field for each parameter
+        """
+        self.rows = rows
+        self.fieldNames = list(rows.dtype.names)
+        self._textFields = [rows.dtype[name].kind == 'S'
+                            for name in self.fieldNames]
+
+    @classmethod
+    def fromFile(cls, fileName, chunkSize=10000):
+        """Returns the conditions of a .npy file (a saved structured array)
+        or a .csv file, memory mapped rather than read into memory.
+
+        A .csv file is read `chunkSize` rows at a time and saved as a
+        structured array in the cache of :func:`importConditions` (until the
+        file changes), from which it is then memory mapped. If
+        `data.useConditionsCache` is False it is kept in memory instead.
+        """
+        if not os.path.isfile(fileName):
+            raise ImportError('Conditions file not found: %s' %os.path.abspath(fileName))
+        if fileName.endswith('.npy'):
+            return cls(numpy.load(fileName, mmap_mode='r'))
+        if not fileName.endswith('.csv'):
+            raise ImportError('Conditions file %s: only .csv and .npy files '
+                              'can be used as a ConditionsSource' % fileName)
+        if not useConditionsCache:
+            return cls(_readCsvRows(fileName, chunkSize))
+        cachePath = _getConditionsCachePath(fileName, ext='.npy')
+        keyPath = _getConditionsCachePath(fileName, ext='.key')
+        try:
+            if os.path.isfile(keyPath):
+                with open(keyPath, 'rb') as f:
+                    if cPickle.load(f) == _getConditionsCacheKey(fileName):
+                        return cls(numpy.load(cachePath, mmap_mode='r'))
+        except Exception as e:
+            logging.warning("Couldn't load cached conditions for %s: %s" % (fileName, e))
+        tmpPath = '%s.%i.tmp' % (cachePath, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(cachePath)):
+                os.makedirs(os.path.dirname(cachePath))
+            if os.path.exists(keyPath):
+                os.remove(keyPath)
+            _readCsvRows(fileName, chunkSize, outFileName=tmpPath)
+            if os.path.exists(cachePath):
+                os.remove(cachePath)  # os.rename can't replace files on Windows
+            os.rename(tmpPath, cachePath)
+            #the key is written last: it marks a complete cache entry
+            with open(keyPath, 'wb') as f:
+                cPickle.dump(_getConditionsCacheKey(fileName), f,
+                             cPickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            if isinstance(e, ImportError):  # the file itself is invalid
+                raise
+            logging.warning("Couldn't cache conditions for %s: %s" % (fileName, e))
+            return cls(_readCsvRows(fileName, chunkSize))
+        rows = numpy.load(cachePath, mmap_mode='r')
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return self._makeTrial(self.rows[index])
+
+    def __iter__(self):
+        #copy the records a block at a time, rather than one by one
+        for start in range(0, len(self.rows), 1000):
+            for row in numpy.array(self.rows[start:start + 1000]):
+                yield self._makeTrial(row)
+
+    def _makeTrial(self, row):
+        values = list(row.tolist())
+        for n, isText in enumerate(self._textFields):
+            if isText and not values[n]:
+                values[n] = numpy.nan  # an empty cell, as from importConditions
+            elif isText:
+                values[n] = values[n].decode('utf-8')
+                if values[n].startswith('[') and values[n].endswith(']'):
+                    try:
+                        values[n] = ast.literal_eval(values[n])
+                    except (ValueError, SyntaxError):
+                        pass  # it just looks like a list
+        #made as importConditions() and TrialHandler make them, so that the
+        #keys (e.g. columns of saved data) come in the same order
+        return TrialType(dict(zip(self.fieldNames, values)))
+
 class _BaseTrialHandler(object):
     def setExp(self, exp):
         """Sets the ExperimentHandler that this handler is attached to
@@ -398,8 +704,57 @@ class _BaseTrialHandler(object):
         exp=self.getExp()
         if exp!=None:
             exp.loopEnded(self)
+        self.streamTrials(None)
         #and halt the loop
         raise StopIteration
+    def streamTrials(self, fileName=None, delim=None, fsyncEvery=10,
+                     encoding='utf-8', fileCollisionMethod='rename'):
+        """Write each trial to a wide-format text file (one row per trial)
+        as soon as it has been completed, i.e. when next() is called for the
+        following trial, rather than only when the data are saved at the end.
+        Data already written survive a crash of the experiment (or of the
+        computer, for all but the last few trials; see
+        :class:`~psychopy.data.TrialWriter`).
+
+        Rows hold the extraInfo, the trial number, the parameters of the
+        trial and the data added to it, with columns added to the file as new
+        names appear. The file is closed when the trials end, or call with
+        `fileName=None` to stop streaming.
+
+        e.g.::
+
+            trials = data.TrialHandler(conditions, nReps=5)
+            trials.streamTrials(fileName + '_trials.csv')
+            for thisTrial in trials:
+                ...
+        """
+        if getattr(self, '_trialWriter', None) is not None:
+            self._trialWriter.close()
+        self._trialWriter = None
+        self._streamData = collections.OrderedDict()
+        if fileName is None:
+            return
+        self._trialWriter = TrialWriter(fileName, delim=delim,
+            fsyncEvery=fsyncEvery, encoding=encoding,
+            fileCollisionMethod=fileCollisionMethod)
+    def _streamTrial(self):
+        """Write the trial that has just been completed (if streaming)"""
+        if getattr(self, '_trialWriter', None) is None or self.thisN < 0:
+            return
+        self._trialWriter.write(self._getStreamEntry())
+        self._streamData = collections.OrderedDict()
+    def _getStreamEntry(self):
+        """The row written by streamTrials() for the current trial"""
+        entry = collections.OrderedDict()
+        if self.extraInfo is not None:
+            entry.update(self.extraInfo)
+        entry['TrialNumber'] = self.thisN + 1
+        for attr in ['thisRepN', 'thisTrialN', 'thisIndex']:
+            entry[attr] = getattr(self, attr)
+        if hasattr(self.thisTrial, 'items'):
+            entry.update(self.thisTrial)
+        entry.update(self._streamData)
+        return entry
     def saveAsPickle(self,fileName, fileCollisionMethod='rename'):
         """Basically just saves a copy of the handler (with data) to a pickle file.
 
@@ -698,6 +1053,8 @@ class TrialHandler(_BaseTrialHandler):
 
             trialList: a simple list (or flat array) of dictionaries specifying conditions
                 This can be imported from an excel/csv file using :func:`~psychopy.data.importConditions`
+                For very large tables of conditions use a :class:`~psychopy.data.ConditionsSource`,
+                whose conditions are only read as they are needed
 
             nReps: number of repeats for all conditions
 
@@ -762,9 +1119,10 @@ class TrialHandler(_BaseTrialHandler):
         else:
             self.trialList =trialList
         #convert any entry in the TrialList into a TrialType object (with obj.key or obj[key] access)
-        for n, entry in enumerate(self.trialList):
-            if type(entry)==dict:
-                self.trialList[n]=TrialType(entry)
+        if not isinstance(self.trialList, ConditionsSource):  # makes its own
+            for n, entry in enumerate(self.trialList):
+                if type(entry)==dict:
+                    self.trialList[n]=TrialType(entry)
         self.nReps = int(nReps)
         self.nTotal = self.nReps*len(self.trialList)
         self.nRemaining =self.nTotal #subtract 1 each trial
@@ -862,23 +1220,8 @@ class TrialHandler(_BaseTrialHandler):
         specify sequential order; any order is possible this way.
         """
         # create indices for a single rep
-        indices = numpy.asarray(self._makeIndices(self.trialList), dtype=int)
-
-        if self.method == 'random':
-            sequenceIndices = []
-            seed=self.seed
-            for thisRep in range(self.nReps):
-                thisRepSeq = shuffleArray(indices.flat, seed=seed).tolist()
-                seed=None#so that we only seed the first pass through!
-                sequenceIndices.append(thisRepSeq)
-            sequenceIndices = numpy.transpose(sequenceIndices)
-        elif self.method == 'sequential':
-            sequenceIndices = numpy.repeat(indices,self.nReps,1)
-        elif self.method == 'fullRandom':
-            # indices*nReps, flatten, shuffle, unflatten; only use seed once
-            sequential = numpy.repeat(indices, self.nReps,1) # = sequential
-            randomFlat = shuffleArray(sequential.flat, seed=self.seed)
-            sequenceIndices = numpy.reshape(randomFlat, (len(indices), self.nReps))
+        indices = numpy.arange(len(self.trialList), dtype=numpy.int32)
+        sequenceIndices = _makeSequence(self.method, indices, self.nReps, self.seed)
         if self.autoLog:
             logging.exp('Created sequence: %s, trialTypes=%d, nReps=%i, seed=%s' %
                 (self.method, len(indices), self.nReps, str(self.seed) )  )
@@ -932,6 +1275,7 @@ class TrialHandler(_BaseTrialHandler):
                     break #break out of the forever loop
                 #do stuff here for the trial
         """
+        self._streamTrial()
         #update pointer for next trials
         self.thisTrialN+=1#number of trial this pass
         self.thisN+=1 #number of trial in total
@@ -965,8 +1309,9 @@ class TrialHandler(_BaseTrialHandler):
         # check that we don't go out of bounds for either positive or negative offsets:
         if n>self.nRemaining or self.thisN+n < 0:
             return None
-        seqs = numpy.array(self.sequenceIndices).transpose().flat
-        condIndex=seqs[self.thisN+n]
+        #straight from the sequence of that repetition, without copying it
+        repN, trialN = divmod(self.thisN+n, len(self.sequenceIndices))
+        condIndex=self.sequenceIndices[trialN][repN]
         return self.trialList[condIndex]
 
     def getEarlierTrial(self, n=-1):
@@ -1012,36 +1357,13 @@ class TrialHandler(_BaseTrialHandler):
             thisLine=[]
             lines.append(thisLine)
             #first the params for this stim (from self.trialList)
+            thisTrial = self.trialList[stimN]
             for heading in stimOut:
-                thisLine.append(self.trialList[stimN][heading])
+                thisLine.append(thisTrial[heading])
 
             #then the data for this stim (from self.data)
             for thisDataOut in dataOut:
-                #make a string version of the data and then format it
-                tmpData = dataAnal[thisDataOut][stimN]
-                if hasattr(tmpData,'tolist'): #is a numpy array
-                    strVersion = unicode(tmpData.tolist())
-                    #for numeric data replace None with a blank cell
-                    if tmpData.dtype.kind not in ['SaUV']:
-                        strVersion=strVersion.replace('None','')
-                elif tmpData in [None,'None']:
-                    strVersion=''
-                else:
-                    strVersion = unicode(tmpData)
-
-                if strVersion=='()':
-                    strVersion="--"# 'no data' in masked array should show as "--"
-                #handle list of values (e.g. rt_raw )
-                if len(strVersion) and strVersion[0] in ["[", "("] and strVersion[-1] in ["]", ")"]:
-                    strVersion=strVersion[1:-1]#skip first and last chars
-                #handle lists of lists (e.g. raw of multiple key presses)
-                if len(strVersion) and strVersion[0] in ["[", "("] and strVersion[-1] in ["]", ")"]:
-                    tup = eval(strVersion) #convert back to a tuple
-                    for entry in tup:
-                        #contents of each entry is a list or tuple so keep in quotes to avoid probs with delim
-                        thisLine.append(unicode(entry))
-                else:
-                    thisLine.extend(strVersion.split(','))
+                thisLine.extend(_getOutputCells(dataAnal[thisDataOut][stimN]))
 
         #add self.extraInfo
         if (self.extraInfo != None) and not matrixOnly:
@@ -1147,7 +1469,7 @@ class TrialHandler(_BaseTrialHandler):
                   ):
         """
         Write a text file with the session, stimulus, and data values from each trial in chronological order.
-        Also, return a pandas DataFrame containing same information as the file.
+        Also, return a pandas DataFrame containing same information as the file (see :func:`toDataFrame`).
 
         That is, unlike 'saveAsText' and 'saveAsExcel':
          - each row comprises information from only a single trial.
@@ -1198,90 +1520,131 @@ class TrialHandler(_BaseTrialHandler):
             fileCollisionMethod=fileCollisionMethod, encoding=encoding
         )
 
-        # collect parameter names related to the stimuli:
+        self._writeWideText(f, delim, matrixOnly)
+
+        if f != sys.stdout:
+            f.close()
+            logging.info('saved wide-format data to %s' %f.name)
+
+        return self.toDataFrame()
+
+    def _getTrialPositions(self):
+        """Returns the index (in trialList) of the condition of every trial,
+        in the order they are run, and the row and column where the data of
+        that trial are stored in each array of self.data
+        """
+        order = numpy.asarray(self.sequenceIndices, dtype=int).T.ravel()
+        #the number of earlier trials of the same condition (a stable sort
+        #keeps trials of each condition in the order they are run)
+        sortedN = numpy.argsort(order, kind='mergesort')
+        sortedOrder = order[sortedN]
+        repeats = numpy.empty_like(order)
+        repeats[sortedN] = (numpy.arange(len(order)) -
+                            numpy.searchsorted(sortedOrder, sortedOrder))
+        return order, order, repeats
+
+    def _getWideHeader(self):
+        """Returns the names of the extraInfo, the trial parameters and the
+        data, as they are ordered in the wide-format output
+        """
         if self.trialList[0]:
-            header = self.trialList[0].keys()
+            paramNames = self.trialList[0].keys()
         else:
-            header = []
-        # and then add parameter names related to data (e.g. RT)
-        header.extend(self.data.dataTypes)
-        # get the extra 'wide' parameter names into the header line:
-        header.insert(0,"TrialNumber")
-        # this is wide format, so we want fixed information
-        # (e.g. subject ID, date, etc) repeated every line if it exists:
+            paramNames = []
+        dataNames = [name for name in self.data.dataTypes
+                     if name not in paramNames]
+        extraNames = []
         if self.extraInfo is not None:
-            for key in self.extraInfo:
-                header.insert(0, key)
-        df = DataFrame(columns = header)
-
-        # loop through each trial, gathering the actual values:
-        dataOut = []
-        trialCount = 0
-        # total number of trials = number of trialtypes * number of repetitions:
-
-        repsPerType={}
-        for rep in range(self.nReps):
-            for trialN in range(len(self.trialList)):
-                #find out what trial type was on this trial
-                trialTypeIndex = self.sequenceIndices[trialN, rep]
-                #determine which repeat it is for this trial
-                if trialTypeIndex not in repsPerType.keys():
-                    repsPerType[trialTypeIndex]=0
+            for name in self.extraInfo:
+                if name not in paramNames and name not in dataNames:
+                    extraNames.insert(0, name)
+        return extraNames, paramNames, dataNames
+
+    def _writeWideText(self, f, delim, matrixOnly=False):
+        """Writes the wide-format text of saveAsWideText() to the open file
+        `f`, taking each column straight from the conditions and data arrays
+        """
+        order, rows, cols = self._getTrialPositions()
+        extraNames, paramNames, dataNames = self._getWideHeader()
+        columns = []
+        for name in extraNames:
+            columns.append([unicode(self.extraInfo[name])] * len(order))
+        columns.append([unicode(n) for n in range(1, len(order) + 1)])
+        #the text of each condition's values (going through the conditions
+        #once, as a ConditionsSource makes them as they're fetched), then
+        #one per trial
+        paramText = [numpy.empty(len(self.trialList), dtype=object)
+                     for name in paramNames]
+        for n, thisTrial in enumerate(self.trialList):
+            for name, text in zip(paramNames, paramText):
+                if thisTrial and name in thisTrial:
+                    text[n] = unicode(thisTrial[name])
                 else:
-                    repsPerType[trialTypeIndex]+=1
-                repThisType=repsPerType[trialTypeIndex]#what repeat are we on for this trial type?
-
-                # create a dictionary representing each trial:
-                nextEntry = {}
-
-                # add a trial number so the original order of the data can always be recovered if sorted during analysis:
-                trialCount += 1
-
-                # now collect the value from each trial of the variables named in the header:
-                for parameterName in header:
-                    # the header includes both trial and data variables, so need to check before accessing:
-                    if self.trialList[trialTypeIndex] and parameterName in self.trialList[trialTypeIndex]:
-                        nextEntry[parameterName] = self.trialList[trialTypeIndex][parameterName]
-                    elif parameterName in self.data:
-                        nextEntry[parameterName] = self.data[parameterName][trialTypeIndex][repThisType]
-                    elif self.extraInfo is not None and parameterName in self.extraInfo:
-                        nextEntry[parameterName] = self.extraInfo[parameterName]
-                    else: # allow a null value if this parameter wasn't explicitly stored on this trial:
-                        if parameterName == "TrialNumber":
-                            nextEntry[parameterName] = trialCount
-                        else:
-                            nextEntry[parameterName] = ''
+                    text[n] = u''
+        for text in paramText:
+            columns.append(text[order])
+        for name in dataNames:
+            #iterating a masked array gives '--' where there are no data
+            columns.append([unicode(value)
+                            for value in self.data[name][rows, cols]])
+        if not matrixOnly:
+            header = extraNames + ['TrialNumber'] + paramNames + dataNames
+            f.write(delim.join(header) + '\n')
+        for line in zip(*columns):
+            f.write(delim.join(line) + '\n')
 
-                #store this trial's data
-                dataOut.append(nextEntry)
-                df = df.append(nextEntry, ignore_index=True)
+    def toDataFrame(self):
+        """Returns the data as a pandas DataFrame with one row per trial, in
+        the order they are run, and the same columns as saveAsWideText():
+        the extraInfo, TrialNumber, the parameters of the trial and the data.
 
-        if not matrixOnly:
-        # write the header row:
-            nextLine = ''
-            for parameterName in header:
-                nextLine = nextLine + parameterName + delim
-            f.write(nextLine[:-1] + '\n') # remove the final orphaned tab character
-
-        # write the data matrix:
-        for trial in dataOut:
-            nextLine = ''
-            for parameterName in header:
-                nextLine = nextLine + unicode(trial[parameterName]) + delim
-            nextLine = nextLine[:-1] # remove the final orphaned tab character
-            f.write(nextLine + '\n')
+        The columns are built straight from the conditions and the arrays of
+        `.data` and keep their types (bools, ints, floats or objects). Data
+        that weren't stored (e.g. for trials not yet run) are NaN, or None in
+        columns of objects.
 
-        if f != sys.stdout:
-            f.close()
-            logging.info('saved wide-format data to %s' %f.name)
+        e.g.::
 
-        df= df.convert_objects() # Converts numbers to numeric, such as float64, boolean to bool. Otherwise they all are "object" type, i.e. strings
-        return df
+            df = trials.toDataFrame()
+            print(df.groupby('ori')['resp.rt'].mean())
+        """
+        order, rows, cols = self._getTrialPositions()
+        extraNames, paramNames, dataNames = self._getWideHeader()
+        columns = collections.OrderedDict()
+        for name in extraNames:
+            columns[name] = _typedArray([self.extraInfo[name]]).repeat(len(order))
+        columns['TrialNumber'] = numpy.arange(1, len(order) + 1)
+        paramValues = [[] for name in paramNames]
+        for thisTrial in self.trialList:
+            for name, values in zip(paramNames, paramValues):
+                values.append(thisTrial.get(name) if thisTrial else None)
+        for name, values in zip(paramNames, paramValues):
+            columns[name] = _typedArray(values)[order]
+        for name in dataNames:
+            values = self.data[name][rows, cols]
+            if numpy.ma.isMaskedArray(values):
+                mask = numpy.ma.getmaskarray(values)
+                values = values.data
+            else:  # an object array, with '--' where there are no data
+                mask = numpy.array([isinstance(value, basestring) and
+                                    value == '--' for value in values],
+                                   dtype=bool)
+            if mask.any():
+                if values.dtype.kind in 'biuf':
+                    values = values.astype(float)
+                    values[mask] = numpy.nan
+                else:
+                    values = values.astype(object)
+                    values[mask] = None
+            columns[name] = values
+        return DataFrame(columns, columns=columns.keys())
 
     def addData(self, thisType, value, position=None):
         """Add data for the current trial
         """
         self.data.add(thisType, value, position=None)
+        if getattr(self, '_trialWriter', None) is not None:
+            self._streamData[thisType] = value
         if self.getExp()!=None:#update the experiment handler too
             self.getExp().addData(thisType, value)
 
@@ -1479,6 +1842,7 @@ class TrialHandler2(_BaseTrialHandler):
                     break #break out of the forever loop
                 #do stuff here for the trial
         """
+        self._streamTrial()
         #update pointer for next trials
         self.thisTrialN+=1#number of trial this pass
         self.thisN+=1 #number of trial in total
@@ -1633,6 +1997,17 @@ class TrialHandler2(_BaseTrialHandler):
         if self.getExp()!=None:#update the experiment handler too
             self.getExp().addData(thisType, value)
 
+    def _getStreamEntry(self):
+        """The row written by streamTrials() for the current trial"""
+        entry = collections.OrderedDict()
+        if self.extraInfo is not None:
+            entry.update(self.extraInfo)
+        for name in self.columns:
+            if name in self.thisTrial:
+                entry[name] = self.thisTrial[name]
+        entry.update(self.thisTrial)
+        return entry
+
 class TrialHandlerExt(TrialHandler):
     """ A class for handling trial sequences in a *non-counterbalanced design* (i.e. *oddball paradigms*). Its functions
     are a superset of the class TrialHandler, and as such, can also be used for normal trial handling.
@@ -1817,34 +2192,12 @@ class TrialHandlerExt(TrialHandler):
         specify sequential order; any order is possible this way.
         """
         # create indices for a single rep
-        indices = numpy.asarray(self._makeIndices(self.trialList), dtype=int)
-
-        if self.method == 'random':
-            sequenceIndices = []
-            seed=self.seed
-            for thisRep in range(self.nReps):
-                if self.trialWeights is None:
-                    thisRepSeq = shuffleArray(indices.flat, seed=seed).tolist()
-                else:
-                    thisRepSeq = shuffleArray(numpy.repeat(indices, self.trialWeights), seed=seed).tolist()
-                seed=None#so that we only seed the first pass through!
-                sequenceIndices.append(thisRepSeq)
-            sequenceIndices = numpy.transpose(sequenceIndices)
-        elif self.method == 'sequential':
-            if self.trialWeights is None:
-                sequenceIndices = numpy.repeat(indices,self.nReps,1)
-            else:
-                sequenceIndices = numpy.repeat(numpy.repeat(indices, self.trialWeights,0), self.nReps,1)
-        elif self.method == 'fullRandom':
-            if self.trialWeights is None:
-                # indices*nReps, flatten, shuffle, unflatten; only use seed once
-                sequential = numpy.repeat(indices, self.nReps,1) # = sequential
-                randomFlat = shuffleArray(sequential.flat, seed=self.seed)
-                sequenceIndices = numpy.reshape(randomFlat, (len(indices), self.nReps))
-            else:
-                sequential = numpy.repeat(numpy.repeat(indices, self.trialWeights,0), self.nReps,1)
-                randomFlat = shuffleArray(sequential.flat, seed = self.seed)
-                sequenceIndices = numpy.reshape(randomFlat, (sum(self.trialWeights), self.nReps))
+        indices = numpy.arange(len(self.trialList), dtype=numpy.int32)
+        if self.trialWeights is None:
+            sequenceIndices = _makeSequence(self.method, indices, self.nReps, self.seed)
+        else:
+            sequenceIndices = _makeSequence(self.method,
+                numpy.repeat(indices, self.trialWeights), self.nReps, self.seed)
 
         if self.autoLog:
             #Change
@@ -1872,6 +2225,7 @@ class TrialHandlerExt(TrialHandler):
                     break #break out of the forever loop
                 #do stuff here for the trial
         """
+        self._streamTrial()
         #update pointer for next trials
         self.thisTrialN+=1#number of trial this pass
         self.thisN+=1 #number of trial in total
@@ -1915,6 +2269,18 @@ class TrialHandlerExt(TrialHandler):
             logging.exp('New trial (rep=%i, index=%i): %s' %(self.thisRepN, self.thisTrialN, self.thisTrial), obj=self.thisTrial)
         return self.thisTrial
 
+    def _getTrialPositions(self):
+        """As TrialHandler._getTrialPositions() but with the data of each
+        condition taking up trialWeights rows of self.data
+        """
+        order, rows, repeats = TrialHandler._getTrialPositions(self)
+        if self.trialWeights is None:
+            return order, rows, repeats
+        weights = numpy.asarray(self.trialWeights, dtype=int)
+        firstRows = numpy.cumsum(weights) - weights
+        return (order, firstRows[order] + repeats % weights[order],
+                repeats // weights[order])
+
     def getCurrentTrialPosInDataHandler(self):
         #if there's no trial weights, then the current position is simply [trialIndex, nRepetition]
         if self.trialWeights is None:
@@ -1975,6 +2341,8 @@ class TrialHandlerExt(TrialHandler):
             self.data.add(thisType, value, position=None)
         else:
             self.data.add(thisType, value, position=self.getCurrentTrialPosInDataHandler())
+        if getattr(self, '_trialWriter', None) is not None:
+            self._streamData[thisType] = value
 
         #change this!
         if self.getExp()!=None:#update the experiment handler too
@@ -2143,86 +2511,7 @@ class TrialHandlerExt(TrialHandler):
             else:
                 f = codecs.open(fileName+'.txt', writeFormat, encoding="utf-8")
 
-        # collect parameter names related to the stimuli:
-        if self.trialList[0]:
-            header = self.trialList[0].keys()
-        else:
-            header = []
-        # and then add parameter names related to data (e.g. RT)
-        header.extend(self.data.dataTypes)
-
-        # loop through each trial, gathering the actual values:
-        dataOut = []
-        trialCount = 0
-        # total number of trials = number of trialtypes * number of repetitions:
-
-        repsPerType={}
-        for rep in range(self.nReps):
-            if self.trialWeights is None:
-                nRows = len(self.trialList)
-            else:
-                nRows = sum(self.trialWeights)
-
-            for trialN in range(nRows):
-                #find out what trial type was on this trial
-                trialTypeIndex = self.sequenceIndices[trialN, rep]
-                #determine which repeat it is for this trial
-                if trialTypeIndex not in repsPerType.keys():
-                    repsPerType[trialTypeIndex]=0
-                else:
-                    repsPerType[trialTypeIndex]+=1
-                repThisType=repsPerType[trialTypeIndex]#what repeat are we on for this trial type?
-
-                # create a dictionary representing each trial:
-                # this is wide format, so we want fixed information (e.g. subject ID, date, etc) repeated every line if it exists:
-                if (self.extraInfo != None):
-                    nextEntry = self.extraInfo.copy()
-                else:
-                    nextEntry = {}
-
-                # add a trial number so the original order of the data can always be recovered if sorted during analysis:
-                trialCount += 1
-                nextEntry["TrialNumber"] = trialCount
-
-                # now collect the value from each trial of the variables named in the header:
-                for parameterName in header:
-                    # the header includes both trial and data variables, so need to check before accessing:
-                    if self.trialList[trialTypeIndex] and parameterName in self.trialList[trialTypeIndex]:
-                        nextEntry[parameterName] = self.trialList[trialTypeIndex][parameterName]
-                    elif parameterName in self.data:
-                        if self.trialWeights is None:
-                            nextEntry[parameterName] = self.data[parameterName][trialTypeIndex][repThisType]
-                        else:
-                            firstRowIndex=sum(self.trialWeights[:trialTypeIndex])
-                            dataRow = firstRowIndex + repThisType%self.trialWeights[trialTypeIndex]
-                            dataCol = int(repThisType/self.trialWeights[trialTypeIndex])
-                            nextEntry[parameterName] = self.data[parameterName][dataRow][dataCol]
-                    else: # allow a null value if this parameter wasn't explicitly stored on this trial:
-                        nextEntry[parameterName] = ''
-
-                #store this trial's data
-                dataOut.append(nextEntry)
-
-        # get the extra 'wide' parameter names into the header line:
-        header.insert(0,"TrialNumber")
-        if (self.extraInfo != None):
-            for key in self.extraInfo:
-                header.insert(0, key)
-
-        if not matrixOnly:
-        # write the header row:
-            nextLine = ''
-            for parameterName in header:
-                nextLine = nextLine + parameterName + delim
-            f.write(nextLine[:-1] + '\n') # remove the final orphaned tab character
-
-        # write the data matrix:
-        for trial in dataOut:
-            nextLine = ''
-            for parameterName in header:
-                nextLine = nextLine + unicode(trial[parameterName]) + delim
-            nextLine = nextLine[:-1] # remove the final orphaned tab character
-            f.write(nextLine + '\n')
+        self._writeWideText(f, delim, matrixOnly)
 
         if f != sys.stdout:
             f.close()
@@ -2277,6 +2566,178 @@ def indicesFromString(indsString):
     except:
         pass
 
+def _assertValidVarNames(fieldNames, fileName):
+    """screens a list of names as candidate variable names. if all names are
+    OK, return silently; else raise ImportError with msg
+    """
+    if not all(fieldNames):
+        raise ImportError('Conditions file %s: Missing parameter name(s); empty cell(s) in the first row?' % fileName)
+    for name in fieldNames:
+        OK, msg = isValidVariableName(name)
+        if not OK: #tailor message to importConditions
+            msg = msg.replace('Variables', 'Parameters (column headers)')
+            raise ImportError('Conditions file %s: %s%s"%s"' %(fileName, msg, os.linesep*2, name))
+
+# bump when the parsing of conditions files or the cached layout changes
+CONDITIONS_CACHE_VERSION = 1
+useConditionsCache = True
+conditionsCacheDir = None
+
+def _getConditionsCachePath(fileName, ext='.pkl'):
+    """Returns the path of the file in which the parsed conditions of a csv
+    or xlsx file are cached (in conditionsCacheDir, or by default in
+    'conditions_v<CONDITIONS_CACHE_VERSION>' in the user prefs directory)
+    """
+    cacheDir = conditionsCacheDir
+    if cacheDir is None:
+        cacheDir = os.path.join(prefs.paths['userPrefsDir'],
+                                'conditions_v%i' % CONDITIONS_CACHE_VERSION)
+    path = os.path.abspath(fileName)
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return os.path.join(cacheDir, hashlib.sha1(path).hexdigest() + ext)
+
+def _getConditionsCacheKey(fileName):
+    """A cached file is only used while its path, modification time and size
+    are those of the key it was saved with"""
+    stat = os.stat(fileName)
+    return (os.path.abspath(fileName), stat.st_mtime, stat.st_size)
+
+def _loadCachedConditions(fileName):
+    """Returns the (fieldNames, columns) of a conditions file from the cache,
+    or None if it hasn't been cached since the file last changed
+    """
+    try:
+        cachePath = _getConditionsCachePath(fileName)
+        if not os.path.isfile(cachePath):
+            return None
+        with open(cachePath, 'rb') as f:
+            key, fieldNames, columns = cPickle.load(f)
+        if key != _getConditionsCacheKey(fileName):
+            return None
+    except Exception as e:
+        logging.warning("Couldn't load cached conditions for %s: %s" % (fileName, e))
+        return None
+    return fieldNames, columns
+
+def _saveCachedConditions(fileName, fieldNames, columns):
+    """Saves the parsed fieldNames and columns (numpy arrays) of a conditions
+    file to the cache, as a binary pickle
+    """
+    try:
+        cachePath = _getConditionsCachePath(fileName)
+        if not os.path.isdir(os.path.dirname(cachePath)):
+            os.makedirs(os.path.dirname(cachePath))
+        tmpPath = '%s.%i.tmp' % (cachePath, os.getpid())
+        with open(tmpPath, 'wb') as f:
+            cPickle.dump((_getConditionsCacheKey(fileName), fieldNames, columns),
+                         f, cPickle.HIGHEST_PROTOCOL)
+        if os.path.exists(cachePath):
+            os.remove(cachePath)  # os.rename can't replace files on Windows
+        os.rename(tmpPath, cachePath)
+    except Exception as e:
+        logging.warning("Couldn't cache conditions for %s: %s" % (fileName, e))
+
+def _readCsvRows(fileName, chunkSize, outFileName=None):
+    """Reads a csv file of conditions `chunkSize` rows at a time into a numpy
+    structured array (saved as a .npy file, and memory mapped, if given
+    `outFileName`). A first pass over the file finds the type of each column
+    (bool, int, float or, for anything else, utf-8 text) and the width of
+    the text, and a second pass fills in the array.
+    """
+    nRows = 0
+    kinds = collections.OrderedDict()
+    widths = {}
+    with open(fileName, 'rU') as fileUniv:
+        for chunk in read_csv(fileUniv, encoding='utf-8', chunksize=chunkSize):
+            nRows += len(chunk)
+            for name in chunk.columns:
+                kind = chunk[name].dtype.kind
+                if kind == 'O':
+                    widths[name] = max(widths.get(name, 1),
+                                       chunk[name].str.encode('utf-8').str.len().max())
+                elif kind in _kindOrder:
+                    widths[name] = max(widths.get(name, 1),
+                                       _numbersAsText(chunk[name]).str.len().max())
+                else:  # e.g. dates
+                    kind = 'O'
+                if name in kinds:
+                    kind = max(kind, kinds[name], key=_kindOrder.index)
+                kinds[name] = kind
+    fieldNames = [str(name) for name in kinds]
+    _assertValidVarNames(fieldNames, fileName)
+    dtype = []
+    for name, kind in kinds.items():
+        if kind == 'O':
+            dtype.append((str(name), 'S%i' % widths[name]))
+        else:
+            dtype.append((str(name), _kindTypes[kind]))
+    if outFileName:
+        rows = numpy.lib.format.open_memmap(outFileName, mode='w+',
+                                            dtype=dtype, shape=(nRows,))
+    else:
+        rows = numpy.empty(nRows, dtype=dtype)
+    start = 0
+    with open(fileName, 'rU') as fileUniv:
+        for chunk in read_csv(fileUniv, encoding='utf-8', chunksize=chunkSize):
+            stop = start + len(chunk)
+            for name, kind in kinds.items():
+                column = chunk[name]
+                if kind != 'O':
+                    rows[str(name)][start:stop] = column.values
+                elif column.dtype.kind == 'O':
+                    rows[str(name)][start:stop] = column.str.encode('utf-8').fillna('').values
+                else:
+                    rows[str(name)][start:stop] = _numbersAsText(column).values
+            start = stop
+    if outFileName:
+        rows.flush()
+    return rows
+
+def _numbersAsText(column):
+    """The cells of a numeric chunk of a text column as text, with missing
+    (NaN) cells empty. pandas reads a chunk in which every cell of a text
+    column is empty as a column of NaN"""
+    return column.astype(object).where(column.notnull(), '').astype(str)
+
+def _parseListCells(column, brackets):
+    """Returns a column of conditions (an array of objects) in which strings
+    that look like a list (or tuple, if '()' is one of the `brackets`) are
+    converted to one. Such strings are found, and parsed, for the whole column
+    at once. They are parsed as python literals (not evaluated), so those that
+    aren't literals (e.g. '(see below)') are left as strings.
+    """
+    cells = Series(column, dtype=object)
+    try:
+        text = cells.str
+    except AttributeError:  # no strings in this column
+        return column
+    looksLikeList = numpy.zeros(len(column), dtype=bool)
+    for opening, closing in brackets:
+        looksLikeList |= (
+            text.startswith(opening).fillna(False).values.astype(bool) &
+            text.endswith(closing).fillna(False).values.astype(bool))
+    if not looksLikeList.any():
+        return column
+    column = column.copy()
+    indices = numpy.flatnonzero(looksLikeList)
+    #parse them all as one list, unless one of them isn't a single literal
+    try:
+        values = ast.literal_eval(u'[%s\n]' % u',\n'.join(column[indices]))
+    except (ValueError, SyntaxError, UnicodeError):
+        values = None
+    if values is not None and len(values) == len(indices):
+        for n, value in zip(indices, values):
+            column[n] = value
+        return column
+    for n in indices:
+        try:
+            column[n] = ast.literal_eval(column[n])
+        except (ValueError, SyntaxError):
+            logging.warning("Conditions value %r looks like a list but isn't "
+                            "one, so it was kept as text" % column[n])
+    return column
+
 def importConditions(fileName, returnFieldNames=False, selection=""):
     """Imports a list of conditions from an .xlsx, .csv, or .pkl file
 
@@ -2297,6 +2758,11 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         - begin with a letter (upper or lower case)
         - contain no spaces or other punctuation (underscores are permitted)
 
+    Values that look like a list, e.g. [1, 2] (or in .xlsx files a tuple),
+    are converted to one. The parsed conditions of .csv and .xlsx files are
+    cached on disk until the file changes, so a large file is only parsed the
+    first time it's imported (set `data.useConditionsCache = False` to always
+    parse the file, or `data.conditionsCacheDir` to put the cache elsewhere).
 
     `selection` is used to select a subset of condition indices to be used
     It can be a list/array of indices, a python `slice` object or a string to
@@ -2310,18 +2776,6 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
         - random(5)*8 #5 random vals 0-8
 
     """
-    def _assertValidVarNames(fieldNames, fileName):
-        """screens a list of names as candidate variable names. if all names are
-        OK, return silently; else raise ImportError with msg
-        """
-        if not all(fieldNames):
-            raise ImportError('Conditions file %s: Missing parameter name(s); empty cell(s) in the first row?' % fileName)
-        for name in fieldNames:
-            OK, msg = isValidVariableName(name)
-            if not OK: #tailor message to importConditions
-                msg = msg.replace('Variables', 'Parameters (column headers)')
-                raise ImportError('Conditions file %s: %s%s"%s"' %(fileName, msg, os.linesep*2, name))
-
     if fileName in ['None','none',None]:
         if returnFieldNames:
             return [], []
@@ -2329,29 +2783,7 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
     if not os.path.isfile(fileName):
         raise ImportError('Conditions file not found: %s' %os.path.abspath(fileName))
 
-    if fileName.endswith('.csv'):
-        with open(fileName, 'rU') as fileUniv:
-            trialsArr = read_csv(fileUniv, encoding='utf-8')  # use pandas reader, which can handle commas in fields, etc
-        trialsArr = trialsArr.to_records(index=False) # convert the resulting dataframe to a numpy recarry
-        if trialsArr.shape == ():  # convert 0-D to 1-D with one element:
-            trialsArr = trialsArr[numpy.newaxis]
-        fieldNames = trialsArr.dtype.names
-        _assertValidVarNames(fieldNames, fileName)
-        #convert the record array into a list of dicts
-        trialList = []
-        for trialN, trialType in enumerate(trialsArr):
-            thisTrial ={}
-            for fieldN, fieldName in enumerate(fieldNames):
-                val = trialsArr[trialN][fieldN]
-                if type(val)==numpy.string_:
-                    val = unicode(val.decode('utf-8'))
-                    #if it looks like a list, convert it:
-                    if val.startswith('[') and val.endswith(']'):
-                        #exec('val=%s' %unicode(val.decode('utf8')))
-                        val = eval(val)
-                thisTrial[fieldName] = val
-            trialList.append(thisTrial)
-    elif fileName.endswith('.pkl'):
+    if fileName.endswith('.pkl'):
         f = open(fileName, 'rU') # is U needed?
         try:
             trialsArr = cPickle.load(f)
@@ -2367,37 +2799,48 @@ def importConditions(fileName, returnFieldNames=False, selection=""):
                 thisTrial[fieldName] = row[fieldN] # type is correct, being .pkl
             trialList.append(thisTrial)
     else:
-        if not haveOpenpyxl:
-            raise ImportError('openpyxl is required for loading excel format files, but it was not found.')
-        try:
-            wb = load_workbook(filename=fileName)
-        except: # InvalidFileException(unicode(e)): # this fails
-            raise ImportError('Could not open %s as conditions' % fileName)
-        ws = wb.worksheets[0]
-        nCols = ws.get_highest_column()
-        nRows = ws.get_highest_row()
-
-        #get parameter names from the first row header
-        fieldNames = []
-        for colN in range(nCols):
-            fieldName = ws.cell(_getExcelCellName(col=colN, row=0)).value
-            fieldNames.append(fieldName)
-        _assertValidVarNames(fieldNames, fileName)
-
-        #loop trialTypes
-        trialList = []
-        for rowN in range(1, nRows):#skip header first row
-            thisTrial={}
-            for colN in range(nCols):
-                val = ws.cell(_getExcelCellName(col=colN, row=rowN)).value
-                #if it looks like a list, convert it
-                if type(val) in [unicode, str] and (
-                        val.startswith('[') and val.endswith(']') or
-                        val.startswith('(') and val.endswith(')') ):
-                    val = eval(val)
-                fieldName = fieldNames[colN]
-                thisTrial[fieldName] = val
-            trialList.append(thisTrial)
+        #csv and xlsx files are parsed into columns, which are cached
+        cached = None
+        if useConditionsCache:
+            cached = _loadCachedConditions(fileName)
+        if cached is not None:
+            fieldNames, columns = cached
+        elif fileName.endswith('.csv'):
+            with open(fileName, 'rU') as fileUniv:
+                trialsArr = read_csv(fileUniv, encoding='utf-8')  # use pandas reader, which can handle commas in fields, etc
+            trialsArr = trialsArr.to_records(index=False) # convert the resulting dataframe to a numpy recarry
+            if trialsArr.shape == ():  # convert 0-D to 1-D with one element:
+                trialsArr = trialsArr[numpy.newaxis]
+            fieldNames = trialsArr.dtype.names
+            _assertValidVarNames(fieldNames, fileName)
+            columns = []
+            for fieldName in fieldNames:
+                column = trialsArr[fieldName]
+                if column.dtype.kind == 'O':
+                    #if it looks like a list, convert it
+                    column = _parseListCells(column, brackets=['[]'])
+                columns.append(column)
+        else:
+            if not haveOpenpyxl:
+                raise ImportError('openpyxl is required for loading excel format files, but it was not found.')
+            try:
+                wb = load_workbook(filename=fileName)
+            except: # InvalidFileException(unicode(e)): # this fails
+                raise ImportError('Could not open %s as conditions' % fileName)
+            ws = wb.worksheets[0]
+            rows = [[cell.value for cell in row] for row in ws.rows]
+            #get parameter names from the first row header
+            fieldNames = rows[0] if rows else []
+            _assertValidVarNames(fieldNames, fileName)
+            columns = []
+            for colN in range(len(fieldNames)):
+                column = numpy.empty(len(rows)-1, dtype=object)
+                column[:] = [row[colN] for row in rows[1:]]
+                #if it looks like a list or tuple, convert it
+                columns.append(_parseListCells(column, brackets=['[]', '()']))
+        if useConditionsCache and cached is None:
+            _saveCachedConditions(fileName, fieldNames, columns)
+        trialList = [dict(zip(fieldNames, row)) for row in zip(*columns)]
     #if we have a selection then try to parse it
     if isinstance(selection, basestring) and len(selection)>0:
         selection = indicesFromString(selection)
@@ -3949,9 +4392,13 @@ class DataHandler(dict):
     by users directly)
 
     Numeric data are stored as numpy masked arrays where the mask is set True for missing entries.
-    When any non-numeric data (string, list or array) get inserted using DataHandler.add(val) the array
-    is converted to a standard (not masked) numpy array with dtype='O' and where missing entries have
-    value="--"
+    Each array takes the type of the values added to it (bool, int or float), changing to a wider type
+    only when a value needs one (e.g. a float added to ints). When any non-numeric data (string, list
+    or array) get inserted using DataHandler.add(val) the array is converted to a standard (not masked)
+    numpy array with dtype='O' and where missing entries have value="--"
+
+    Arrays are views of buffers that double in size when data are added beyond their current shape,
+    so that growing them is cheap. getMemoryUsage() reports the bytes used by each data type.
 
     Attributes:
         - ['key']=data arrays containing values for that key
@@ -3964,9 +4411,13 @@ class DataHandler(dict):
         self.trials=trials
         self.dataTypes=[]#names will be added during addDataType
         self.isNumeric={}
+        self._buffers={}#name: (data, mask, view) where view is self[name]
         #if given dataShape use it - otherwise guess!
         if dataShape:
             self.dataShape=dataShape
+        elif self.trials and isinstance(trials.trialList, ConditionsSource):
+            self.dataShape=[len(trials.trialList)]
+            self.dataShape.append(trials.nReps)
         elif self.trials:
             self.dataShape=list(numpy.asarray(trials.trialList,'O').shape)
             self.dataShape.append(trials.nReps)
@@ -3976,11 +4427,17 @@ class DataHandler(dict):
             for thisType in dataTypes:
                 self.addDataType(thisType)
 
+    def __getstate__(self):
+        #the arrays themselves are pickled as the items of the dict
+        state = self.__dict__.copy()
+        state.pop('_buffers', None)
+        return state
+
     def addDataType(self, names, shape=None):
         """Add a new key to the data dictionary of
         particular shape if specified (otherwise the
         shape of the trial matrix in the trial handler.
-        Data are initialised to be zero everywhere.
+        Data are initialised to be missing (masked) everywhere.
         Not needed by user: appropriate types will be added
         during initialisation and as each xtra type is needed.
         """
@@ -3992,14 +4449,53 @@ class DataHandler(dict):
                 self.addDataType(thisName)
         else:
             #create the appropriate array in the dict
-            #initially use numpy masked array of floats with mask=True for missing vals
+            #initially use numpy masked array of bools (the smallest type,
+            #changed by the first value) with mask=True for missing vals
             #convert to a numpy array with dtype='O' if non-numeric data given
             #NB don't use masked array with dytpe='O' together -they don't unpickle
-            self[names]=numpy.ma.zeros(shape,'f')#masked array of floats
-            self[names].mask=True
+            self._setBuffers(names, numpy.zeros(shape, bool),
+                             numpy.ones(shape, bool), shape)
             #add the name to the list
             self.dataTypes.append(names)
             self.isNumeric[names]=True#until we need otherwise
+
+    def _setBuffers(self, thisType, data, mask, shape):
+        """Store the buffers of a data type (mask is None for objects) and
+        make self[thisType] a view of their first `shape` entries"""
+        index = tuple(slice(0, n) for n in shape)
+        if mask is None:
+            view = data[index]
+        else:
+            view = numpy.ma.MaskedArray(data[index], mask=mask[index],
+                                        copy=False)
+        dict.__setitem__(self, thisType, view)
+        if getattr(self, '_buffers', None) is None:
+            self._buffers = {}
+        self._buffers[thisType] = (data, mask, view)
+
+    def _getBuffers(self, thisType):
+        """Returns the (data, mask) buffers of a data type, making them from
+        its array if needed (after unpickling, or if it was replaced)"""
+        buffers = getattr(self, '_buffers', None) or {}
+        current = dict.__getitem__(self, thisType)
+        if thisType in buffers and buffers[thisType][2] is current:
+            data, mask = buffers[thisType][:2]
+            #writing to a masked array can give it its own copy of the mask,
+            #after which the buffer's mask no longer shows through
+            if mask is None or numpy.may_share_memory(
+                    numpy.ma.getmask(current), mask):
+                return data, mask
+        if numpy.ma.isMaskedArray(current):
+            data, mask = current.data, numpy.ma.getmaskarray(current)
+        else:
+            data = numpy.asarray(current)
+            if data.dtype.kind == 'O':
+                mask = None
+            else:
+                mask = numpy.zeros(data.shape, bool)
+        self._setBuffers(thisType, data, mask, data.shape)
+        return data, mask
+
     def add(self, thisType, value, position=None):
         """Add data to an existing data type
         (and add a new one if necess)
@@ -4007,37 +4503,93 @@ class DataHandler(dict):
         if not thisType in self:
             self.addDataType(thisType)
         if position is None:
-            #'ran' is always the first thing to update
-            if thisType=='ran':
-                repN = sum(self['ran'][self.trials.thisIndex])
-            else:
-                repN = sum(self['ran'][self.trials.thisIndex])-1#because it has already been updated
+            #'ran' is always the first thing to update (and is never masked,
+            #so its buffer gives the count without the cost of a masked array)
+            repN = int(self._getBuffers('ran')[0][self.trials.thisIndex].sum())
+            if thisType!='ran':
+                repN -= 1#because it has already been updated
             #make a list where 1st digit is trial number
             position= [self.trials.thisIndex]
             position.append(repN)
+        position = tuple(int(n) for n in position)
 
         #check whether data falls within bounds
-        posArr = numpy.asarray(position)
-        shapeArr = numpy.asarray(self.dataShape)
-        if not numpy.alltrue(posArr<shapeArr):
-            #array isn't big enough
-            logging.warning('need a bigger array for:'+thisType)
-            self[thisType]=extendArr(self[thisType],posArr)#not implemented yet!
-        #check for ndarrays with more than one value and for non-numeric data
-        if self.isNumeric[thisType] and \
-            ((type(value)==numpy.ndarray and len(value)>1) or (type(value) not in [float, int])):
-                self._convertToObjectArray(thisType)
+        if not numpy.alltrue(numpy.less(position, self[thisType].shape)):
+            self._extend(thisType, position)
+        #check for ndarrays and for non-numeric data
+        kind = _valueKind(value)
+        if self.isNumeric[thisType] and kind=='O':
+            self._convertToObjectArray(thisType)
+        elif self.isNumeric[thisType]:
+            self._promote(thisType, kind)
         #insert the value
-        self[thisType][position[0],position[1]]=value
+        data, mask = self._getBuffers(thisType)
+        data[position]=value
+        if mask is not None:
+            mask[position]=False
+
+    def _extend(self, thisType, position):
+        """Make room for data at `position`, doubling the buffers along any
+        dimension that is full"""
+        shape = tuple(max(n, pos+1) for n, pos in
+                      zip(self[thisType].shape, position))
+        data, mask = self._getBuffers(thisType)
+        if any(numpy.greater(shape, data.shape)):
+            size = tuple(max(n, 2*oldN) if n > oldN else oldN
+                         for n, oldN in zip(shape, data.shape))
+            index = tuple(slice(0, n) for n in data.shape)
+            if mask is None:
+                newData = numpy.empty(size, 'O')
+                newData.fill('--')
+            else:
+                newData = numpy.zeros(size, data.dtype)
+                newMask = numpy.ones(size, bool)
+                newMask[index] = mask
+                mask = newMask
+            newData[index] = data
+            data = newData
+        self._setBuffers(thisType, data, mask, shape)
+
+    def _promote(self, thisType, kind):
+        """Change a numeric data type to a wider type if it can't store a
+        value of this kind ('b', 'i' or 'f')"""
+        data, mask = self._getBuffers(thisType)
+        current = _valueKind(data.dtype.type(0))#the kind of the array
+        if _kindOrder.index(kind) <= _kindOrder.index(current):
+            return
+        self._setBuffers(thisType, data.astype(_kindTypes[kind]), mask,
+                         self[thisType].shape)
+
     def _convertToObjectArray(self, thisType):
         """Convert this datatype from masked numeric array to unmasked object array
         """
-        dat = self[thisType]
-        self[thisType] = numpy.array(dat.data, dtype='O')#create an array of Object type
+        data, mask = self._getBuffers(thisType)
+        dat = data.astype('O')#numbers keep their values, as python objects
         #masked vals should be "--", others keep data
-        self[thisType] = numpy.where(dat.mask, '--',dat).astype('O')#we have to repeat forcing to 'O' or text gets truncated to 4chars
+        dat[mask] = '--'
+        self._setBuffers(thisType, dat, None, self[thisType].shape)
         self.isNumeric[thisType]=False
 
+    def getMemoryUsage(self):
+        """Returns a dict with the number of bytes used by each data type,
+        including the room left for it to grow and (approximately) the
+        values stored as objects
+        """
+        usage = {}
+        for thisType in self:
+            data, mask = self._getBuffers(thisType)
+            nBytes = data.nbytes
+            if mask is None:
+                #values are often the same object (e.g. a key name) so
+                #count each object once
+                values = dict((id(value), value) for value in data.flat)
+                nBytes += sum(sys.getsizeof(value)
+                              for value in values.values())
+            else:
+                nBytes += mask.nbytes
+            usage[thisType] = nBytes
+        return usage
+
 class FitFunction:
     """Deprecated: - use the specific functions; FitWeibull, FitLogistic...
     """
@@ -4408,3 +4960,93 @@ def _getExcelCellName(col, row):
     'C2'
     """
     return "%s%i" %(get_column_letter(col+1), row+1)#BEWARE - openpyxl uses indexing at 1, to fit with Excel
+
+_kindOrder = 'bifO'  # from the narrowest type to the widest
+_kindTypes = {'b': bool, 'i': int, 'f': numpy.float64}
+
+def _valueKind(value):
+    """Returns 'b', 'i' or 'f' for a bool, int or float (python or numpy)
+    that fits a numpy array of that kind, otherwise 'O'"""
+    if isinstance(value, (bool, numpy.bool_)):
+        return 'b'
+    if isinstance(value, numpy.integer) or (isinstance(value, (int, long))
+                                           and -2**63 <= value < 2**63):
+        return 'i'
+    if isinstance(value, (float, numpy.floating)):
+        return 'f'
+    return 'O'
+
+def _typedArray(values):
+    """Returns a list of values as a numpy array of bools, ints or floats if
+    they are all such numbers, or else as an array of objects (in which lists
+    etc. stay intact)
+
+    >>> _typedArray([1, 2.5]).dtype
+    dtype('float64')
+    """
+    kinds = set(_valueKind(value) for value in values)
+    if kinds == set('b'):
+        return numpy.array(values, dtype=bool)
+    if kinds == set('i'):
+        return numpy.array(values, dtype=int)
+    if kinds and kinds <= set('if'):
+        return numpy.array(values, dtype=float)
+    arr = numpy.empty(len(values), dtype=object)
+    for n, value in enumerate(values):
+        arr[n] = value
+    return arr
+
+def _getOutputCells(values):
+    """Returns the cells of saveAsText() and saveAsExcel() for the (raw or
+    analysed) data of one condition, formatted straight from the values: a
+    single value as text and each value of a row of raw data as it looks in a
+    printed list (after the first with a leading space, and empty where no
+    data were stored) or, for lists (e.g. of several keys), as the list
+    """
+    if hasattr(values, 'tolist'):  # a numpy array or scalar
+        values = values.tolist()
+    if values in [None, 'None']:
+        return [u'']
+    if not isinstance(values, list):
+        return [unicode(values)]
+    if not values:
+        return [u'']
+    if (isinstance(values[0], (list, tuple)) and
+            isinstance(values[-1], (list, tuple))):
+        return [u'' if value is None else unicode(value) for value in values]
+    cells = [u'' if value is None else unicode(repr(value))
+             for value in values]
+    return cells[:1] + [u' ' + cell for cell in cells[1:]]
+
+def _makeSequence(method, indices, nReps, seed=None):
+    """Returns the sequence of condition indices, [trialN][repN], of the
+    'random', 'sequential' or 'fullRandom' method, given the `indices` of one
+    repetition (e.g. with conditions repeated by their weights).
+
+    The sequence is an array of int32, and is shuffled with numpy's random
+    numbers (seeded with `seed`, if given) a block of repetitions at a time,
+    sorting the same random numbers as shuffleArray() did for each
+    repetition, so the sequence for any seed is as it always was.
+    """
+    indices = numpy.asarray(indices, dtype=numpy.int32)
+    nTrials = len(indices)
+    if method == 'sequential':
+        return numpy.repeat(indices[:, numpy.newaxis], nReps, 1)
+    elif method == 'random':
+        if seed is not None and nReps > 0:
+            numpy.random.seed(seed)  # only seeding the first repetition
+        sequence = numpy.empty((nReps, nTrials), dtype=numpy.int32)
+        blockSize = max(1, 2**20 // max(1, nTrials))  # reps per block
+        for start in range(0, nReps, blockSize):
+            stop = min(start + blockSize, nReps)
+            rnd = numpy.random.random((stop - start, nTrials))
+            sequence[start:stop] = indices[numpy.argsort(rnd, axis=-1)]
+        return sequence.T
+    elif method == 'fullRandom':
+        #shuffle all the trials, of all repetitions, as one (flattened)
+        #array of the sequential trials: trial n of that is indices[n//nReps]
+        if seed is not None:
+            numpy.random.seed(seed)
+        order = numpy.argsort(numpy.random.random(nTrials * nReps))
+        order //= max(1, nReps)
+        return indices[order].reshape(nTrials, nReps)
@@ -23,6 +23,8 @@ except:
     havePygame = False
 try:
     import pyglet
+    from psychopy.platform_specific import setPygletOptions
+    setPygletOptions()
     havePyglet = True
 except:
     havePyglet = False
@@ -37,6 +39,7 @@ from psychopy.constants import NOT_STARTED
 
 if havePyglet:
     from pyglet.window.mouse import LEFT, MIDDLE, RIGHT  # takes ~250ms, so do it now
+    import pyglet.app
     global _keyBuffer
     _keyBuffer = []
     global mouseButtons
@@ -55,6 +58,15 @@ if havePyglet:
 
 useText = False # By default _onPygletText is not used
 
+def _getPygletWindows():
+    """The pyglet windows whose events need dispatching. Offscreen windows
+    aren't pyglet windows (and have no events) so with only those, or with no
+    display at all, there is nothing to ask the display for
+    """
+    if not pyglet.app.windows:
+        return []
+    return pyglet.window.get_platform().get_default_display().get_windows()
+
 def _onPygletText(text, emulated=False):
     """handler for on_text pyglet events, or call directly to emulate a text
     event.
@@ -222,7 +234,7 @@ def getKeys(keyList=None, timeStamped=False):
             keys.append( (pygame.key.name(evts.key),0) )#pygame has no keytimes
     elif havePyglet:
         #for each (pyglet) window, dispatch its events before checking event buffer
-        wins = pyglet.window.get_platform().get_default_display().get_windows()
+        wins = _getPygletWindows()
         for win in wins:
             try:
                 win.dispatch_events()#pump events on pyglet windows
@@ -292,7 +304,7 @@ def waitKeys(maxWait=float('inf'), keyList=None, timeStamped=False):
     while key is None and timer.getTime() < maxWait:
         # Pump events on pyglet windows if they exist
         if havePyglet:
-            wins = pyglet.window.get_platform().get_default_display().get_windows()
+            wins = _getPygletWindows()
             for win in wins: win.dispatch_events()
 
         # Get keypresses and return if anything is pressed
@@ -540,7 +552,7 @@ class Mouse:
         if usePygame: return mouse.get_pressed()
         else:  #False: #havePyglet: # like in getKeys - pump the events
             #for each (pyglet) window, dispatch its events before checking event buffer
-            wins = pyglet.window.get_platform().get_default_display().get_windows()
+            wins = _getPygletWindows()
             for win in wins: win.dispatch_events()#pump events on pyglet windows
 
             #else:
@@ -617,7 +629,7 @@ def clearEvents(eventType=None):
     #pyglet
     if not havePygame or not display.get_init():
         #for each (pyglet) window, dispatch its events before checking event buffer
-        wins = pyglet.window.get_platform().get_default_display().get_windows()
+        wins = _getPygletWindows()
         for win in wins:
             win.dispatch_events()#pump events on pyglet windows
         if eventType=='mouse':
@@ -27,11 +27,16 @@ messages, (which PsychoPy doesn't use) using the commands::
 #Much of the code below is based conceptually, if not syntactically, on the
 #python logging module but it's simpler (no threading) and maintaining a stack
 #of log entries for later writing (don't want files written while drawing)
+#Optionally (see _Logger.startAsync) the writing can be handed to a background
+#thread so that flush() never blocks the experiment thread on disk access
 
 from __future__ import absolute_import
 
 from os import path
 import sys, codecs
+import threading, atexit, weakref
+from collections import deque
+import numpy
 from psychopy import clock
 
 _packagePath = path.split(__file__)[0]
@@ -176,6 +181,262 @@ class LogFile:
             stream.flush()
         except:
             pass
+class _LogWriterThread(threading.Thread):
+    """Background thread that takes queued entries from a :class:`_Logger`,
+    formats them and writes them in batches to each of its targets.
+
+    Created by :meth:`_Logger.startAsync`; not intended to be used directly.
+    """
+    def __init__(self, logger, interval=0.1):
+        threading.Thread.__init__(self, None, 'LogWriter', None)
+        self.daemon = True
+        self.logger = logger
+        self.interval = interval
+        self.stopflag = False
+    def run(self):
+        logger = self.logger
+        cond = logger._queueCond
+        while True:
+            cond.acquire()
+            try:
+                if not logger._queue and not self.stopflag:
+                    cond.wait(self.interval)
+                entries = list(logger._queue)
+                logger._queue.clear()
+                stopping = self.stopflag
+                cond.notifyAll()  # wake any log() calls blocked on a full queue
+            finally:
+                cond.release()
+            if entries:
+                logger._writeBatch(entries)
+            if stopping:
+                #no new entries can arrive once stopflag is set (see stopAsync)
+                break
+
+class _LogHistory(object):
+    """Compact store of the entries that a :class:`_Logger` has flushed.
+
+    Rather than keeping each :class:`_LogEntry` alive, the time, level,
+    message and object of each entry are kept in arrays, with each distinct
+    message stored once and objects held by weak reference (where possible).
+
+    retention determines what is kept:
+
+        - 'all': every entry (arrays grow by doubling)
+        - 'none': nothing
+        - 'last': only the most recent `maxEntries` entries
+        - 'spill': the most recent `maxEntries` in memory, with older entries
+          appended to `spillFile` (and messages to `spillFile` + '.msgs')
+    """
+    _spillDtype = numpy.dtype([('t', 'f8'), ('level', 'i2'),
+                               ('msgStart', 'i8'), ('msgLen', 'i4')])
+    def __init__(self, retention='last', maxEntries=100000, spillFile=None):
+        if retention not in ['all', 'none', 'last', 'spill']:
+            raise ValueError("retention should be 'all', 'none', 'last' or "
+                             "'spill', not %r" % retention)
+        if retention == 'spill' and spillFile is None:
+            raise ValueError("retention='spill' needs a spillFile")
+        self.retention = retention
+        self.maxEntries = int(maxEntries)
+        self._lock = threading.Lock()
+        if retention == 'all':
+            cap = 1024
+        else:
+            cap = max(self.maxEntries, 1)
+        self._cap = cap
+        self._start = 0
+        self._n = 0
+        self._t = numpy.zeros(cap, 'f8')
+        self._level = numpy.zeros(cap, 'i2')
+        self._msgId = numpy.zeros(cap, 'i4')
+        self._objId = numpy.zeros(cap, 'i4')
+        self._msgIds = {}
+        self._msgs = []
+        self._objIds = {}
+        self._objs = []
+        self.spillFile = spillFile
+        self.nSpilled = 0
+        if retention == 'spill':
+            self._spillRecords = open(spillFile, 'wb')
+            self._spillMsgs = open(spillFile + '.msgs', 'wb')
+            self._spillMsgPos = 0
+    def __len__(self):
+        return self._n + self.nSpilled
+    def _internMessage(self, message):
+        try:
+            return self._msgIds[message]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable, so store its text
+            message = unicode(message)
+            if message in self._msgIds:
+                return self._msgIds[message]
+        msgId = len(self._msgs)
+        self._msgIds[message] = msgId
+        self._msgs.append(message)
+        return msgId
+    def _internObject(self, obj):
+        if obj is None:
+            return -1
+        objId = self._objIds.get(id(obj))
+        if objId is not None and self._getObject(objId) is obj:
+            return objId
+        try:
+            ref = weakref.ref(obj)
+        except TypeError:
+            ref = obj  # can't be weakly referenced so keep the object itself
+        objId = len(self._objs)
+        self._objIds[id(obj)] = objId
+        self._objs.append(ref)
+        return objId
+    def _getObject(self, objId):
+        if objId < 0:
+            return None
+        obj = self._objs[objId]
+        if isinstance(obj, weakref.ref):
+            obj = obj()
+        return obj
+    def _indices(self):
+        """Array indices of the stored entries, oldest first"""
+        return (self._start + numpy.arange(self._n)) % self._cap
+    def _grow(self):
+        idx = self._indices()
+        newCap = self._cap*2
+        for name in ['_t', '_level', '_msgId', '_objId']:
+            old = getattr(self, name)
+            new = numpy.zeros(newCap, old.dtype)
+            new[:self._n] = old[idx]
+            setattr(self, name, new)
+        self._cap = newCap
+        self._start = 0
+    def _spill(self, nEntries):
+        """Move the oldest nEntries to the spill files"""
+        idx = self._indices()[:nEntries]
+        records = numpy.zeros(len(idx), self._spillDtype)
+        records['t'] = self._t[idx]
+        records['level'] = self._level[idx]
+        for n, msgId in enumerate(self._msgId[idx]):
+            txt = self._msgs[msgId]
+            if not isinstance(txt, unicode):
+                txt = str(txt).decode('utf8', 'replace')
+            txt = txt.encode('utf8')
+            records['msgStart'][n] = self._spillMsgPos
+            records['msgLen'][n] = len(txt)
+            self._spillMsgs.write(txt)
+            self._spillMsgPos += len(txt)
+        records.tofile(self._spillRecords)
+        self._start = (self._start + nEntries) % self._cap
+        self._n -= nEntries
+        self.nSpilled += nEntries
+    def _compact(self):
+        """Forget messages and objects no longer referenced by any entry"""
+        idx = self._indices()
+        for idName, listName, dictName in [('_msgId', '_msgs', '_msgIds'),
+                                           ('_objId', '_objs', '_objIds')]:
+            ids = getattr(self, idName)
+            oldList = getattr(self, listName)
+            live = numpy.unique(ids[idx])
+            live = live[live >= 0]
+            remap = numpy.empty(len(oldList) + 1, 'i4')
+            remap[-1] = -1  # so that -1 (no object) maps to itself
+            remap[live] = numpy.arange(len(live))
+            ids[idx] = remap[ids[idx]]
+            newList = [oldList[i] for i in live]
+            setattr(self, listName, newList)
+            if listName == '_msgs':
+                self._msgIds = dict((msg, n) for n, msg in enumerate(newList))
+            else:
+                self._objIds = {}
+                for n, obj in enumerate(newList):
+                    if isinstance(obj, weakref.ref):
+                        obj = obj()
+                    if obj is not None:
+                        self._objIds[id(obj)] = n
+    def extend(self, entries):
+        """Add a sequence of :class:`_LogEntry` to the history"""
+        if self.retention == 'none':
+            return
+        self._lock.acquire()
+        try:
+            for thisEntry in entries:
+                if self._n == self._cap:
+                    if self.retention == 'all':
+                        self._grow()
+                    elif self.retention == 'spill':
+                        self._spill(max(self._cap//2, 1))
+                    else:  # discard the oldest
+                        self._start = (self._start + 1) % self._cap
+                        self._n -= 1
+                i = (self._start + self._n) % self._cap
+                self._t[i] = thisEntry.t
+                self._level[i] = thisEntry.level
+                self._msgId[i] = self._internMessage(thisEntry.message)
+                self._objId[i] = self._internObject(thisEntry.obj)
+                self._n += 1
+            if (self.retention != 'all' and
+                    len(self._msgs) + len(self._objs) > 2*self._cap + 1024):
+                self._compact()
+        finally:
+            self._lock.release()
+    def close(self):
+        """Close the spill files (if any)"""
+        if self.retention == 'spill':
+            self._spillRecords.close()
+            self._spillMsgs.close()
+    def _spilled(self):
+        """Read back the entries that have been spilled to disk"""
+        self._spillRecords.flush()
+        self._spillMsgs.flush()
+        records = numpy.fromfile(self.spillFile, self._spillDtype)
+        f = open(self.spillFile + '.msgs', 'rb')
+        txt = f.read()
+        f.close()
+        messages = [txt[start:start+length].decode('utf8') for start, length
+                    in zip(records['msgStart'], records['msgLen'])]
+        return records, messages
+    def query(self, level=None, since=None, until=None, spilled=True):
+        """Return stored entries as a numpy structured array with fields
+        't', 'level', 'message' and 'obj' (None if unknown or no longer
+        alive). See :meth:`_Logger.history`.
+        """
+        out = numpy.zeros(0, [('t', 'f8'), ('level', 'i2'),
+                              ('message', 'O'), ('obj', 'O')])
+        self._lock.acquire()
+        try:
+            idx = self._indices()
+            t = self._t[idx]
+            mask = numpy.ones(len(idx), bool)
+            if level is not None:
+                mask &= self._level[idx] >= level
+            if since is not None:
+                mask &= t >= since
+            if until is not None:
+                mask &= t <= until
+            idx = idx[mask]
+            recent = numpy.zeros(len(idx), out.dtype)
+            recent['t'] = self._t[idx]
+            recent['level'] = self._level[idx]
+            recent['message'] = [self._msgs[i] for i in self._msgId[idx]]
+            recent['obj'] = [self._getObject(i) for i in self._objId[idx]]
+            if spilled and self.nSpilled:
+                records, messages = self._spilled()
+        finally:
+            self._lock.release()
+        if spilled and self.nSpilled:
+            mask = numpy.ones(len(records), bool)
+            if level is not None:
+                mask &= records['level'] >= level
+            if since is not None:
+                mask &= records['t'] >= since
+            if until is not None:
+                mask &= records['t'] <= until
+            old = numpy.zeros(mask.sum(), out.dtype)
+            old['t'] = records['t'][mask]
+            old['level'] = records['level'][mask]
+            old['message'] = [msg for msg, keep in zip(messages, mask) if keep]
+            return numpy.concatenate([old, recent])
+        return recent
+
 class _Logger:
     """Maintains a set of log targets (text streams such as files of stdout)
 
@@ -188,11 +449,21 @@ class _Logger:
         e.g. t, t_ms, level, levelname, message
         """
         self.targets=[]
-        self.flushed=[]
+        self._history = _LogHistory()
         self.toFlush=[]
         self.format=format
         self.lowestTarget=50
+        #state for the (optional) asynchronous writer, see startAsync()
+        self._writer = None
+        self._queue = deque()
+        self._queueCond = threading.Condition()
+        self._maxQueue = 0
+        self._onFull = 'block'
+        self._nQueued = 0
+        self._nWritten = 0
+        self._nDropped = 0
     def __del__(self):
+        self.stopAsync()
         self.flush()
         # unicode logged to coder output window can cause logger failure, with
         # error message pointing here. this is despite it being ok to log to
@@ -224,11 +495,134 @@ class _Logger:
         if t is None:
             global defaultClock
             t=defaultClock.getTime()
-        #add message to list
-        self.toFlush.append(_LogEntry(t=t, level=level, message=message, obj=obj))
+        #add message to list (or hand it to the writer thread)
+        thisEntry = _LogEntry(t=t, level=level, message=message, obj=obj)
+        if self._writer is None or not self._enqueue(thisEntry):
+            self.toFlush.append(thisEntry)
+    def _enqueue(self, entry):
+        """Put an entry on the queue of the writer thread, applying the
+        back-pressure policy if the queue is full.
+
+        Returns False if the writer has been stopped in the meantime (the
+        caller should then handle the entry synchronously).
+        """
+        cond = self._queueCond
+        cond.acquire()
+        try:
+            if self._writer is None:
+                return False
+            if self._maxQueue and len(self._queue) >= self._maxQueue:
+                if self._onFull == 'dropNewest':
+                    self._nDropped += 1
+                    return True
+                elif self._onFull == 'dropOldest':
+                    self._queue.popleft()
+                    self._nDropped += 1
+                else:  # 'block' until the writer has emptied the queue
+                    cond.notifyAll()
+                    while (self._writer is not None and
+                           len(self._queue) >= self._maxQueue):
+                        cond.wait(0.01)
+                    if self._writer is None:
+                        return False
+            self._queue.append(entry)
+            self._nQueued += 1
+            return True
+        finally:
+            cond.release()
+    def startAsync(self, maxQueue=10000, onFull='block', interval=0.1):
+        """Write log entries from a background thread rather than during
+        :meth:`flush`.
+
+        Once started, :meth:`log` only adds entries to a queue and a writer
+        thread formats them and writes them to each target in batches, at
+        least every `interval` seconds and whenever :meth:`flush` is called
+        (which then returns immediately). The queue is drained by
+        :meth:`stopAsync`, which is called by :func:`psychopy.core.quit` and
+        when the interpreter exits.
+
+        :parameters:
+
+            - maxQueue:
+                maximum number of entries waiting to be written (0 for no limit)
+
+            - onFull: 'block', 'dropNewest' or 'dropOldest'
+                what :meth:`log` does when the queue is full: wait for the
+                writer, discard the new entry or discard the oldest queued
+                entry. Discarded entries are counted (see :meth:`getAsyncStats`)
+
+            - interval:
+                maximum time (s) the writer sleeps between batches
+
+        """
+        if onFull not in ['block', 'dropNewest', 'dropOldest']:
+            raise ValueError("onFull should be 'block', 'dropNewest' or "
+                             "'dropOldest', not %r" % onFull)
+        self.stopAsync()
+        self._maxQueue = maxQueue
+        self._onFull = onFull
+        #anything logged before now goes out first
+        self._queue.extend(self.toFlush)
+        self._nQueued += len(self.toFlush)
+        self.toFlush = []
+        self._writer = _LogWriterThread(self, interval=interval)
+        self._writer.start()
+        atexit.register(self.stopAsync)
+    def stopAsync(self, timeout=None):
+        """Stop the writer thread (if running), after it has written all
+        queued entries, and return to synchronous writing.
+        """
+        writer = self._writer
+        if writer is None:
+            return
+        cond = self._queueCond
+        cond.acquire()
+        try:
+            self._writer = None
+            writer.stopflag = True
+            cond.notifyAll()
+        finally:
+            cond.release()
+        if writer is not threading.currentThread():
+            writer.join(timeout)
+    def getAsyncStats(self):
+        """Return a dict of counters for the asynchronous writer:
+
+            - queued: entries handed to the writer thread
+            - written: entries the writer has processed
+            - dropped: entries discarded because the queue was full
+            - pending: entries currently waiting in the queue
+        """
+        return {'queued': self._nQueued, 'written': self._nWritten,
+                'dropped': self._nDropped, 'pending': len(self._queue)}
+    def _writeBatch(self, entries):
+        """Format entries and write them to each target with a single
+        write (and flush) per target. Called from the writer thread.
+        """
+        formatted={}
+        for target in list(self.targets):
+            lines = []
+            for thisEntry in entries:
+                if thisEntry.level>=target.level:
+                    if not thisEntry in formatted:
+                        formatted[thisEntry]= self.format %thisEntry.__dict__
+                    lines.append(formatted[thisEntry]+'\n')
+            if lines:
+                target.write(''.join(lines))
+        self._history.extend(entries)
+        self._nWritten += len(entries)
     def flush(self):
         """Process all current messages to each target
+
+        If the asynchronous writer is running (see :meth:`startAsync`) this
+        just wakes the writer thread and returns without waiting for it.
         """
+        if self._writer is not None:
+            cond = self._queueCond
+            cond.acquire()
+            cond.notifyAll()
+            cond.release()
+            return
         #loop through targets then entries in toFlush
         #so that stream.flush can be called just once
         formatted={}#keep a dict of formatted messages - so only do the formatting once
@@ -241,9 +635,58 @@ class _Logger:
                     target.write(formatted[thisEntry]+'\n')
             if hasattr(target.stream, 'flush'):
                 target.stream.flush()
-        #finished processing entries - move them to self.flushed
-        self.flushed.extend(self.toFlush)
+        #finished processing entries - move them to the history
+        self._history.extend(self.toFlush)
         self.toFlush=[]#a new empty list
+    def setHistory(self, retention='last', maxEntries=100000, spillFile=None):
+        """Set how many of the flushed entries are kept for :meth:`history`
+
+        :parameters:
+
+            - retention: 'all', 'none', 'last' or 'spill'
+                keep every entry, no entries, only the most recent
+                `maxEntries`, or the most recent `maxEntries` in memory and
+                older ones written to `spillFile`
+
+            - maxEntries:
+                number of entries kept in memory for 'last' and 'spill'
+
+            - spillFile:
+                path of the file that older entries go to for 'spill'
+
+        Entries already held in memory are kept (subject to the new limits).
+        """
+        newHistory = _LogHistory(retention=retention, maxEntries=maxEntries,
+                                 spillFile=spillFile)
+        old = self._history.query(spilled=False)
+        newHistory.extend([_LogEntry(t=row['t'], level=row['level'],
+                                     message=row['message'], obj=row['obj'])
+                           for row in old])
+        self._history.close()
+        self._history = newHistory
+    def history(self, level=None, since=None, until=None, spilled=True):
+        """Return the flushed entries as a numpy structured array with
+        fields 't', 'level', 'message' and 'obj', oldest first.
+
+        :parameters:
+
+            - level:
+                only entries of this level or more important
+
+            - since, until:
+                only entries logged within these times (inclusive)
+
+            - spilled:
+                include entries spilled to disk (retention='spill')
+
+        e.g. to get the times of all EXP (or more important) messages in the
+        last 10 s::
+
+            h = logging.root.history(level=logging.EXP, since=core.getTime()-10)
+            times = h['t']
+        """
+        return self._history.query(level=level, since=since, until=until,
+                                   spilled=spilled)
 
 root = _Logger()
 console = LogFile()
@@ -3,7 +3,7 @@
 # Copyright (C) 2015 Jonathan Peirce
 # Distributed under the terms of the GNU General Public License (GPL).
 
-import sys, platform
+import sys, os, platform
 
 #dummy methods Should be overridden by imports below if they exist
 def rush(value=False, realtime = False):
@@ -25,6 +25,20 @@ def sendStayAwake():
     """
     return False
 
+def haveDisplay():
+    """Returns False on Linux when there is no X display (DISPLAY is unset),
+    in which case only `winType='offscreen'` windows can be made
+    """
+    return not sys.platform.startswith('linux') or bool(os.environ.get('DISPLAY'))
+def setPygletOptions():
+    """Sets pyglet options that must be in place before pyglet.window is
+    imported. With no display pyglet can't make its hidden "shadow" window,
+    but offscreen windows don't need it
+    """
+    import pyglet
+    if not haveDisplay():
+        pyglet.options['shadow_window'] = False
+
 if sys.platform=='win32':#NB includes vista and 7 (but not sure about vista64)
     from win32 import *  # pylint: disable=W0401
 elif sys.platform=='darwin':
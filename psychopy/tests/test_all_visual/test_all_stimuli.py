@@ -1,5 +1,5 @@
 import sys, os, copy
-from psychopy import visual, monitors, prefs
+from psychopy import visual, monitors, prefs, core
 from psychopy.visual import filters
 from psychopy.tools.coordinatetools import pol2cart
 from psychopy.tests import utils
@@ -7,6 +7,10 @@ import numpy
 import pytest
 import shutil
 from tempfile import mkdtemp
+try:
+    from PIL import Image
+except ImportError:
+    import Image
 
 """Each test class creates a context subclasses _baseVisualTest to run a series
 of tests on a single graphics context (e.g. pyglet with shaders)
@@ -33,6 +37,26 @@ class Test_Window:
         self.win.saveMovieFrames(os.path.join(self.temp_dir, 'junkFrames.png'))
         self.win.saveMovieFrames(os.path.join(self.temp_dir, 'junkFrames.gif'))
         region = self.win._getRegionOfFrame()
+    def test_recordMovie(self):
+        fileName = os.path.join(self.temp_dir, 'junkRecorded.png')
+        win = visual.Window([64,64], autoLog=False)
+        stim = visual.GratingStim(win, tex='sin', mask='gauss')
+        frames = []
+        win.recordMovie(fileName)
+        for frameN in range(4):
+            stim.phase += 0.3
+            stim.draw()
+            win.getMovieFrame(buffer='back')
+            frames.append(numpy.array(win.movieFrames.pop()))
+            win.flip()
+        stats = win.movieRecorder.stats()
+        win.close()  # writes the remaining frames
+        assert stats['captured'] == 4 and stats['skipped'] == 0
+        assert win.movieRecorder is None
+        for frameN, frame in enumerate(frames):
+            recorded = Image.open(os.path.join(self.temp_dir,
+                                               'junkRecorded%06i.png' % (frameN+1)))
+            assert numpy.all(numpy.array(recorded) == frame)
     def test_multiFlip(self):
         self.win.recordFrameIntervals = False #does a reset
         self.win.recordFrameIntervals = True
@@ -45,6 +69,35 @@ class Test_Window:
             assert val==2
         self.win.callOnFlip(assertThisIs2, 2)
         self.win.flip()
+    def test_frameStats(self):
+        fileName = os.path.join(self.temp_dir, 'junkStreamedInts')
+        self.win.setFrameIntervalsSize(10)
+        self.win.streamFrameIntervals(fileName, every=5)
+        self.win.recordFrameIntervals = False
+        self.win.recordFrameIntervals = True
+        for frameN in range(21):
+            self.win.flip()
+        self.win.recordFrameIntervals = False
+        stats = self.win.frameStats()
+        assert stats['n'] == 20
+        assert len(self.win.frameIntervals) == 10
+        assert stats['min'] <= stats['percentiles'][50] <= stats['max']
+        self.win.streamFrameIntervals(None)
+        streamed = open(fileName).read().split(',')
+        assert len(streamed) == 20
+        self.win.frameIntervals = []
+        assert self.win.frameStats()['n'] == 0
+    def test_flipProfile(self):
+        self.win.resetFlipProfile(nFrames=5)
+        self.win.recordFlipProfile = True
+        for frameN in range(8):
+            self.win.flip()
+        self.win.recordFlipProfile = False
+        profile = self.win.getFlipProfile()
+        assert len(profile) == 5
+        assert list(profile['frameN']) == [3, 4, 5, 6, 7]
+        assert (profile['total'] >= profile['swap']).all()
+        assert 'blank' in self.win.reportFlipProfile()
 
 class _baseVisualTest:
     #this class allows others to be created that inherit all the tests for
@@ -84,6 +137,71 @@ class _baseVisualTest:
         image.draw()
         utils.compareScreenshot('imageAndGauss_%s.png' %(self.contextName), win)
         win.flip()
+    def test_imagePreloader(self):
+        win = self.win
+        fileName = os.path.join(utils.TESTS_DATA_PATH, 'testimage.jpg')
+        preloader = visual.ImagePreloader()
+        win.textureCache.enabled = False  # so that the image isn't shared
+        try:
+            preloader.preload([fileName, fileName])
+            for attempt in range(500):
+                if preloader.isReady(fileName):
+                    break
+                core.wait(0.01)
+            assert preloader.stats()['ready'] == 1
+            size = numpy.array([2.0,2.0])*self.scaleFactor
+            image = visual.ImageStim(win, image=fileName, mask='gauss',
+                                     size=size, flipHoriz=True, flipVert=True)
+            assert preloader.stats()['hits'] == 1
+            assert preloader.stats()['nBytes'] == 0
+            image.draw()
+            utils.compareScreenshot('imageAndGauss_%s.png' %(self.contextName), win)
+            win.flip()
+        finally:
+            win.textureCache.enabled = True
+            preloader.stop()
+    def test_textureUploader(self):
+        win = self.win
+        uploader = win.textureUploader
+        size = numpy.array([2.0,2.0])*self.scaleFactor
+        numpy.random.seed(1)
+        image = numpy.random.random([256,256,3])*2-1  # big enough to stream
+        frames = []
+        try:
+            for enabled in [True, False]:
+                uploader.enabled = enabled
+                nStreamed = uploader.stats()['streamed']
+                stim = visual.ImageStim(win, image=image, size=size)
+                if enabled and win._havePBOs:
+                    assert uploader.stats()['streamed'] == nStreamed + 1
+                else:
+                    assert uploader.stats()['streamed'] == nStreamed
+                stim.draw()
+                win.getMovieFrame(buffer='back')
+                frames.append(numpy.array(win.movieFrames.pop(), 'f'))
+                win.flip()
+        finally:
+            uploader.enabled = win._havePBOs
+        assert numpy.all(frames[0] == frames[1])
+    def test_textLayoutCache(self):
+        win = self.win
+        if self.win.winType=='pygame':
+            pytest.skip("Text layouts are only cached with pyglet")
+        layouts = win.textLayoutCache
+        stim = visual.TextStim(win, text='first', height=0.3*self.scaleFactor)
+        stim.preloadText(['second', 'third'])
+        assert stim.text == 'first'
+        nHits = layouts.stats()['hits']
+        stim.text = 'second'
+        stim.text = 'third'
+        assert layouts.stats()['hits'] == nHits + 2
+        #stimuli with the same settings share a layout
+        other = visual.TextStim(win, text='third', height=0.3*self.scaleFactor)
+        assert other._pygletTextObj is stim._pygletTextObj
+        other.height = 0.4*self.scaleFactor
+        other.draw()  # laid out again for the new height
+        assert other._pygletTextObj is not stim._pygletTextObj
+        win.flip()
     def test_gratingImageAndGauss(self):
         win = self.win
         size = numpy.array([2.0,2.0])*self.scaleFactor
@@ -135,6 +253,58 @@ class _baseVisualTest:
         imageStim.draw()
         utils.compareScreenshot('greyscale2_%s.png' %(self.contextName), win)
         win.flip()
+    def test_textureCache(self):
+        win = self.win
+        cache = win.textureCache
+        nHits = cache.nHits
+        gabor1 = visual.GratingStim(win, tex='sin', mask='gauss', texRes=64)
+        gabor2 = visual.GratingStim(win, tex='sin', mask='gauss', texRes=64)
+        assert gabor1._maskID.value == gabor2._maskID.value
+        if win._haveShaders:
+            assert gabor1._texID.value == gabor2._texID.value
+        assert cache.nHits > nHits
+        #changing one stimulus doesn't change the other
+        gabor1.mask = 'circle'
+        assert gabor1._maskID.value != gabor2._maskID.value
+        gabor2.mask = 'circle'
+        assert gabor1._maskID.value == gabor2._maskID.value
+        gabor1.draw()
+        gabor2.draw()
+        win.flip()
+        stats = cache.stats()
+        assert stats['nTextures'] >= 2 and stats['nBytes'] > 0
+        del gabor1, gabor2
+        assert cache.stats()['nUnused'] > stats['nUnused']
+        cache.clear()
+        assert cache.stats()['nUnused'] == 0
+    def test_changeSharedTexture(self):
+        #a stim whose shared texture is replaced must draw its new texture
+        win = self.win
+        fileName = os.path.join(utils.TESTS_DATA_PATH, 'testimage.jpg')
+        otherName = os.path.join(utils.TESTS_DATA_PATH, 'testwedges.png')
+        size = numpy.array([1.0,1.0])*self.scaleFactor
+        frames = []
+        try:
+            for enabled in [True, False]:
+                win.textureCache.enabled = enabled
+                images = [visual.ImageStim(win, image=fileName, size=size,
+                                           pos=-size/2) for n in range(2)]
+                gratings = [visual.GratingStim(win, mask=None, size=size,
+                                               pos=size/2) for n in range(2)]
+                for frameN in range(2):  # until the display lists are made
+                    images[0].draw()
+                    gratings[0].draw()
+                    win.flip()
+                images[0].image = otherName
+                gratings[0].mask = 'circle'
+                images[0].draw()
+                gratings[0].draw()
+                win.getMovieFrame(buffer='back')
+                frames.append(numpy.array(win.movieFrames.pop(), 'f'))
+                win.flip()
+        finally:
+            win.textureCache.enabled = True
+        assert numpy.all(frames[0] == frames[1])
     def test_numpyTexture(self):
         win = self.win
         grating = filters.makeGrating(res=64, ori=20.0,
@@ -160,6 +330,51 @@ class _baseVisualTest:
         utils.compareScreenshot('numpyLowContr_%s.png' %(self.contextName), win)
         win.flip()
 
+    def test_batchAutoDraw(self):
+        win = self.win
+        stims = []
+        for n in range(4):
+            stims.append(visual.GratingStim(win, mask='gauss',
+                pos=[(n-1.5)*0.4*self.scaleFactor, 0],
+                sf=2.0/self.scaleFactor, size=0.3*self.scaleFactor))
+        stims.append(visual.TextStim(win, text='top', height=0.2*self.scaleFactor))
+        for stim in stims:
+            stim.autoDraw = True
+        frames = []
+        for batch in [False, True]:
+            win.batchAutoDraw = batch
+            win.flip()
+            win.getMovieFrame()  # the autoDraw stimuli are on the front buffer
+            frames.append(numpy.array(win.movieFrames.pop()))
+        for stim in stims:
+            stim.autoDraw = False
+        win.batchAutoDraw = False
+        win.flip()
+        assert numpy.all(frames[0] == frames[1])
+        if win._haveShaders:
+            assert win.batchStats['nBatched'] == 4
+            assert win.batchStats['nStateChangesSaved'] > 0
+    def test_batchAutoDrawOrder(self):
+        #overlapping stimuli of equal depth must stay in the same order
+        win = self.win
+        size = 0.6*self.scaleFactor
+        stims = [visual.GratingStim(win, tex=tex, mask=mask, size=size,
+                    pos=[n*0.2*self.scaleFactor, 0], sf=2.0/self.scaleFactor)
+                 for n, (tex, mask) in enumerate([('sin', 'gauss'),
+                     ('sqr', 'circle'), ('sin', 'gauss')])]
+        for stim in stims:
+            stim.autoDraw = True
+        frames = []
+        for batch in [False, True]:
+            win.batchAutoDraw = batch
+            win.flip()
+            win.getMovieFrame()  # the autoDraw stimuli are on the front buffer
+            frames.append(numpy.array(win.movieFrames.pop()))
+        for stim in stims:
+            stim.autoDraw = False
+        win.batchAutoDraw = False
+        win.flip()
+        assert numpy.all(frames[0] == frames[1])
     def test_gabor(self):
         win = self.win
         #using init
@@ -200,6 +415,23 @@ class _baseVisualTest:
         utils.compareScreenshot('bufferimg_gabor_%s.png' %(self.contextName), win, crit=8)
         win.flip()
 
+    @pytest.mark.bufferimage
+    def test_bufferImageGetImage(self):
+        win = self.win
+        gabor = visual.PatchStim(win, mask='gauss', ori=-45,
+            pos=[0.6*self.scaleFactor, -0.6*self.scaleFactor],
+            sf=2.0/self.scaleFactor, size=2*self.scaleFactor)
+        rect = [-0.5, 0.5, 0.5, -0.5]
+        win.clearBuffer()
+        gabor.draw()
+        region = win._getRegionOfFrame(buffer='back', rect=rect)
+        bufferImgStim = visual.BufferImageStim(win, stim=[gabor], rect=rect)
+        #the pixels read back from the texture are those that were drawn
+        im = bufferImgStim.getImage()
+        assert im.size == region.size
+        assert numpy.array_equal(numpy.asarray(im), numpy.asarray(region))
+        win.flip()
+
     #def testMaskMatrix(self):
     #    #aims to draw the exact same stimulus as in testGabor, but using filters
     #    win=self.win
@@ -410,6 +642,57 @@ class _baseVisualTest:
             "dots._signalDots failed to change after dots.setCoherence()"
         assert not numpy.alltrue(prevVerticesPix==dots.verticesPix), \
             "dots.verticesPix failed to change after dots.setPos()"
+    def test_dots_trajectory(self):
+        win = self.win
+        dots = visual.DotStim(win, nDots=50, fieldShape='circle',
+                              fieldSize=self.scaleFactor, dotLife=5,
+                              noiseDots='walk', signalDots='different',
+                              speed=0.01*self.scaleFactor)
+        frames = dots.precompute(10, seed=1)
+        assert frames.shape == (10, 50, 2) and frames.dtype == numpy.float32
+        assert numpy.hypot(frames[..., 0], frames[..., 1]).max() <= 0.5
+        #the same seed gives the same trajectory, also from a thread or file
+        tempDir = mkdtemp(prefix='psychopy-tests-dots')
+        fileName = os.path.join(tempDir, 'dots.npy')
+        again = dots.precompute(10, seed=1, fileName=fileName, background=True)
+        verticesPix = []
+        for frameN in range(10):
+            dots.draw()
+            verticesPix.append(dots.verticesPix.copy())
+        assert numpy.array_equal(frames, again)
+        assert numpy.array_equal(frames, numpy.load(fileName))
+        #replaying a file
+        dots.trajectory = fileName
+        dots.draw()
+        assert numpy.allclose(dots.verticesPix, verticesPix[0])
+        dots.trajectory = None
+        dots.draw()
+        win.flip()
+        shutil.rmtree(tempDir)
+    def test_dots_element(self):
+        win = self.win
+        if not win._haveShaders:
+            pytest.skip("Batched dot elements require shaders, which aren't available")
+        #DotStim assumes that the element uses pixels as units
+        gabor = visual.GratingStim(win, mask='gauss', units='pix', sf=0.1,
+                                   size=20, ori=30, color=[0.5, -0.2, 0.8],
+                                   opacity=0.7)
+        dots = visual.DotStim(win, nDots=30, fieldSize=self.scaleFactor,
+                              speed=0, dotLife=-1, element=gabor)
+        frames = []
+        for batchElements in [False, True, True, False]:
+            dots.batchElements = batchElements
+            dots.draw()
+            win.getMovieFrame(buffer='back')
+            frames.append(numpy.array(win.movieFrames.pop(), 'f'))
+            win.flip()
+            if len(frames) == 2:  # changes to the element are picked up
+                gabor.ori = 90
+                gabor.contrast = 0.5
+        assert dots._elementArray is not None
+        for looped, batched in [(frames[0], frames[1]), (frames[3], frames[2])]:
+            assert numpy.abs(looped - batched).max() <= 2
+        assert numpy.abs(frames[0] - frames[3]).max() > 2
     def test_element_array(self):
         win = self.win
         if not win._haveShaders:
@@ -433,6 +716,72 @@ class _baseVisualTest:
         spiral.draw()
         utils.compareScreenshot('elarray1_%s.png' %(self.contextName), win)
         win.flip()
+    def test_element_array_instancing(self):
+        win = self.win
+        if not win._haveShaders or not win._haveInstancing:
+            pytest.skip("Instanced drawing isn't available")
+        N = 50
+        xys = (numpy.random.random([N, 2])-0.5)*self.scaleFactor
+        elements = visual.ElementArrayStim(win, nElements=N, xys=xys,
+            sizes=0.3*self.scaleFactor, sfs=2.0, oris=numpy.arange(N)*7,
+            phases=numpy.random.random(N), contrs=numpy.linspace(-1, 1, N),
+            colors=numpy.random.random([N, 3])*2-1, fieldPos=[0.1, 0])
+        assert elements.useInstancing
+        frames = []
+        for instancing in [False, True, False, True]:
+            elements.useInstancing = instancing
+            elements.draw()
+            win.getMovieFrame(buffer='back')
+            frames.append(numpy.array(win.movieFrames.pop(), 'f'))
+            win.flip()
+            if len(frames) == 2:  # changes after the first draw are shown
+                elements.oris += 45
+                elements.opacities = 0.5
+        for legacy, instanced in [frames[0:2], frames[2:4]]:
+            assert numpy.abs(legacy - instanced).max() <= 2
+        assert numpy.abs(frames[0] - frames[2]).max() > 2
+    def test_element_array_partial(self):
+        win = self.win
+        if not win._haveShaders:
+            pytest.skip("ElementArray requires shaders, which aren't available")
+        N = 40
+        xys = (numpy.random.random([N, 2])-0.5)*self.scaleFactor
+        colors = numpy.random.random([N, 3])*2-1
+        kwargs = dict(nElements=N, xys=xys, sizes=0.2*self.scaleFactor,
+                      sfs=2.0, oris=numpy.arange(N)*5, colors=colors)
+        partial = visual.ElementArrayStim(win, **kwargs)
+        full = visual.ElementArrayStim(win, **kwargs)
+        mask = numpy.arange(N) % 3 == 0
+        for instancing in [False, win._haveInstancing]:
+            partial.useInstancing = full.useInstancing = instancing
+            partial.draw()
+            full.draw()
+            partial.setOris(30, '+', indices=[1, 5, 7])
+            full.oris[[1, 5, 7]] += 30
+            full.oris = full.oris
+            partial.setXYs([0.1, 0.2], indices=slice(10, 13))
+            full.xys[10:13] = [0.1, 0.2]
+            full.xys = full.xys
+            partial.setSizes(2, '*', indices=mask)
+            full.sizes[mask] *= 2
+            full.sizes = full.sizes
+            partial.setOpacities(0.5, indices=[2, 3])
+            full.opacities[[2, 3]] = 0.5
+            full.opacities = full.opacities
+            partial.setColors([1, -1, 0], indices=[0])
+            full.colors[0] = [1, -1, 0]
+            full.colors = full.colors
+            partial.draw()
+            full.draw()
+            win.flip()
+            if partial._drawnInstanced:  # (degFlat units draw the legacy way)
+                assert numpy.allclose(partial._instanceData, full._instanceData)
+            else:
+                assert numpy.allclose(partial.verticesPix, full.verticesPix)
+                assert numpy.allclose(partial._RGBAs, full._RGBAs)
+                assert numpy.allclose(partial._texCoords, full._texCoords)
+        with pytest.raises(ValueError):
+            partial.setColors('red', indices=[0])
     def test_aperture(self):
         win = self.win
         if not win.allowStencil:
@@ -488,6 +837,8 @@ class _baseVisualTest:
         #make sure that we're successfully syncing to the frame rate
         msPFavg, msPFstd, msPFmed = visual.getMsPerFrame(self.win,nFrames=60, showVisual=True)
         utils.skip_under_travis()             # skip late so we smoke test the code
+        if self.win.winType=='offscreen':
+            pytest.skip("offscreen windows have no screen refresh to sync to")
         assert (1000/150.0 < msPFavg < 1000/40.0), \
             "Your frame period is %.1fms which suggests you aren't syncing to the frame" %msPFavg
 
@@ -595,6 +946,12 @@ class TestPygamePix(_baseVisualTest):
             units='pix', autoLog=False)
         self.contextName='pix'
         self.scaleFactor=60#applied to size/pos values
+class TestOffscreenNorm(_baseVisualTest):
+    @classmethod
+    def setup_class(self):
+        self.win = visual.Window([128,128], winType='offscreen', allowStencil=True, autoLog=False)
+        self.contextName='norm'
+        self.scaleFactor=1#applied to size/pos values
 #class TestPygameCm(_baseVisualTest):
 #    @classmethod
 #    def setup_class(self):
@@ -0,0 +1,48 @@
+"""
+Tests for the caching of psychopy.visual.filters results
+
+"""
+import numpy
+import pytest
+from psychopy.visual import filters
+
+
+def test_cachedMasks():
+    filters.clearCache()
+    info = filters.getCacheInfo()
+    mask = filters.makeMask(64, 'gauss')
+    assert not mask.flags.writeable
+    with pytest.raises(ValueError):
+        mask[0, 0] = 1
+    #the same arguments (given another way) give the same array
+    assert filters.makeMask(64, shape='gauss', range=(-1, 1)) is mask
+    assert filters.makeMask(64, 'circle') is not mask
+    newInfo = filters.getCacheInfo()
+    assert newInfo['hits'] == info['hits'] + 2  # (the circle reuses the radii)
+    assert newInfo['nEntries'] == 4  # two masks, their radii and the gaussian
+    assert newInfo['nBytes'] > 0
+    #arrays as arguments are keyed on their contents
+    rad = filters.makeRadialMatrix(64)
+    gauss = filters.makeGauss(rad.copy(), sd=0.5)
+    assert filters.makeGauss(rad, sd=0.5) is gauss
+    assert numpy.allclose(gauss, filters.makeGauss(rad, sd=0.25)**0.25)
+    grating = filters.makeGrating(32, ori=45, cycles=2)
+    assert filters.makeGrating(32, 45, 2) is grating
+
+
+def test_cacheSize():
+    filters.clearCache()
+    maxBytes = filters.getCacheInfo()['maxBytes']
+    try:
+        filters.setCacheSize(0)  # off
+        assert filters.makeMask(32) is not filters.makeMask(32)
+        assert filters.makeMask(32).flags.writeable
+        #room for one radial matrix of 64 (and not the mask made from it)
+        filters.setCacheSize(64*64*8)
+        filters.makeMask(64)
+        assert filters.getCacheInfo()['nEntries'] == 1
+        filters.makeRadialMatrix(64, radius=0.5)  # evicts the first
+        assert filters.getCacheInfo()['nBytes'] <= 64*64*8
+    finally:
+        filters.setCacheSize(maxBytes)
+        filters.clearCache()
@@ -0,0 +1,108 @@
+"""
+Tests for the background frame decoding of MovieStim3, using a stand-in for
+the moviepy clip (so moviepy isn't needed)
+
+"""
+import threading
+import numpy
+from psychopy.visual.moviedecoder import FrameDecoder
+
+frameInterval = 0.1
+
+
+class _Clip(object):
+    """Has the get_frame(t) of a moviepy clip; each frame is filled with its
+    frame number. Decoding can be held up (with `ready`) or made to fail"""
+    def __init__(self, failAt=None):
+        self.decoded = []
+        self.ready = threading.Event()
+        self.ready.set()
+        self.failAt = failAt
+
+    def get_frame(self, t):
+        frameN = int(round(t/frameInterval))
+        self.ready.wait()
+        if frameN == self.failAt:
+            raise IOError("can't decode frame %i" % frameN)
+        self.decoded.append(frameN)
+        return numpy.ones((2, 3, 3), numpy.uint8)*frameN
+
+
+def _frameN(frame):
+    assert frame is not None
+    assert (frame == frame[0, 0, 0]).all()
+    return int(frame[0, 0, 0])
+
+
+class TestFrameDecoder(object):
+    def setup_method(self, method):
+        self.decoders = []
+
+    def teardown_method(self, method):
+        for decoder in self.decoders:
+            decoder.stop()
+
+    def _decoder(self, clip, duration=10.0, nFrames=4):
+        decoder = FrameDecoder(clip, frameInterval, duration, nFrames)
+        self.decoders.append(decoder)
+        return decoder
+
+    def test_inOrder(self):
+        clip = _Clip()
+        decoder = self._decoder(clip)
+        for frameN in range(10):
+            assert _frameN(decoder.getFrame(frameN)) == frameN
+        assert clip.decoded[:10] == range(10)
+        #it never decodes more than nFrames ahead of the one shown
+        assert max(clip.decoded) < 9 + 4
+
+    def test_dropFrames(self):
+        clip = _Clip()
+        decoder = self._decoder(clip)
+        assert _frameN(decoder.getFrame(0)) == 0
+        assert _frameN(decoder.getFrame(2)) == 2  # already decoded ahead
+        #too far ahead: the frames in between are skipped, not decoded
+        assert _frameN(decoder.getFrame(30)) == 30
+        assert not set(range(6, 30)) & set(clip.decoded)
+
+    def test_repeatUntilDecoded(self):
+        clip = _Clip()
+        decoder = self._decoder(clip)
+        assert _frameN(decoder.getFrame(0)) == 0
+        clip.ready.clear()  # the next frames are slow to decode
+        assert decoder.getFrame(10, wait=False) is None
+        assert decoder.getFrame(10, wait=False) is None
+        clip.ready.set()
+        assert _frameN(decoder.getFrame(10)) == 10
+
+    def test_seekBack(self):
+        clip = _Clip()
+        decoder = self._decoder(clip)
+        for frameN in range(20, 26):
+            assert _frameN(decoder.getFrame(frameN)) == frameN
+        #frames decoded ahead of 25 (even one still being decoded during
+        #the seek) mustn't be mistaken for these
+        clip.ready.clear()
+        assert decoder.getFrame(3, wait=False) is None
+        clip.ready.set()
+        for frameN in range(3, 9):
+            assert _frameN(decoder.getFrame(frameN)) == frameN
+
+    def test_loop(self):
+        clip = _Clip()
+        decoder = self._decoder(clip, duration=0.5)  # frames 0 to 5
+        for frameN in range(6):
+            assert _frameN(decoder.getFrame(frameN)) == frameN
+        assert max(clip.decoded) == 5  # nothing beyond the end
+        for frameN in range(6):
+            assert _frameN(decoder.getFrame(frameN)) == frameN
+        assert max(clip.decoded) == 5
+
+    def test_decodeError(self):
+        clip = _Clip(failAt=3)
+        decoder = self._decoder(clip)
+        assert _frameN(decoder.getFrame(0)) == 0
+        #MovieStim3 decodes frames itself once the decoder has stopped
+        assert decoder.getFrame(3) is None
+        assert decoder.stopped
+        assert decoder.getFrame(4, wait=False) is None
@@ -1,7 +1,12 @@
 from psychopy import visual, event
 from psychopy.visual import Window
-from psychopy.visual.textbox import TextBox
+from psychopy.visual.textbox import TextBox, getFontManager
+from psychopy.visual.textbox.fontmanager import MonospaceFontAtlas
 
+import os
+import shutil
+import tempfile
+import numpy
 import pytest
 
 # cd psychopy/psychopy
@@ -27,6 +32,25 @@ class Test_textbox(object):
             self.win.flip()
             assert tb.getText() == tb.getDisplayedText() == text
 
+    def test_atlasCache(self):
+        fm = getFontManager()
+        font_info = fm.getFontsMatching(fm.getFontFamilyNames()[0])[0]
+        cache_dir = tempfile.mkdtemp()
+        MonospaceFontAtlas.cache_dir = cache_dir
+        try:
+            rendered = MonospaceFontAtlas(font_info, 12, 72)
+            rendered.createFontAtlas()
+            assert len(os.listdir(cache_dir)) == 2  # bitmap and metrics
+            cached = MonospaceFontAtlas(font_info, 12, 72)
+            cached.createFontAtlas()
+            assert isinstance(cached.atlas.data, numpy.memmap)
+            assert numpy.all(cached.atlas.data == rendered.atlas.data)
+            assert cached.charcode2glyph == rendered.charcode2glyph
+            assert cached.max_tile_height == rendered.max_tile_height
+        finally:
+            MonospaceFontAtlas.cache_dir = None
+            shutil.rmtree(cache_dir)
+
     def test_something(self):
         # to-do: test visual display, char position, etc
         pass
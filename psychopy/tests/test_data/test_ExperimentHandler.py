@@ -119,6 +119,34 @@ class TestExperimentHandler():
         exp.saveAsWideText(fileName)
         exp.saveAsPickle(fileName)
 
+    def test_stream_entries(self):
+        exp = data.ExperimentHandler(
+            savePickle=False,
+            saveWideText=False,
+            extraInfo={'participant': 'jwp'}
+        )
+        fileName = os.path.join(self.tmpDir, 'streamed.csv')
+        exp.streamEntries(fileName)
+        trials = data.TrialHandler(
+            trialList=[{'ori': 0}, {'ori': 90}], nReps=1,
+            method='sequential', name='trials'
+        )
+        exp.addLoop(trials)
+        for trial in trials:
+            trials.addData('resp', trial['ori'] > 0)
+            exp.nextEntry()
+        exp.addData('feedback', 'done')
+        exp.nextEntry()
+        exp.streamEntries(None)
+
+        #columns grow as they appear, so 'feedback' comes last
+        names = exp._getAllParamNames() + ['resp', 'participant', 'feedback']
+        lines = open(fileName, 'rU').read().splitlines()
+        assert lines[0] == ','.join(names)
+        assert len(lines) == 4
+        assert lines[2] == '90,0,1,1,1,True,jwp'
+        assert lines[3] == ',,,,,,jwp,done'
+
 
 if __name__ == '__main__':
     import pytest
@@ -1,6 +1,8 @@
 """Tests for psychopy.data.DataHandler"""
 from __future__ import print_function
 import os, glob
+import pickle
+import numpy
 from os.path import join as pjoin
 import shutil
 from pytest import raises
@@ -9,6 +11,7 @@ from numpy.random import random
 
 from psychopy import data
 from psychopy.tools.filetools import fromFile
+from psychopy.tools.arraytools import shuffleArray
 from psychopy.tests import utils
 import pytest
 
@@ -145,6 +148,170 @@ class TestTrialHandler:
         trials.saveAsWideText(pjoin(self.temp_dir, 'testRandom.csv'), delim=',', appendFile=False)#this omits values
         utils.compareTextFiles(pjoin(self.temp_dir, 'testRandom.csv'), pjoin(fixturesPath,'corrRandom.csv'))
 
+    def test_toDataFrame(self):
+        conditions = [{'ori': 0, 'label': 'vert'}, {'ori': 90, 'label': 'horiz'}]
+        trials = data.TrialHandler(trialList=conditions, nReps=2,
+                                   method='sequential',
+                                   extraInfo={'participant': 'jwp'},
+                                   autoLog=False)
+        for n, thisTrial in enumerate(trials):
+            trials.addData('rt', 0.5 + n)
+            trials.addData('key', 'k%i' % n)
+            if n == 2:
+                break  # so the last trial has no data
+        df = trials.toDataFrame()
+        assert list(df.columns) == ['participant', 'TrialNumber', 'ori',
+                                    'label', 'ran', 'order', 'rt', 'key']
+        assert df['ori'].dtype.kind == 'i'
+        assert df['rt'].dtype.kind == 'f'
+        assert list(df['TrialNumber']) == [1, 2, 3, 4]
+        assert list(df['label']) == ['vert', 'horiz', 'vert', 'horiz']
+        assert list(df['rt'][:3]) == [0.5, 1.5, 2.5]
+        assert df['rt'].isnull()[3] and df['key'][3] is None
+        assert list(df['key'][:3]) == ['k0', 'k1', 'k2']
+
+    def test_stream_trials(self):
+        conditions = [{'trialType': n} for n in range(3)]
+        trials = data.TrialHandler(trialList=conditions, nReps=2,
+                                   method='sequential',
+                                   extraInfo={'participant': 'jwp'},
+                                   autoLog=False)
+        fileName = pjoin(self.temp_dir, 'testStream.csv')
+        trials.streamTrials(fileName)
+        for n, thisTrial in enumerate(trials):
+            if n == 3:
+                #the trials completed so far are already in the file
+                lines = open(fileName, 'rU').read().splitlines()
+                assert len(lines) == 4
+            trials.addData('resp', 'resp%i' % thisTrial['trialType'])
+            if n == 4:
+                trials.addData('comment', 'said "hi", then left')
+        lines = open(fileName, 'rU').read().splitlines()
+        assert lines[0] == ('participant,TrialNumber,thisRepN,thisTrialN,'
+                            'thisIndex,trialType,resp,comment')
+        assert len(lines) == 7
+        assert lines[1] == 'jwp,1,0,0,0,0,resp0'  # from before 'comment'
+        assert lines[5].endswith(',"said ""hi"", then left"')
+        #and the handler still pickles
+        trials.saveAsPickle(pjoin(self.temp_dir, 'testStream'))
+        assert fromFile(pjoin(self.temp_dir, 'testStream.psydat')).nTotal == 6
+
+    def test_conditions_source(self):
+        fileName = pjoin(self.temp_dir, 'testSource.csv')
+        with open(fileName, 'w') as f:
+            f.write('word,pos,ori\n')
+            for n in range(10):
+                f.write('w%i,"[%i, 1]",%i.5\n' % (n, n, n))
+        #text with a run of empty cells longer than a chunk
+        emptyName = pjoin(self.temp_dir, 'testSourceEmpty.csv')
+        with open(emptyName, 'w') as f:
+            f.write('word,lab\n')
+            for n in range(10):
+                f.write('w%i,%s\n' % (n, 'lab%i' % n if n < 2 else ''))
+        data.conditionsCacheDir = pjoin(self.temp_dir, 'cache')
+        try:
+            source = data.ConditionsSource.fromFile(fileName, chunkSize=3)
+            #memory mapped from the cache, once it's been made
+            source = data.ConditionsSource.fromFile(fileName, chunkSize=3)
+            conditions = data.importConditions(fileName)
+            emptySource = data.ConditionsSource.fromFile(emptyName,
+                                                         chunkSize=3)
+            emptyConditions = data.importConditions(emptyName)
+        finally:
+            data.conditionsCacheDir = None
+        labs = [thisTrial['lab'] for thisTrial in emptySource]
+        assert labs[:2] == [u'lab0', u'lab1']
+        assert numpy.isnan(labs[2:]).all()
+        assert numpy.isnan([thisTrial['lab'] for thisTrial
+                            in emptyConditions[2:]]).all()
+        assert hasattr(source.rows, 'filename')
+        assert len(source) == 10 and source.fieldNames == ['word', 'pos', 'ori']
+        assert source[-1] == {'word': u'w9', 'pos': [9, 1], 'ori': 9.5}
+        assert source[2].pos == [2, 1]
+        assert list(source) == conditions
+        #runs and saves just as a list of the same conditions
+        saved = []
+        for name, trialList in [('List', conditions), ('Source', source)]:
+            trials = data.TrialHandler(trialList=trialList, nReps=2,
+                                       method='sequential', autoLog=False)
+            for thisTrial in trials:
+                trials.addData('resp', thisTrial['ori'] > 5)
+                if trials.thisN == 3:
+                    assert trials.getFutureTrial(8)['word'] == 'w1'
+            rootName = pjoin(self.temp_dir, 'testSaved' + name)
+            trials.saveAsWideText(rootName + '.txt', appendFile=False)
+            trials.saveAsText(rootName)
+            saved.append([open(rootName + ext).read()
+                          for ext in ['.txt', '.tsv']])
+        assert saved[0] == saved[1]
+
+    def test_sequence_int32(self):
+        conditions = [{'ori': n} for n in range(20)]
+        randomState = numpy.random.get_state()  # as other tests rely on it
+        try:
+            for method in ['random', 'fullRandom']:
+                trials = data.TrialHandler(conditions, nReps=5000, seed=1,
+                                           method=method, autoLog=False)
+                seq = trials.sequenceIndices
+                assert seq.dtype == numpy.int32 and seq.shape == (20, 5000)
+                assert (numpy.bincount(seq.ravel()) == 5000).all()
+                if method == 'random':  # each repetition has every condition
+                    assert (numpy.sort(seq, axis=0) ==
+                            numpy.arange(20)[:, None]).all()
+                #the same sequence as shuffling each repetition in turn
+                numpy.random.seed(1)
+                for repN in range(3 if method == 'random' else 0):
+                    shuffled = shuffleArray(numpy.arange(20))
+                    assert seq[:, repN].tolist() == shuffled.tolist()
+                flat = seq.T.ravel()
+                for n in range(45):
+                    trials.next()
+                assert trials.thisIndex == flat[44]
+                assert trials.getFutureTrial(30000)['ori'] == flat[30044]
+                assert trials.getEarlierTrial(-40)['ori'] == flat[4]
+                assert trials.getFutureTrial(100000 - 44) is None
+        finally:
+            numpy.random.set_state(randomState)
+
+class TestDataHandler:
+    def test_types_and_growth(self):
+        dat = data.DataHandler(dataTypes=['x'], dataShape=[2, 2])
+        assert dat['x'].dtype == bool and dat['x'].mask.all()
+        dat.add('x', True, position=[0, 0])
+        assert dat['x'].dtype == bool
+        dat.add('x', 3, position=[1, 0])
+        assert dat['x'].dtype.kind == 'i' and dat['x'][0, 0] == 1
+        dat.add('x', 0.25, position=[0, 1])
+        assert dat['x'].dtype.kind == 'f'
+        assert list(dat['x'].compressed()) == [1, 0.25, 3]
+        #beyond the initial shape
+        dat.add('x', 2.5, position=[1, 2])
+        assert dat['x'].shape == (2, 3)
+        assert dat['x'][1, 2] == 2.5 and dat['x'].mask[0, 2]
+        nBytes = dat.getMemoryUsage()['x']
+        dat.add('x', 1.5, position=[1, 3])  # in the room already made
+        assert dat.getMemoryUsage()['x'] == nBytes
+        #non-numeric data make an object array
+        dat.add('x', 'text', position=[0, 2])
+        assert not dat.isNumeric['x'] and dat['x'].dtype == 'O'
+        assert dat['x'][0, 1] == 0.25 and dat['x'][0, 3] == '--'
+        #pickling keeps the data (but not the spare room)
+        dat2 = pickle.loads(pickle.dumps(dat))
+        assert dat2['x'].shape == (2, 4) and dat2['x'][1, 3] == 1.5
+        dat2.add('x', 'more', position=[0, 4])
+        assert dat2['x'][0, 4] == 'more'
+
+    def test_write_to_array(self):
+        #values written straight into the array (which can give it its own
+        #copy of the mask) mustn't hide values added afterwards
+        dat = data.DataHandler(dataTypes=['x'], dataShape=[2, 2])
+        dat.add('x', 1.5, position=[0, 1])
+        dat['x'][0, 0] = 7.0
+        dat.add('x', 9.0, position=[1, 0])
+        assert list(dat['x'].compressed()) == [7.0, 1.5, 9.0]
+        dat.add('x', 2.5, position=[1, 2])  # and after growing
+        assert dat['x'][0, 0] == 7.0 and dat['x'][1, 2] == 2.5
+
 class TestMultiStairs:
     def setup_class(self):
         self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
@@ -53,6 +53,46 @@ def test_TrialTypeImport():
                 print(header, trialCSV[header], trialXLSX[header])
             assert trialXLSX[header] == trialCSV[header]
 
+def test_conditionsCache():
+    """csv and xlsx conditions are cached (with lists parsed) until the file
+    changes (its modification time or size)
+    """
+    tempDir = mkdtemp(prefix='psychopy-tests-testdata')
+    data.conditionsCacheDir = os.path.join(tempDir, 'cache')
+    try:
+        fileName = os.path.join(tempDir, 'conds.csv')
+        with open(fileName, 'w') as f:
+            f.write('ori,pos,label\n0,"[1, 2]",(a)\n90,"[3, 4]",b\n')
+        os.utime(fileName, (1e9, 1e9))
+        conds = data.importConditions(fileName)
+        assert conds == [{'ori': 0, 'pos': [1, 2], 'label': '(a)'},
+                         {'ori': 90, 'pos': [3, 4], 'label': 'b'}]
+        assert len(os.listdir(data.conditionsCacheDir)) == 1
+        # the same path, time and size are taken as an unchanged file
+        with open(fileName, 'w') as f:
+            f.write('ori,pos,label\n9,"[1, 2]",(a)\n90,"[3, 4]",b\n')
+        os.utime(fileName, (1e9, 1e9))
+        assert data.importConditions(fileName) == conds
+        with open(fileName, 'w') as f:
+            f.write('ori,pos,label\n45,"[5, 6]",c\n')
+        conds = data.importConditions(fileName, selection='0')
+        assert conds == [{'ori': 45, 'pos': [5, 6], 'label': 'c'}]
+        assert data.importConditions(fileName) == conds
+        # the cached columns keep their types
+        xlsxName = os.path.join(fixturesPath, 'trialTypes.xlsx')
+        data.useConditionsCache = False
+        fromFile = data.importConditions(xlsxName)
+        data.useConditionsCache = True
+        data.importConditions(xlsxName)
+        fromCache = data.importConditions(xlsxName)
+        assert fromCache == fromFile
+        assert ([map(type, trial.values()) for trial in fromCache] ==
+                [map(type, trial.values()) for trial in fromFile])
+    finally:
+        data.useConditionsCache = True
+        data.conditionsCacheDir = None
+        shutil.rmtree(tempDir)
+
 if __name__=='__main__':
     t=TestXLSX()
     t.setup_class()
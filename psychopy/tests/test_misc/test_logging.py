@@ -0,0 +1,138 @@
+from StringIO import StringIO
+import threading
+
+from psychopy import logging
+import pytest
+
+
+class _BlockingStream(StringIO):
+    """A stream whose first write blocks until `release` is set"""
+    def __init__(self):
+        StringIO.__init__(self)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, txt):
+        self.entered.set()
+        self.release.wait(5)
+        StringIO.write(self, txt)
+
+
+class TestAsyncLogging(object):
+    def setup(self):
+        self.logger = logging._Logger()
+        self.stream = StringIO()
+        self.target = logging.LogFile(self.stream, level=logging.DEBUG,
+                                      logger=self.logger)
+
+    def teardown(self):
+        self.logger.stopAsync()
+
+    def test_drain_on_stop(self):
+        self.logger.log('before', level=logging.EXP, t=0.0)
+        self.logger.startAsync(interval=0.01)
+        for n in range(500):
+            self.logger.log('msg%i' % n, level=logging.EXP, t=float(n))
+        self.logger.flush()
+        self.logger.stopAsync()
+        lines = self.stream.getvalue().splitlines()
+        assert len(lines) == 501
+        assert lines[0].endswith('before')
+        assert lines[-1].endswith('msg499')
+        stats = self.logger.getAsyncStats()
+        assert stats['written'] == stats['queued'] == 501
+        assert stats['dropped'] == stats['pending'] == 0
+        # back to synchronous writing
+        self.logger.log('after', level=logging.EXP, t=0.0)
+        self.logger.flush()
+        assert self.stream.getvalue().splitlines()[-1].endswith('after')
+
+    def test_target_levels(self):
+        warnStream = StringIO()
+        logging.LogFile(warnStream, level=logging.WARNING, logger=self.logger)
+        self.logger.startAsync()
+        self.logger.log('exp', level=logging.EXP, t=0.0)
+        self.logger.log('warn', level=logging.WARNING, t=0.0)
+        self.logger.stopAsync()
+        assert len(self.stream.getvalue().splitlines()) == 2
+        assert warnStream.getvalue().splitlines()[0].endswith('warn')
+
+    def test_drop_policies(self):
+        for onFull, kept in [('dropNewest', range(5)),
+                             ('dropOldest', range(5, 10))]:
+            logger = logging._Logger()
+            stream = _BlockingStream()
+            logging.LogFile(stream, level=logging.DEBUG, logger=logger)
+            logger.startAsync(maxQueue=5, onFull=onFull, interval=0.01)
+            logger.log('first', level=logging.EXP, t=0.0)
+            # the writer is now stuck writing 'first' so the queue fills up
+            assert stream.entered.wait(5)
+            for n in range(10):
+                logger.log('msg%i' % n, level=logging.EXP, t=0.0)
+            stream.release.set()
+            logger.stopAsync()
+            stats = logger.getAsyncStats()
+            assert stats['dropped'] == 5
+            assert stats['written'] == 6
+            lines = stream.getvalue().splitlines()
+            assert [l.split()[-1] for l in lines] == \
+                ['first'] + ['msg%i' % n for n in kept]
+
+    def test_bad_policy(self):
+        with pytest.raises(ValueError):
+            self.logger.startAsync(onFull='ignore')
+
+
+class _Stim(object):
+    pass
+
+
+class TestLogHistory(object):
+    def setup(self):
+        self.logger = logging._Logger()
+        logging.LogFile(StringIO(), level=logging.DEBUG, logger=self.logger)
+
+    def _logSome(self, n, obj=None):
+        for i in range(n):
+            level = [logging.DEBUG, logging.EXP, logging.DATA][i % 3]
+            self.logger.log('msg%i' % i, level=level, t=float(i), obj=obj)
+        self.logger.flush()
+
+    def test_query(self):
+        stim = _Stim()
+        self.logger.setHistory('all')
+        self._logSome(3000, obj=stim)
+        h = self.logger.history()
+        assert len(h) == 3000
+        assert h['t'][-1] == 2999.0
+        assert h['message'][10] == 'msg10'
+        assert h['obj'][0] is stim
+        h = self.logger.history(level=logging.EXP, since=100, until=199)
+        assert len(h) == 67
+        assert (h['level'] >= logging.EXP).all()
+        assert h['t'].min() >= 100 and h['t'].max() <= 199
+
+    def test_last(self):
+        self.logger.setHistory('last', maxEntries=100)
+        self._logSome(5000)
+        h = self.logger.history()
+        assert len(h) == 100
+        assert list(h['message'][[0, -1]]) == ['msg4900', 'msg4999']
+        # messages of discarded entries are forgotten
+        assert len(self.logger._history._msgs) <= 2*100 + 1024
+
+    def test_none(self):
+        self.logger.setHistory('none')
+        self._logSome(10)
+        assert len(self.logger.history()) == 0
+
+    def test_spill(self, tmpdir):
+        spillFile = str(tmpdir.join('log.spill'))
+        self.logger.setHistory('spill', maxEntries=100, spillFile=spillFile)
+        self._logSome(1000)
+        assert len(self.logger.history(spilled=False)) <= 100
+        h = self.logger.history()
+        assert len(h) == 1000
+        assert list(h['message']) == ['msg%i' % i for i in range(1000)]
+        h = self.logger.history(level=logging.DATA, until=299)
+        assert len(h) == 100
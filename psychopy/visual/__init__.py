@@ -62,6 +62,9 @@ from psychopy.visual.rect import Rect
 from psychopy.visual.circle import Circle
 
 from psychopy.visual.textbox import TextBox
+
+# helpers
+from psychopy.visual.preload import ImagePreloader
 """
 try:
     from psychopy.contrib.lazy_import import lazy_import
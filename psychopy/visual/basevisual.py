@@ -34,6 +34,7 @@ from psychopy.tools.monitorunittools import cm2pix, deg2pix, pix2cm, pix2deg, co
 from psychopy.visual.helpers import pointInPolygon, polygonsOverlap, setColor
 from psychopy.tools.typetools import float_uint8
 from psychopy.tools.arraytools import makeRadialMatrix
+from psychopy.visual.preload import takePreloadedImage, discardPreloadedImage
 from . import glob_vars
 
 import numpy
@@ -533,6 +534,9 @@ class TextureMixin(object):
 
         For grating stimuli (anything that needs multiple cycles) forcePOW2 should
         be set to be True. Otherwise the wrapping of the texture will not work.
+
+        Textures are shared with other stimuli through the window's
+        textureCache where possible (see :class:`~psychopy.visual.texturecache.TextureCache`).
         """
 
         """
@@ -554,6 +558,27 @@ class TextureMixin(object):
         allMaskParams = {'fringeWidth': 0.2, 'sd': 3}  # fringeWidth affects the proportion of the stimulus diameter that is devoted to the raised cosine.
         allMaskParams.update(maskParams)
 
+        #use the same texture as other stimuli if it has been made before
+        textureCache = getattr(stim.win, 'textureCache', None)
+        cacheKey = None
+        texName = id.value
+        if textureCache is not None:
+            textureCache.detach(id)  # don't overwrite a shared texture
+            #without shaders RGB textures are made with the stim's colors
+            if useShaders or pixFormat != GL.GL_RGB:
+                cacheKey = textureCache.getKey(tex, pixFormat, dataType, res,
+                    allMaskParams, interpolate, forcePOW2, useShaders)
+            if cacheKey is not None:
+                cached = textureCache.acquire(cacheKey, id)
+                if cached is not None:
+                    for name, value in cached.stimAttribs.items():
+                        setattr(stim, name, value)
+                    if type(tex) in [str, unicode, numpy.string_]:
+                        discardPreloadedImage(tex)  # not needed after all
+                    if id.value != texName:
+                        stim._needUpdate = True  # the list binds the old name
+                    return cached.wasLum
+
         if type(tex) == numpy.ndarray:
             #handle a numpy array
             #for now this needs to be an NxN intensity array
@@ -669,18 +694,22 @@ class TextureMixin(object):
 
         else:
             if type(tex) in [str, unicode, numpy.string_]:
-                # maybe tex is the name of a file:
-                if not os.path.isfile(tex):
+                # maybe tex is the name of a file (perhaps decoded already by an ImagePreloader):
+                im = takePreloadedImage(tex)
+                if im is not None:
+                    pass
+                elif not os.path.isfile(tex):
                     logging.error("Couldn't find image file '%s'; check path?" %(tex)); logging.flush()
                     raise OSError, "Couldn't find image file '%s'; check path? (tried: %s)" \
                         % (tex, os.path.abspath(tex))#ensure we quit
-                try:
-                    im = Image.open(tex)
-                    im = im.transpose(Image.FLIP_TOP_BOTTOM)
-                except IOError:
-                    logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
-                    raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
-                        % (tex, os.path.abspath(tex))#ensure we quit
+                else:
+                    try:
+                        im = Image.open(tex)
+                        im = im.transpose(Image.FLIP_TOP_BOTTOM)
+                    except IOError:
+                        logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
+                        raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
+                            % (tex, os.path.abspath(tex))#ensure we quit
             else:
                 # can't be a file; maybe its an image already in memory?
                 try:
@@ -717,7 +746,8 @@ class TextureMixin(object):
                     dataType=GL.GL_FLOAT
             elif pixFormat==GL.GL_RGB: #we want RGB and might need to convert from CMYK or Lm
                 #texture = im.tostring("raw", "RGB", 0, -1)
-                im = im.convert("RGBA")
+                if im.mode != "RGBA":
+                    im = im.convert("RGBA")
                 wasLum=False
             if dataType==GL.GL_FLOAT:
                 #convert from ubyte to float
@@ -795,9 +825,7 @@ class TextureMixin(object):
             if useShaders:#GL_GENERATE_MIPMAP was only available from OpenGL 1.4
                 GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
                 GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_GENERATE_MIPMAP, GL.GL_TRUE)
-                GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internalFormat,
-                    data.shape[1],data.shape[0], 0, # [JRG] for non-square, want data.shape[1], data.shape[0]
-                    pixFormat, dataType, texture)
+                self._texImage2D(data, internalFormat, pixFormat, dataType)
             else:#use glu
                 GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR_MIPMAP_NEAREST)
                 GL.gluBuild2DMipmaps(GL.GL_TEXTURE_2D, internalFormat,
@@ -805,21 +833,100 @@ class TextureMixin(object):
         else:
             GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,GL.GL_NEAREST)
             GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,GL.GL_NEAREST)
-            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internalFormat,
-                            data.shape[1],data.shape[0], 0, # [JRG] for non-square, want data.shape[1], data.shape[0]
-                            pixFormat, dataType, texture)
+            self._texImage2D(data, internalFormat, pixFormat, dataType)
         GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_MODULATE)#?? do we need this - think not!
         GL.glBindTexture(GL.GL_TEXTURE_2D, 0)#unbind our texture so that it doesn't affect other rendering
+
+        if cacheKey is not None:
+            #what a cache hit needs to set on the stim, as above
+            stimAttribs = {}
+            if type(tex) == numpy.ndarray:
+                stimAttribs['_tex1D'] = stim._tex1D
+            if wasImage:
+                stimAttribs['_origSize'] = stim._origSize
+            textureCache.add(cacheKey, id, data.nbytes, wasLum, stimAttribs)
+        if id.value != texName:
+            stim._needUpdate = True  # the list binds the old name
         return wasLum
 
+    def _texImage2D(self, data, internalFormat, pixFormat, dataType):
+        """glTexImage2D for the bound texture, through the window's
+        textureUploader (so large textures are streamed through PBOs)"""
+        textureUploader = getattr(self.win, 'textureUploader', None)
+        if textureUploader is not None:
+            textureUploader.texImage2D(data, internalFormat, pixFormat, dataType)
+        else:
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internalFormat,
+                            data.shape[1], data.shape[0], 0,
+                            pixFormat, dataType, data.ctypes)
+
+    def _deleteTexture(self, id):
+        """Delete the texture `id` (or stop using it, if it is shared through
+        the window's textureCache)"""
+        textureCache = getattr(self.win, 'textureCache', None)
+        if textureCache is None or not textureCache.release(id):
+            GL.glDeleteTextures(1, id)
+
+    def _bindShaderTextures(self, prog, prevState=None):
+        """Use shader program `prog` with the mask on texture unit 1 and the
+        texture on unit 0 (the state used by the display lists of GratingStim
+        and ImageStim).
+
+        When drawing a batch of stimuli (see `Window.batchAutoDraw`)
+        prevState is the (prog, texID, maskID) that is already bound, and
+        only what differs from it is bound again. Returns the number of
+        bindings made.
+        """
+        texID, maskID = self._texID.value, self._maskID.value
+        nBinds = 0
+        if prevState is None or prevState[0] != prog:
+            GL.glUseProgram(prog)
+            GL.glUniform1i(GL.glGetUniformLocation(prog, "texture"), 0) #set the texture to be texture unit 0
+            GL.glUniform1i(GL.glGetUniformLocation(prog, "mask"), 1)  # mask is texture unit 1
+            nBinds += 1
+        #mask
+        if prevState is None or prevState[2] != maskID:
+            GL.glActiveTexture(GL.GL_TEXTURE1)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, maskID)
+            GL.glEnable(GL.GL_TEXTURE_2D)#implicitly disables 1D
+            GL.glActiveTexture(GL.GL_TEXTURE0)
+            nBinds += 1
+        #main texture
+        if prevState is None or prevState[1] != texID:
+            GL.glBindTexture(GL.GL_TEXTURE_2D, texID)
+            GL.glEnable(GL.GL_TEXTURE_2D)
+            nBinds += 1
+        return nBinds
+
+    def _unbindShaderTextures(self):
+        """Undo :meth:`_bindShaderTextures`. Returns the number of bindings."""
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)#implicitly disables 1D
+        #main texture
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+
+        GL.glUseProgram(0)
+        return 3
+
+    def _batchKey(self):
+        """The GL state (shader program, texture ID, mask ID) that this
+        stimulus binds to be drawn, or None if it can't be drawn as part of a
+        batch (see `Window.batchAutoDraw`). Stimuli that support batching also
+        provide _prepareBatchDraw() and _drawBatched(win).
+        """
+        return None
+
     def clearTextures(self):
         """
         Clear all textures associated with the stimulus.
         As of v1.61.00 this is called automatically during garbage collection of
         your stimulus, so doesn't need calling explicitly by the user.
         """
-        GL.glDeleteTextures(1, self._texID)
-        GL.glDeleteTextures(1, self._maskID)
+        self._deleteTexture(self._texID)
+        self._deleteTexture(self._maskID)
 
     @attributeSetter
     def mask(self, value):
@@ -970,7 +1077,7 @@ class WindowMixin(object):
 
     def _selectWindow(self, win):
         #don't call switch if it's already the curr window
-        if win!=glob_vars.currWindow and win.winType=='pyglet':
+        if win!=glob_vars.currWindow and win.winType != 'pygame':
             win.winHandle.switch_to()
             glob_vars.currWindow = win
 
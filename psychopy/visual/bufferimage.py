@@ -12,6 +12,7 @@ RBGA object.`'''
 # up by the pyglet GL engine and have no effect.
 # Shaders will work but require OpenGL2.0 drivers AND PyOpenGL3.0+
 from __future__ import division
+import ctypes
 import pyglet
 pyglet.options['debug_gl'] = False
 GL = pyglet.gl
@@ -42,8 +43,9 @@ class BufferImageStim(ImageStim):
     the visible screen (front buffer) or hidden (back buffer).
 
     BufferImageStim aims to provide fast rendering, while still allowing dynamic
-    orientation, position, and opacity. It's fast to draw but slower to init (same
-    as an ImageStim).
+    orientation, position, and opacity. It's fast to draw, and with OpenGL 2.1+
+    also fast to init: the pixels are copied straight from the buffer into a
+    texture on the graphics card, and only read back if you call getImage().
 
     You specify the part of the screen to capture (in norm units), and optionally
     the stimuli themselves (as a list of items to be drawn). You get a screenshot
@@ -105,7 +107,7 @@ class BufferImageStim(ImageStim):
             flipVert :
                 vertically flip (mirror) the captured image; default = False
         """
-        # depends on: window._getRegionOfFrame
+        # depends on: window._getRegionBox, window._getRegionOfFrame
 
         #what local vars are defined (these are the init params) for use by __repr__
         self._initParams = dir()
@@ -128,14 +130,17 @@ class BufferImageStim(ImageStim):
             else:
                 raise(ValueError('Stim is not iterable in BufferImageStim. It should be a list of stimuli.'))
 
-        # take a screenshot of the buffer using win._getRegionOfFrame():
+        # take a screenshot of the buffer, on the graphics card if possible:
         glversion = pyglet.gl.gl_info.get_version()
         if glversion >= '2.1' and not sqPower2:
-            region = win._getRegionOfFrame(buffer=buffer, rect=rect)
+            region = None
+            capturedID, regionSize = self._captureToTexture(win, buffer,
+                                                            rect, interpolate)
         else:
             if not sqPower2:
                 logging.debug('BufferImageStim.__init__: defaulting to square power-of-2 sized image (%s)' % glversion )
             region = win._getRegionOfFrame(buffer=buffer, rect=rect, squarePower2=True)
+            regionSize = numpy.array(region.size)
         if stim:
             win.clearBuffer()
 
@@ -143,10 +148,17 @@ class BufferImageStim(ImageStim):
         if win.units in ['norm']:
             pos *= win.size/2.
 
-        size = region.size/win.size/2.
+        size = regionSize/win.size/2.
         super(BufferImageStim, self).__init__(win, image=region, units='pix', mask=mask, pos=pos,
                              size=size, interpolate=interpolate, name=name, autoLog=False)
-        self.size = region.size
+        if region is None:
+            # use the captured texture in place of the blank one
+            self._deleteTexture(self._texID)
+            self._texID = capturedID
+            self._origSize = tuple(regionSize)
+            self.isLumImage = False
+            self._updateList()
+        self.size = regionSize
 
         # to improve drawing speed, move these out of draw:
         self.desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
@@ -160,6 +172,56 @@ class BufferImageStim(ImageStim):
             logging.exp("Created %s = %s" %(self.name, str(self)))
             logging.exp('BufferImageStim %s: took %.1fms to initialize' % (name, 1000 * _clock.getTime()))
 
+    def _captureToTexture(self, win, buffer, rect, interpolate):
+        """Copy the rect of the buffer into a new RGBA texture (without it
+        leaving the graphics card). Returns the texture ID and its size"""
+        box, horz, vert = win._getRegionBox(rect)
+        if buffer == 'back':
+            GL.glReadBuffer(GL.GL_BACK)
+        else:
+            GL.glReadBuffer(GL.GL_FRONT)
+
+        texID = GL.GLuint()
+        GL.glGenTextures(1, ctypes.byref(texID))
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texID)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_REPEAT)
+        #same filtering as ImageStim would give an image
+        if interpolate:
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+            if win._haveShaders:
+                GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+            else:
+                GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR_MIPMAP_NEAREST)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_GENERATE_MIPMAP, GL.GL_TRUE)
+        else:
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+        GL.glCopyTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA,
+                            box[0], box[1], horz, vert, 0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        return texID, numpy.array((horz, vert))
+
+    def getImage(self):
+        """Returns the captured pixels as a PIL RGBA image. When they were
+        captured on the graphics card this reads them back from there (so it
+        is slow), and .image is None.
+        """
+        if self.image is not None:
+            return self.image
+        self._selectWindow(self.win)
+        horz, vert = map(int, self._origSize)
+        bufferDat = (GL.GLubyte * (4 * horz * vert))()
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
+        GL.glGetTexImage(GL.GL_TEXTURE_2D, 0,
+                         GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, bufferDat)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        try:
+            im = Image.fromstring(mode='RGBA', size=(horz, vert), data=bufferDat)
+        except:
+            im = Image.frombytes(mode='RGBA', size=(horz, vert), data=bufferDat)
+        return im.transpose(Image.FLIP_TOP_BOTTOM)
+
     @attributeSetter
     def flipHoriz(self, flipHoriz):
         """If set to True then the image will be flipped horizontally (left-to-right).
@@ -15,6 +15,8 @@ import pyglet
 pyglet.options['debug_gl'] = False
 import ctypes
 GL = pyglet.gl
+import copy
+import threading
 
 import psychopy  # so we can get the __path__
 from psychopy import logging
@@ -25,6 +27,8 @@ from psychopy.tools.attributetools import attributeSetter, setAttribute
 from psychopy.tools.arraytools import val2array
 from psychopy.tools.monitorunittools import cm2pix, deg2pix
 from psychopy.visual.basevisual import BaseVisualStim, ColorMixin, ContainerMixin
+from psychopy.visual.elementarray import ElementArrayStim
+from psychopy.visual.grating import GratingStim
 
 import numpy
 from numpy import pi
@@ -50,6 +54,14 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
 
     If further customisation is required, then the DotStim should be subclassed and its
     _update_dotsXY and _newDotsXY methods overridden.
+
+    The dots can also follow a precomputed, seeded trajectory (see
+    :meth:`precompute` and :attr:`trajectory`), so that drawing each frame only
+    looks up stored positions and the exact stimulus can be replayed.
+
+    If the `element` is a GratingStim (e.g. a Gabor) all the dots are drawn in a
+    single call, as an ElementArrayStim using the element's texture and mask
+    (see :attr:`batchElements`).
     """
     def __init__(self,
                  win,
@@ -73,7 +85,8 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
                  signalDots='same',
                  noiseDots='direction',
                  name=None,
-                 autoLog=None):
+                 autoLog=None,
+                 batchElements=True):
         """
         :Parameters:
 
@@ -98,6 +111,13 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
         self.fieldShape = fieldShape
         self.__dict__['dir'] = dir
         self.speed = speed
+        self._rng = numpy.random  # or a RandomState while precomputing
+        self._trajectory = None
+        self.__dict__['trajectory'] = None
+        self._elementArray = None
+        self._elementArrayKey = None
+        self._elementArrayState = None
+        self.batchElements = batchElements
         self.element = element
         self.dotLife = dotLife
         self.signalDots = signalDots
@@ -193,10 +213,22 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
         DotStim assumes that the element uses pixels as units.
         ``None`` defaults to dots.
 
-        See `ElementArrayStim` for a faster implementation of this idea.
+        See `ElementArrayStim` for a faster implementation of this idea (which
+        is used automatically for GratingStim elements, see `batchElements`).
         """
         self.__dict__['element'] = element
 
+    @attributeSetter
+    def batchElements(self, value):
+        """True or False. If True (the default) and the `element` is a
+        GratingStim drawn with shaders, all the dots are drawn in one call,
+        as an ElementArrayStim with the element's texture, mask, size, sf,
+        ori, phase, color and opacity (changes to those are picked up at
+        the next draw). If False, or for other types of element, the element
+        is moved to each dot and drawn in turn.
+        """
+        self.__dict__['batchElements'] = value
+
     @attributeSetter
     def fieldPos(self, pos):
         """Specifying the location of the centre of the stimulus using a :ref:`x,y-pair <attrib-xy>`.
@@ -290,7 +322,10 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
             win=self.win
         self._selectWindow(win)
 
-        self._update_dotsXY()
+        if self._trajectory is not None:
+            self._replay_dotsXY()
+        else:
+            self._update_dotsXY()
 
         GL.glPushMatrix()#push before drawing, pop after
 
@@ -314,6 +349,8 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
             GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
             GL.glDrawArrays(GL.GL_POINTS, 0, self.nDots)
             GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        elif self._canBatchElement():
+            self._drawElementArray()
         else:
             #we don't want to do the screen scaling twice so for each dot subtract the screen centre
             initialDepth=self.element.depth
@@ -323,6 +360,148 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
             self.element.setDepth(initialDepth)#reset depth before going to next frame
         GL.glPopMatrix()
 
+    def precompute(self, nFrames, seed=None, fileName=None, background=False):
+        """Compute the positions of the dots for the next `nFrames` draws in
+        advance, from a new random state seeded with `seed`, and follow them
+        when drawing (see :attr:`trajectory`).
+
+        The same seed and settings (nDots, coherence, dir, speed, dotLife,
+        signalDots, noiseDots, fieldShape) give the same trajectory, so a
+        trial can be replayed exactly. Changes to those settings after this
+        call don't affect the trajectory.
+
+        :Parameters:
+
+            fileName : None or a file name (.npy)
+                the trajectory is written to a memory-mapped file (which can
+                be given to :attr:`trajectory` or numpy.load later) rather than
+                being held in memory
+            background : True or *False*
+                compute the trajectory in a thread and return straight away.
+                Drawing waits for any frame that isn't ready yet.
+
+        Returns the (nFrames x nDots x 2) float32 array of positions.
+        """
+        shape = (int(nFrames), self.nDots, 2)
+        if fileName is None:
+            frames = numpy.zeros(shape, 'f4')
+        else:
+            frames = numpy.lib.format.open_memmap(fileName, mode='w+',
+                                                  dtype='f4', shape=shape)
+        #a copy of this stim, with its own dots and random state, does the work
+        sim = copy.copy(self)
+        sim._trajectory = None
+        sim._rng = rng = numpy.random.RandomState(seed)
+        sim._verticesBase = sim._newDotsXY(self.nDots)
+        sim._dotsLife = abs(self.dotLife)*rng.rand(self.nDots)
+        sim._signalDots = self._signalDots.copy()
+        sim._dotsDir = rng.rand(self.nDots)*2*pi
+        sim._dotsDir[sim._signalDots] = self.dir*pi/180
+
+        trajectory = _DotTrajectory(frames, nReady=0)
+        if background:
+            thread = threading.Thread(target=trajectory.compute, args=(sim,),
+                                      name='DotTrajectory')
+            thread.daemon = True
+            thread.start()
+        else:
+            trajectory.compute(sim)
+        self._trajectory = trajectory
+        self.__dict__['trajectory'] = frames
+        return frames
+
+    @attributeSetter
+    def trajectory(self, value):
+        """None, or a (frames x nDots x 2) array of dot positions (e.g. from
+        :meth:`precompute`), or the name of a .npy file holding one (which is
+        memory-mapped rather than loaded).
+
+        While set, each draw shows the next frame of positions instead of
+        updating the dots. Positions are relative to the field (-0.5 to 0.5
+        spans fieldSize) so fieldPos and fieldSize still apply. After the last
+        frame the dots continue to be updated as usual, from the last
+        positions. Setting the value again replays it from the start.
+        """
+        if value is None:
+            #carry on from the current positions (as a writeable copy)
+            self._verticesBase = numpy.array(self._verticesBase, 'd')
+            self._trajectory = None
+            self.__dict__['trajectory'] = None
+            return
+        if isinstance(value, basestring):
+            value = numpy.load(value, mmap_mode='r')
+        value = numpy.asarray(value)
+        if value.ndim != 3 or value.shape[1:] != (self.nDots, 2):
+            raise ValueError("DotStim.trajectory should have shape "
+                             "(nFrames, %i, 2), not %s" % (self.nDots, value.shape))
+        self._trajectory = _DotTrajectory(value)
+        self.__dict__['trajectory'] = value
+    def setTrajectory(self, value, log=None):
+        """Usually you can use 'stim.attribute = value' syntax instead,
+        but use this method if you need to suppress the log message
+        """
+        setAttribute(self, 'trajectory', value, log)
+
+    def _replay_dotsXY(self):
+        """Take the positions of the dots from the next frame of the trajectory
+        """
+        trajectory = self._trajectory
+        if trajectory.frameN >= len(trajectory.frames):
+            logging.warning("%s reached the end of its trajectory; updating "
+                            "the dots from here on" % self.name)
+            self.setTrajectory(None, log=False)
+            self._update_dotsXY()
+            return
+        self._verticesBase = trajectory.getFrame(trajectory.frameN)
+        trajectory.frameN += 1
+        self._updateVertices()
+
+    def _canBatchElement(self):
+        """Whether the element can be drawn at all dots by an ElementArrayStim
+        """
+        return (self.batchElements and self.win.winType != 'pygame' and
+                isinstance(self.element, GratingStim) and
+                self.element._batchKey() is not None)  # plain, with shaders
+
+    def _drawElementArray(self):
+        """Draw the element at every dot with one ElementArrayStim, which is
+        (re)created when the element's texture, mask or units change
+        """
+        element = self.element
+        key = (element.tex, element.mask, element.texRes, element.interpolate,
+               element.maskParams, element.units, self.nDots)
+        if not _sameValues(key, self._elementArrayKey):
+            self._elementArray = ElementArrayStim(self.win, units=element.units,
+                nElements=self.nDots, xys=numpy.zeros([self.nDots, 2]),
+                elementTex=element.tex, elementMask=element.mask,
+                texRes=element.texRes, interpolate=element.interpolate,
+                maskParams=element.maskParams, autoLog=False)
+            self._elementArrayKey = key
+            self._elementArrayState = None
+        array = self._elementArray
+
+        #as for element.draw(); sfs are cycles per element for these units
+        if element.units in ['norm', 'pix', 'height']:
+            sfs = element._cycles
+        else:
+            sfs = element.sf
+        rgb = element._getDesiredRGB(element.rgb, element.colorSpace,
+                                     element.contrast)
+        state = (element.ori, element.size, sfs, element.phase, rgb,
+                 element.opacity)
+        state = tuple(tuple(numpy.ravel(value)) for value in state)
+        if state != self._elementArrayState:
+            array.setOris(element.ori, log=False)
+            array.setSizes(element.size, log=False)
+            array.setSfs(sfs, log=False)
+            array.setPhases(element.phase, log=False)
+            array.setColors(numpy.array(rgb)*2 - 1, colorSpace='rgb', log=False)
+            array.setOpacities(element.opacity, log=False)
+            self._elementArrayState = state
+        #the same positions that element.setPos() is given by the loop in draw()
+        array.setXYs(self.verticesPix + self.fieldPos, log=False)
+        array.draw()
+
     def _newDotsXY(self, nDots):
         """Returns a uniform spread of dots, according to the fieldShape and fieldSize
 
@@ -331,14 +510,13 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
             dots = self._newDots(nDots)
 
         """
-        if self.fieldShape=='circle':#make more dots than we need and only use those that are within circle
-            while True:#repeat until we have enough
-                new=numpy.random.uniform(-1, 1, [nDots*2,2])#fetch twice as many as needed
-                inCircle= (numpy.hypot(new[:,0],new[:,1])<1)
-                if sum(inCircle)>=nDots:
-                    return new[inCircle,:][:nDots,:]*0.5
+        if self.fieldShape=='circle':
+            #uniform over the circle (sqrt of the radius) without rejection sampling
+            radii = numpy.sqrt(self._rng.uniform(0, 1, nDots))*0.5
+            thetas = self._rng.uniform(0, 2*pi, nDots)
+            return numpy.column_stack([radii*numpy.cos(thetas), radii*numpy.sin(thetas)])
         else:
-            return numpy.random.uniform(-0.5, 0.5, [nDots,2])
+            return self._rng.uniform(-0.5, 0.5, [nDots,2])
 
     def _update_dotsXY(self):
         """
@@ -361,13 +539,13 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
         if self.signalDots =='different':
             #  **up to version 1.70.00 this was the other way around, not in keeping with Scase et al**
             #noise and signal dots change identity constantly
-            numpy.random.shuffle(self._dotsDir)
+            self._rng.shuffle(self._dotsDir)
             self._signalDots = (self._dotsDir==(self.dir*pi/180))#and then update _signalDots from that
 
         #update the locations of signal and noise
         if self.noiseDots=='walk':
             # noise dots are ~self._signalDots
-            self._dotsDir[~self._signalDots] = numpy.random.rand((~self._signalDots).sum())*pi*2
+            self._dotsDir[~self._signalDots] = self._rng.rand((~self._signalDots).sum())*pi*2
             #then update all positions from dir*speed
             self._verticesBase[:,0] += self.speed*numpy.reshape(numpy.cos(self._dotsDir),(self.nDots,))
             self._verticesBase[:,1] += self.speed*numpy.reshape(numpy.sin(self._dotsDir),(self.nDots,))# 0 radians=East!
@@ -395,8 +573,62 @@ class DotStim(BaseVisualStim, ColorMixin, ContainerMixin):
             dead = dead + (numpy.hypot(normXY[:,0],normXY[:,1])>1) #add out-of-bounds to those that need replacing
 
         #update any dead dots
-        if sum(dead):
-            self._verticesBase[dead,:] = self._newDotsXY(sum(dead))
+        nDead = dead.sum()
+        if nDead:
+            self._verticesBase[dead,:] = self._newDotsXY(nDead)
 
         #update the pixel XY coordinates in pixels (using _BaseVisual class)
         self._updateVertices()
+
+
+def _sameValues(values, others):
+    """Whether two sequences hold the same (or equal non-array) values"""
+    if others is None or len(values) != len(others):
+        return False
+    for value, other in zip(values, others):
+        if value is other:
+            continue
+        if (type(value) is not type(other) or
+                isinstance(value, numpy.ndarray) or value != other):
+            return False
+    return True
+
+
+class _DotTrajectory(object):
+    """The frames of a :class:`DotStim` trajectory, and how far they have been
+    computed (frames computed in a background thread become available as
+    nReady grows) and drawn (frameN)
+    """
+    def __init__(self, frames, nReady=None):
+        self.frames = frames
+        if nReady is None:
+            nReady = len(frames)
+        self.nReady = nReady
+        self.frameN = 0
+        self._cond = threading.Condition()
+    def compute(self, sim):
+        """Fill the frames by updating `sim` (a copy of the DotStim) once per
+        frame"""
+        try:
+            for frameN in range(len(self.frames)):
+                sim._update_dotsXY()
+                self.frames[frameN] = sim._verticesBase
+                self._cond.acquire()
+                self.nReady = frameN + 1
+                self._cond.notifyAll()
+                self._cond.release()
+        finally:
+            self._cond.acquire()
+            self.nReady = len(self.frames)  # (even if stopped by an error)
+            self._cond.notifyAll()
+            self._cond.release()
+        if hasattr(self.frames, 'flush'):
+            self.frames.flush()
+    def getFrame(self, frameN):
+        """The positions for frame frameN, waiting for them if needed"""
+        if frameN >= self.nReady:
+            self._cond.acquire()
+            while frameN >= self.nReady:
+                self._cond.wait()
+            self._cond.release()
+        return self.frames[frameN]
@@ -32,6 +32,30 @@ from . import glob_vars
 
 import numpy
 
+#per-element attributes of the instanced vertex shader (shaders.vertElementArray)
+#as (name, nValues), in their order in ElementArrayStim._instanceData
+_instanceAttribs = (('xy', 2), ('ori', 1), ('size', 2), ('sf', 2), ('phase', 2),
+                    ('rgba', 4))
+#units that are a fixed scaling of pixels (so the shader can position elements)
+_linearUnits = ('pix', 'pixels', 'norm', 'height', 'cm', 'deg', 'degs')
+#the columns of _instanceData holding the values needed for each kind of update
+_instanceColumns = {'vertices': slice(0, 5), 'texCoords': slice(5, 9),
+                    'colors': slice(9, 13)}
+#the kinds of update needed after a change of each per-element attribute
+_attribUpdates = {'xys': ('vertices',), 'oris': ('vertices',),
+                  'sizes': ('vertices', 'texCoords'), 'sfs': ('texCoords',),
+                  'phases': ('texCoords',), 'opacities': ('colors',),
+                  'contrs': ('colors',), 'colors': ('colors',)}
+
+class _ElementColors(object):
+    """The colors of a subset of the elements of an ElementArrayStim, for
+    helpers.setColor to convert (see ElementArrayStim.setColors)"""
+    def __init__(self, win, colors, colorSpace):
+        self.win = win
+        self.colors = colors
+        self.colorSpace = colorSpace
+
+
 class ElementArrayStim(MinimalStim, TextureMixin):
     """
     This stimulus class defines a field of elements whose behaviour can be independently
@@ -41,6 +65,10 @@ class ElementArrayStim(MinimalStim, TextureMixin):
     This stimulus can draw thousands of elements without dropping a frame, but in order
     to achieve this performance, uses several OpenGL extensions only available on modern
     graphics cards (supporting OpenGL2.0). See the ElementArray demo.
+
+    Where the graphics card supports instanced drawing the elements are drawn
+    in a single call, with their quads computed by a vertex shader (see
+    :attr:`useInstancing`), so that even 100,000 elements can be animated.
     """
     def __init__(self,
                  win,
@@ -103,14 +131,21 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         self.verticesBase = xys
         self._needVertexUpdate=True
         self._needColorUpdate=True
+        #elements changed by partial updates (e.g. setOris(vals, indices=idx))
+        self._dirtyElements = {'vertices': [], 'texCoords': [], 'colors': []}
+        self._instanceData = None
+        self._instanceVBO = None
+        self._cornerVBO = None
+        self._drawnInstanced = False
         self.useShaders=True
         self.interpolate=interpolate
         self.__dict__['fieldDepth'] = fieldDepth
         self.__dict__['depths'] = depths
-        if self.win.winType != 'pyglet':
+        if self.win.winType == 'pygame':
             raise TypeError('ElementArrayStim requires a pyglet context')
         if not self.win._haveShaders:
             raise Exception("ElementArrayStim requires shaders support and floating point textures")
+        self.__dict__['useInstancing'] = self.win._haveInstancing
 
         self.colorSpace=colorSpace
         if rgbs!=None:
@@ -148,43 +183,49 @@ class ElementArrayStim(MinimalStim, TextureMixin):
 
     def _selectWindow(self, win):
         #don't call switch if it's already the curr window
-        if win!=glob_vars.currWindow and win.winType=='pyglet':
+        if win!=glob_vars.currWindow and win.winType != 'pygame':
             win.winHandle.switch_to()
             glob_vars.currWindow = win
 
-    def _makeNx2(self, value, acceptedInput=['scalar', 'Nx1', 'Nx2']):
+    def _makeNx2(self, value, acceptedInput=['scalar', 'Nx1', 'Nx2'], n=None):
         """Helper function to change input to Nx2 arrays
         'scalar': int/float, 1x1 and 2x1.
         'Nx1': vector of values for each element.
-        'Nx2': x-y pair for each element"""
+        'Nx2': x-y pair for each element
+        N is nElements unless n is given (e.g. for a subset of elements)"""
+        if n is None:
+            n = self.nElements
 
         # Make into an array if not already
         value = numpy.array(value, dtype=float)
 
         # Check shape and transform if not appropriate
         if 'scalar' in acceptedInput and value.shape in [(),(1,),(2,)]:
-            value = numpy.resize(value, [self.nElements,2])
-        elif 'Nx1' in acceptedInput and value.shape in [(self.nElements,), (self.nElements,1)]:
-            value.shape=(self.nElements,1)#set to be 2D
+            value = numpy.resize(value, [n,2])
+        elif 'Nx1' in acceptedInput and value.shape in [(n,), (n,1)]:
+            value.shape=(n,1)#set to be 2D
             value = value.repeat(2,1) #repeat once on dim 1
-        elif 'Nx2' in acceptedInput and value.shape == (self.nElements,2):
+        elif 'Nx2' in acceptedInput and value.shape == (n,2):
             pass  # all is good
         else:
             raise ValueError('New value should be one of these: ' + str(acceptedInput))
 
         return value
-    def _makeNx1(self, value, acceptedInput=['scalar', 'Nx1']):
+    def _makeNx1(self, value, acceptedInput=['scalar', 'Nx1'], n=None):
         """Helper function to change input to Nx1 arrays
         'scalar': int, 1x1 and 2x1.
-        'Nx1': vector of values for each element."""
+        'Nx1': vector of values for each element.
+        N is nElements unless n is given (e.g. for a subset of elements)"""
+        if n is None:
+            n = self.nElements
 
          # Make into an array if not already
         value = numpy.array(value, dtype=float)
 
         # Check shape and transform if not appropriate
         if 'scalar' in acceptedInput and value.shape in [(),(1,)]:
-            value = value.repeat(self.nElements)
-        elif 'Nx1' in acceptedInput and value.shape in [(self.nElements,), (self.nElements,1)]:
+            value = value.repeat(n)
+        elif 'Nx1' in acceptedInput and value.shape in [(n,), (n,1)]:
             pass  # all is good
         else:
             raise ValueError('New value should be one of these: ' + str(acceptedInput))
@@ -228,10 +269,19 @@ class ElementArrayStim(MinimalStim, TextureMixin):
             self.__dict__['xys'] = self._makeNx2(value, ['Nx2'])
         self._xysAsNone = value is None  # to keep a record if we are to alter things later.
         self._needVertexUpdate=True
-    def setXYs(self, value=None, operation='', log=None):
+    def setXYs(self, value=None, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message"""
-        setAttribute(self, 'xys', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            setAttribute(self, 'xys', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('xys', value, indices, operation, log)
+            self._xysAsNone = False
 
     @attributeSetter
     def fieldShape(self, value):
@@ -254,11 +304,18 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         """
         self.__dict__['oris'] = self._makeNx1(value)  # set self.oris
         self._needVertexUpdate = True
-    def setOris(self, value, operation='', log=None):
+    def setOris(self, value, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
+        but use this method if you need to suppress the log message.
 
-        setAttribute(self, 'oris', value, log, operation)  # call attributeSetter
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            setAttribute(self, 'oris', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('oris', value, indices, operation, log)
 
     @attributeSetter
     def sfs(self, value):
@@ -276,11 +333,19 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         """
         self.__dict__['sfs'] = self._makeNx2(value)  # set self.sfs
         self._needTexCoordUpdate = True
-    def setSfs(self, value, operation='', log=None):
+    def setSfs(self, value, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
-        value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
-        setAttribute(self, 'sfs', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
+            setAttribute(self, 'sfs', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('sfs', value, indices, operation, log)
 
     @attributeSetter
     def opacities(self, value):
@@ -291,10 +356,18 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         """
         self.__dict__['opacities'] = self._makeNx1(value)
         self._needColorUpdate=True
-    def setOpacities(self,value,operation='', log=None):
+    def setOpacities(self,value,operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
-        setAttribute(self, 'opacities', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            setAttribute(self, 'opacities', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('opacities', value, indices, operation, log)
 
     @attributeSetter
     def sizes(self, value):
@@ -309,11 +382,19 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         self.__dict__['sizes'] = self._makeNx2(value)
         self._needVertexUpdate = True
         self._needTexCoordUpdate = True
-    def setSizes(self, value, operation='', log=None):
+    def setSizes(self, value, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
-        value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
-        setAttribute(self, 'sizes', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
+            setAttribute(self, 'sizes', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('sizes', value, indices, operation, log)
 
     @attributeSetter
     def phases(self, value):
@@ -327,11 +408,19 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         """
         self.__dict__['phases'] = self._makeNx2(value)
         self._needTexCoordUpdate = True
-    def setPhases(self, value, operation='', log=None):
+    def setPhases(self, value, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
-        value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
-        setAttribute(self, 'phases', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            value = self._makeNx2(value)  # in the case of Nx1 list/array, setAttribute would fail if not this
+            setAttribute(self, 'phases', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('phases', value, indices, operation, log)
     def setRgbs(self,value,operation=''):
         """DEPRECATED (as of v1.74.00). Please use setColors() instead
         """
@@ -361,9 +450,18 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         Keeping this exception in mind, see :ref:`colorspaces` for more info."""
         self.__dict__['colorSpace'] = colorSpace
 
-    def setColors(self, color, colorSpace=None, operation='', log=None):
+    def setColors(self, color, colorSpace=None, operation='', log=None,
+                  indices=None):
         """See ``color`` for more info on the color parameter  and
-        ``colorSpace`` for more info in the colorSpace parameter."""
+        ``colorSpace`` for more info in the colorSpace parameter.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed (the color must then be numeric and
+        in the current colorSpace), and only they are recomputed and
+        uploaded at the next draw."""
+        if indices is not None:
+            self._setElementColors(color, colorSpace, indices, operation, log)
+            return
         setColor(self, color, colorSpace=colorSpace, operation=operation,
                     rgbAttrib='rgbs', #or 'fillRGB' etc
                     colorAttrib='colors',
@@ -382,6 +480,81 @@ class ElementArrayStim(MinimalStim, TextureMixin):
             raise ValueError("New value for setRgbs should be either Nx1, Nx3 or a single value")
         self._needColorUpdate=True
 
+    def _setElementColors(self, color, colorSpace, indices, operation, log):
+        """setColors() for the elements selected by indices only"""
+        if colorSpace is None:
+            colorSpace = self.colorSpace
+        if colorSpace != self.colorSpace or colorSpace in ['named', 'hex'] or \
+                isinstance(color, basestring):
+            raise ValueError("Colors of some elements can only be set with "
+                             "numeric values in the current colorSpace (%s)"
+                             % self.colorSpace)
+        idx = numpy.arange(self.nElements)[indices].reshape(-1)
+        #colors may be one for all elements, so make them one per element
+        colors = numpy.array(self.colors, float)
+        if colors.shape in [(), (1,), (3,)]:
+            colors = numpy.resize(colors, [self.nElements, 3])
+        elif colors.shape in [(self.nElements,), (self.nElements, 1)]:
+            colors = colors.reshape([self.nElements, 1]).repeat(3, 1)
+        #let setColor convert (and apply the operation to) just these colors
+        subset = _ElementColors(self.win, colors[idx], colorSpace)
+        setColor(subset, color, colorSpace=colorSpace, operation=operation,
+                 rgbAttrib='rgbs', colorAttrib='colors',
+                 colorSpaceAttrib='colorSpace')
+        colors[idx] = subset.colors
+        self.__dict__['colors'] = colors
+        self.rgbs[idx] = subset.rgbs
+        logAttrib(self, log, 'colors',
+                  value='%s (%s) at %s' % (subset.colors, colorSpace, idx))
+        self._markDirty('colors', idx)
+
+    def _setElements(self, attrib, value, indices, operation='', log=None):
+        """Set (or apply the operation to) an Nx1 or Nx2 attribute for the
+        elements selected by indices only, and mark just those elements as
+        needing an update
+        """
+        idx = numpy.arange(self.nElements)[indices].reshape(-1)
+        current = self.__dict__[attrib]
+        if current.ndim == 2:
+            value = self._makeNx2(value, n=len(idx))
+        else:
+            value = self._makeNx1(value, n=len(idx)).reshape(len(idx))
+        if operation in ('', None):
+            pass
+        elif operation == '+':
+            value = current[idx] + value
+        elif operation == '*':
+            value = current[idx] * value
+        elif operation == '-':
+            value = current[idx] - value
+        elif operation == '/':
+            value = current[idx] / value
+        elif operation == '**':
+            value = current[idx] ** value
+        elif operation == '%':
+            value = current[idx] % value
+        else:
+            raise ValueError('Unsupported value "%s" for operation when '
+                             'setting %s' % (operation, attrib))
+        current[idx] = value
+        logAttrib(self, log, attrib, value='%s at %s' % (value, idx))
+        for kind in _attribUpdates[attrib]:
+            self._markDirty(kind, idx)
+
+    def _markDirty(self, kind, idx):
+        """Note that elements idx need their `kind` ('vertices', 'texCoords'
+        or 'colors') recomputed"""
+        self._dirtyElements[kind].append(idx)
+
+    def _popDirty(self, kind):
+        """The (sorted) indices of elements needing their `kind` recomputed
+        since the last update, which are then forgotten"""
+        dirty = self._dirtyElements[kind]
+        if not dirty:
+            return numpy.zeros(0, int)
+        self._dirtyElements[kind] = []
+        return numpy.unique(numpy.concatenate(dirty))
+
     @attributeSetter
     def contrs(self, value):
         """The contrasts of the elements, ranging -1 to +1. Should either be:
@@ -393,10 +566,18 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         """
         self.__dict__['contrs'] = self._makeNx1(value)
         self._needColorUpdate = True
-    def setContrs(self, value, operation='', log=None):
+    def setContrs(self, value, operation='', log=None, indices=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
-        but use this method if you need to suppress the log message."""
-        setAttribute(self, 'contrs', value, log, operation)  # call attributeSetter
+        but use this method if you need to suppress the log message.
+
+        If `indices` is given (element indices, a slice or a boolean mask)
+        only those elements are changed, and only they are recomputed and
+        uploaded at the next draw.
+        """
+        if indices is None:
+            setAttribute(self, 'contrs', value, log, operation)  # call attributeSetter
+        else:
+            self._setElements('contrs', value, indices, operation, log)
 
     @attributeSetter
     def fieldPos(self, value):
@@ -428,6 +609,30 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         but use this method if you need to suppress the log message."""
         setAttribute(self, 'fieldSize', value, log, operation)  # call attributeSetter
 
+    @attributeSetter
+    def useInstancing(self, value):
+        """Draw the elements with a single instanced call (default if the
+        graphics card supports it). The values of each element are then
+        uploaded as float32 buffers only when they change, and the vertices,
+        texture coordinates and colors are computed by a vertex shader
+        instead of by numpy.
+
+        The original (CPU) rendering path is used if this is False or if the
+        units aren't a fixed scaling of pixels ('degFlat' and 'degFlatPos')
+        or the elements have different depths. In the instanced path
+        `verticesPix` is not updated.
+        """
+        if value and not self.win._haveInstancing:
+            logging.warning("Instanced drawing was requested but isn't "
+                            "available. It needs the GL_ARB_instanced_arrays "
+                            "and GL_ARB_draw_instanced extensions")
+            value = False
+        self.__dict__['useInstancing'] = value
+    def setUseInstancing(self, value=True, log=None):
+        """Usually you can use 'stim.attribute = value' syntax instead,
+        but use this method if you need to suppress the log message."""
+        setAttribute(self, 'useInstancing', value, log)
+
     def draw(self, win=None):
         """
         Draw the stimulus in its relevant window. You must call
@@ -439,12 +644,29 @@ class ElementArrayStim(MinimalStim, TextureMixin):
             win=self.win
         self._selectWindow(win)
 
+        if self.useInstancing:
+            params = self._instancingParams()
+            if params is not None:
+                self._drawInstanced(*params)
+                return
+        if self._drawnInstanced:  # the CPU-side arrays weren't kept up to date
+            self._needVertexUpdate = True
+            self._needColorUpdate = True
+            self._needTexCoordUpdate = True
+            self._drawnInstanced = False
+
         if self._needVertexUpdate:
             self._updateVertices()
+        elif self._dirtyElements['vertices']:
+            self._updateVertices(self._popDirty('vertices'))
         if self._needColorUpdate:
             self.updateElementColors()
+        elif self._dirtyElements['colors']:
+            self.updateElementColors(self._popDirty('colors'))
         if self._needTexCoordUpdate:
             self.updateTextureCoords()
+        elif self._dirtyElements['texCoords']:
+            self.updateTextureCoords(self._popDirty('texCoords'))
 
         #scale the drawing frame and get to centre of field
         GL.glPushMatrix()#push before drawing, pop after
@@ -498,21 +720,155 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         GL.glPopClientAttrib()
         GL.glPopMatrix()
 
-    def _updateVertices(self):
-        """Sets Stim.verticesPix from fieldPos and
+    def _instancingParams(self):
+        """Returns (pixScale, depth) for the instanced vertex shader, or None
+        if the elements can't be drawn that way (non-linear units or
+        elements at different depths)
+        """
+        if self.units not in _linearUnits:
+            return None
+        depths = numpy.unique(numpy.asarray(self.depths, 'd'))
+        if len(depths) != 1:
+            return None
+        #pixels per unit in x and y
+        pixScale = convertToPix(vertices=numpy.ones(2), pos=numpy.zeros(2),
+                                units=self.units, win=self.win)
+        return pixScale, depths[0] + self.fieldDepth
+
+    def _updateInstanceData(self):
+        """Copy the per-element values that changed into self._instanceData
+        (float32, one row per element, columns as in _instanceAttribs) and
+        upload the range of rows that changed to the graphics card
+        """
+        N = self.nElements
+        data = self._instanceData
+        #if the last draw was by the CPU path then it consumed the changes
+        if data is None or len(data) != N or not self._drawnInstanced:
+            data = self._instanceData = numpy.zeros([N, 13], 'f4')
+            self._needVertexUpdate = True
+            self._needColorUpdate = True
+            self._needTexCoordUpdate = True
+        first, last = N, 0  # the range of rows to upload
+        for kind, updateAll in [('vertices', self._needVertexUpdate),
+                                ('texCoords', self._needTexCoordUpdate),
+                                ('colors', self._needColorUpdate)]:
+            if updateAll:
+                idx = slice(None)
+                first, last = 0, N
+                self._dirtyElements[kind] = []
+            else:
+                idx = self._popDirty(kind)
+                if not len(idx):
+                    continue
+                first, last = min(first, idx[0]), max(last, idx[-1] + 1)
+            data[idx, _instanceColumns[kind]] = self._instanceValues(kind, idx)
+        self._needVertexUpdate = False
+        self._needTexCoordUpdate = False
+        self._needColorUpdate = False
+        if first >= last:
+            return
+
+        if self._instanceVBO is None:
+            self._instanceVBO = GL.GLuint()
+            GL.glGenBuffers(1, ctypes.byref(self._instanceVBO))
+            #the corners of each quad, in the order of _updateVertices
+            corners = numpy.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], 'f4')
+            self._cornerVBO = GL.GLuint()
+            GL.glGenBuffers(1, ctypes.byref(self._cornerVBO))
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._cornerVBO)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, corners.nbytes,
+                            corners.ctypes.data, GL.GL_STATIC_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._instanceVBO)
+        if first == 0 and last == N:  # (re)allocate
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes, data.ctypes.data,
+                            GL.GL_DYNAMIC_DRAW)
+        else:
+            rowBytes = data.strides[0]
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, first*rowBytes,
+                               (last - first)*rowBytes, data[first:last].ctypes.data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def _instanceValues(self, kind, idx):
+        """The columns of _instanceData for `kind` of update for elements idx"""
+        if kind == 'vertices':
+            return numpy.column_stack([self.xys[idx], self.oris[idx],
+                                       self.sizes[idx]])
+        elif kind == 'texCoords':
+            return numpy.column_stack([self.sfs[idx], self.phases[idx]])
+        else:
+            return self._elementRGBAs(idx)
+
+    def _drawInstanced(self, pixScale, depth):
+        """Draw all elements with one instanced call of a quad (4 corners),
+        with the per-element values as instanced attributes of the
+        shaders.vertElementArray vertex shader
+        """
+        self._updateInstanceData()
+        prog = self.win._progElementArray
+
+        GL.glPushMatrix()
+        self.win.setScale('pix')
+        self._bindShaderTextures(prog)
+        GL.glUniform2f(GL.glGetUniformLocation(prog, "fieldPos"),
+                       self.fieldPos[0], self.fieldPos[1])
+        GL.glUniform2f(GL.glGetUniformLocation(prog, "pixScale"),
+                       pixScale[0], pixScale[1])
+        GL.glUniform1f(GL.glGetUniformLocation(prog, "depth"), depth)
+        #as in updateTextureCoords, sf is per element only for these units
+        sfBySize = self.units not in ['norm', 'pix', 'height']
+        GL.glUniform1f(GL.glGetUniformLocation(prog, "sfBySize"), sfBySize)
+
+        #per-vertex corners (bound to attribute 0 by Window._setupShaders)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._cornerVBO)
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 2, GL.GL_FLOAT, GL.GL_FALSE, 0, None)
+        #per-element values, advancing once per instance
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._instanceVBO)
+        stride = self._instanceData.strides[0]
+        offset = 0
+        locs = []
+        for name, nValues in _instanceAttribs:
+            loc = GL.glGetAttribLocation(prog, name)
+            if loc >= 0:
+                GL.glEnableVertexAttribArray(loc)
+                GL.glVertexAttribPointer(loc, nValues, GL.GL_FLOAT, GL.GL_FALSE,
+                                         stride, ctypes.c_void_p(offset))
+                GL.glVertexAttribDivisorARB(loc, 1)
+                locs.append(loc)
+            offset += nValues*4
+        GL.glDrawArraysInstancedARB(GL.GL_TRIANGLE_FAN, 0, 4, self.nElements)
+
+        for loc in locs:
+            GL.glVertexAttribDivisorARB(loc, 0)
+            GL.glDisableVertexAttribArray(loc)
+        GL.glDisableVertexAttribArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        self._unbindShaderTextures()
+        GL.glPopMatrix()
+        self._drawnInstanced = True
+
+    def _updateVertices(self, indices=None):
+        """Sets Stim.verticesPix from fieldPos and the xys, oris and sizes of
+        the elements (or only of the elements at `indices`)
         """
+        if indices is not None and numpy.size(self.depths) > 1:
+            indices = None  # depths is per vertex, so update them all
+        idx = slice(None) if indices is None else indices
 
         #Handle the orientation, size and location of each element in native units
         #
         radians = 0.017453292519943295
+        sizes = self.sizes[idx]
+        oris = self.oris[idx]
+        n = len(sizes)
 
         #so we can do matrix rotation of coords we need shape=[n*4,3]
         #but we'll convert to [n,4,3] after matrix math
-        verts=numpy.zeros([self.nElements*4, 3],'d')
-        wx = -self.sizes[:,0]*numpy.cos(self.oris[:]*radians)/2
-        wy = self.sizes[:,0]*numpy.sin(self.oris[:]*radians)/2
-        hx = self.sizes[:,1]*numpy.sin(self.oris[:]*radians)/2
-        hy = self.sizes[:,1]*numpy.cos(self.oris[:]*radians)/2
+        verts=numpy.zeros([n*4, 3],'d')
+        wx = -sizes[:,0]*numpy.cos(oris[:]*radians)/2
+        wy = sizes[:,0]*numpy.sin(oris[:]*radians)/2
+        hx = sizes[:,1]*numpy.sin(oris[:]*radians)/2
+        hy = sizes[:,1]*numpy.cos(oris[:]*radians)/2
 
         #X vals of each vertex relative to the element's centroid
         verts[0::4,0] = -wx - hx
@@ -526,7 +882,7 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         verts[2::4,1] = +wy + hy
         verts[3::4,1] = -wy + hy
 
-        positions = self.xys+self.fieldPos #set of positions across elements
+        positions = self.xys[idx]+self.fieldPos #set of positions across elements
 
         #depth
         verts[:,2] = self.depths + self.fieldDepth
@@ -534,54 +890,82 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         if positions.shape[0]*4 == verts.shape[0]:
             positions = positions.repeat(4,0)
         verts[:,:2] = convertToPix(vertices = verts[:,:2], pos = positions, units=self.units, win=self.win)
-        verts = verts.reshape([self.nElements,4,3])
+        verts = verts.reshape([n,4,3])
 
         #assign to self attribute
-        self.__dict__['verticesPix'] = numpy.require(verts,requirements=['C'])#make sure it's contiguous
-        self._needVertexUpdate = False
+        if indices is None:
+            self.__dict__['verticesPix'] = numpy.require(verts,requirements=['C'])#make sure it's contiguous
+            self._dirtyElements['vertices'] = []
+            self._needVertexUpdate = False
+        else:
+            self.verticesPix[indices] = verts
 
     #----------------------------------------------------------------------
-    def updateElementColors(self):
+    def updateElementColors(self, indices=None):
         """Create a new array of self._RGBAs based on self.rgbs. Not needed by the
         user (simple call setColors())
 
         For element arrays the self.rgbs values correspond to one element so
         this function also converts them to be one for each vertex of each element
+
+        If indices are given only the colors of those elements are updated.
         """
+        if indices is not None:
+            self._RGBAs[indices] = self._elementRGBAs(indices)[:,numpy.newaxis,:]
+            return
         N=self.nElements
-        self._RGBAs=numpy.zeros([N,4],'d')
-        if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
-            self._RGBAs[:,0:3] = self.rgbs[:,:] * self.contrs[:].reshape([N,1]).repeat(3,1)/2+0.5
-        else:
-            self._RGBAs[:,0:3] = self.rgbs * self.contrs[:].reshape([N,1]).repeat(3,1)/255.0
-        self._RGBAs[:,-1] = self.opacities.reshape([N,])
+        self._RGBAs=self._elementRGBAs()
         self._RGBAs=self._RGBAs.reshape([N,1,4]).repeat(4,1)#repeat for the 4 vertices in the grid
 
+        self._dirtyElements['colors'] = []
         self._needColorUpdate=False
 
-    def updateTextureCoords(self):
-        """Create a new array of self._maskCoords"""
+    def _elementRGBAs(self, indices=None):
+        """The (Nx4) RGBA (0:1) of each element (or of the elements at
+        indices), from rgbs, contrs and opacities"""
+        idx = slice(None) if indices is None else indices
+        rgbs = self.rgbs[idx]
+        N=len(rgbs)
+        RGBAs=numpy.zeros([N,4],'d')
+        if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
+            RGBAs[:,0:3] = rgbs * self.contrs[idx].reshape([N,1]).repeat(3,1)/2+0.5
+        else:
+            RGBAs[:,0:3] = rgbs * self.contrs[idx].reshape([N,1]).repeat(3,1)/255.0
+        RGBAs[:,-1] = self.opacities[idx].reshape([N,])
+        return RGBAs
+
+    def updateTextureCoords(self, indices=None):
+        """Create a new array of self._maskCoords
 
-        N=self.nElements
-        self._maskCoords=numpy.array([[1,0],[0,0],[0,1],[1,1]],'d').reshape([1,4,2])
-        self._maskCoords = self._maskCoords.repeat(N,0)
+        If indices are given only the texture coords of those elements are
+        updated."""
+        idx = slice(None) if indices is None else indices
+        sfs, phases, sizes = self.sfs[idx], self.phases[idx], self.sizes[idx]
+        N=len(sfs)
 
         #for the main texture
         if self.units in ['norm', 'pix', 'height']:#sf is dependent on size (openGL default)
-            L = -self.sfs[:,0]/2 - self.phases[:,0]+0.5
-            R = +self.sfs[:,0]/2 - self.phases[:,0]+0.5
-            T = +self.sfs[:,1]/2 - self.phases[:,1]+0.5
-            B = -self.sfs[:,1]/2 - self.phases[:,1]+0.5
+            L = -sfs[:,0]/2 - phases[:,0]+0.5
+            R = +sfs[:,0]/2 - phases[:,0]+0.5
+            T = +sfs[:,1]/2 - phases[:,1]+0.5
+            B = -sfs[:,1]/2 - phases[:,1]+0.5
         else: #we should scale to become independent of size
-            L = -self.sfs[:,0]*self.sizes[:,0]/2 - self.phases[:,0]+0.5
-            R = +self.sfs[:,0]*self.sizes[:,0]/2 - self.phases[:,0]+0.5
-            T = +self.sfs[:,1]*self.sizes[:,1]/2 - self.phases[:,1]+0.5
-            B = -self.sfs[:,1]*self.sizes[:,1]/2 - self.phases[:,1]+0.5
+            L = -sfs[:,0]*sizes[:,0]/2 - phases[:,0]+0.5
+            R = +sfs[:,0]*sizes[:,0]/2 - phases[:,0]+0.5
+            T = +sfs[:,1]*sizes[:,1]/2 - phases[:,1]+0.5
+            B = -sfs[:,1]*sizes[:,1]/2 - phases[:,1]+0.5
 
         #self._texCoords=numpy.array([[1,1],[1,0],[0,0],[0,1]],'d').reshape([1,4,2])
-        self._texCoords=numpy.concatenate([[R,B],[L,B],[L,T],[R,T]]) \
+        texCoords=numpy.concatenate([[R,B],[L,B],[L,T],[R,T]]) \
             .transpose().reshape([N,4,2]).astype('d')
-        self._texCoords = numpy.ascontiguousarray(self._texCoords)
+        if indices is not None:
+            self._texCoords[indices] = texCoords
+            return
+
+        self._maskCoords=numpy.array([[1,0],[0,0],[0,1],[1,1]],'d').reshape([1,4,2])
+        self._maskCoords = self._maskCoords.repeat(N,0)
+        self._texCoords = numpy.ascontiguousarray(texCoords)
+        self._dirtyElements['texCoords'] = []
         self._needTexCoordUpdate=False
 
     @attributeSetter
@@ -622,3 +1006,6 @@ class ElementArrayStim(MinimalStim, TextureMixin):
         self.mask = value
     def __del__(self):
         self.clearTextures()#remove textures from graphics card to prevent crash
+        if self._instanceVBO is not None:
+            GL.glDeleteBuffers(1, self._instanceVBO)
+            GL.glDeleteBuffers(1, self._cornerVBO)
@@ -1,6 +1,10 @@
 """
 Various useful functions for creating filters and textures (e.g. for PatchStim)
 
+The results of makeGrating, makeMask, makeRadialMatrix and makeGauss are kept
+in a bounded cache (least recently used first out), so repeated calls with the
+same arguments return the same read-only array rather than recomputing it.
+See getCacheInfo(), setCacheSize() and clearCache().
 """
 # Part of the PsychoPy library
 # Copyright (C) 2015 Jonathan Peirce
@@ -8,6 +12,12 @@ Various useful functions for creating filters and textures (e.g. for PatchStim)
 
 from __future__ import absolute_import
 
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
 import numpy
 from numpy.fft import fft2, ifft2, fftshift, ifftshift
 from psychopy import logging
@@ -16,6 +26,116 @@ try:
 except ImportError:
     import Image
 
+
+class _ArrayCache(object):
+    """Results of the functions decorated by _cached, least recently used
+    first, up to maxBytes of arrays"""
+    def __init__(self, maxBytes=64*2**20):
+        self.maxBytes = maxBytes
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.nBytes = 0
+        self.nHits = 0
+        self.nMisses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._results:
+                self.nHits += 1
+                result = self._results.pop(key)
+                self._results[key] = result  # now the most recently used
+                return True, result
+            self.nMisses += 1
+            return False, None
+
+    def add(self, key, result):
+        nBytes = getattr(result, 'nbytes', 0)
+        with self._lock:
+            if nBytes > self.maxBytes or key in self._results:
+                return
+            self._results[key] = result
+            self.nBytes += nBytes
+            self._trim()
+
+    def _trim(self):
+        while self.nBytes > self.maxBytes:
+            key, result = self._results.popitem(last=False)
+            self.nBytes -= getattr(result, 'nbytes', 0)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.nBytes = 0
+
+_cache = _ArrayCache()
+
+
+def _hashable(value):
+    """A hashable version of an argument (arrays by their contents)"""
+    if isinstance(value, numpy.ndarray):
+        value = numpy.ascontiguousarray(value)
+        return ('ndarray', value.shape, value.dtype.str,
+                hashlib.sha1(value.view(numpy.uint8)).hexdigest())
+    elif isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item))
+                            for key, item in value.items()))
+    #(the type too, as 1 and 1.0 aren't always interchangeable)
+    return (type(value), value)
+
+
+def _cached(func):
+    """Decorator keeping the results of `func` in the cache, keyed on all
+    its arguments (defaults included), as read-only arrays"""
+    @wraps(func)
+    def cachedFunc(*args, **kwargs):
+        if _cache.maxBytes <= 0:
+            return func(*args, **kwargs)
+        callArgs = inspect.getcallargs(func, *args, **kwargs)
+        try:
+            key = (func.__name__, _hashable(callArgs))
+            hash(key)
+        except TypeError:  # unhashable arguments
+            return func(*args, **kwargs)
+        found, result = _cache.get(key)
+        if found:
+            return result
+        result = func(*args, **kwargs)
+        if isinstance(result, numpy.ndarray):
+            result.flags.writeable = False
+            _cache.add(key, result)
+        return result
+    return cachedFunc
+
+
+def getCacheInfo():
+    """Returns a dict with the numbers of hits and misses of the cache of
+    makeGrating, makeMask, makeRadialMatrix and makeGauss results, and the
+    number of arrays (nEntries) and bytes (nBytes) held, up to maxBytes
+    """
+    return {'hits': _cache.nHits, 'misses': _cache.nMisses,
+            'nEntries': len(_cache._results), 'nBytes': _cache.nBytes,
+            'maxBytes': _cache.maxBytes}
+
+
+def setCacheSize(maxBytes):
+    """Set the size (in bytes) of the cache of makeGrating, makeMask,
+    makeRadialMatrix and makeGauss results. 0 turns the cache off.
+    """
+    with _cache._lock:
+        _cache.maxBytes = maxBytes
+        _cache._trim()
+
+
+def clearCache():
+    """Empty the cache of makeGrating, makeMask, makeRadialMatrix and makeGauss
+    results (the hit and miss counts are kept)
+    """
+    _cache.clear()
+
+
+@_cached
 def makeGrating(res,
             ori=0.0,    #in degrees
             cycles=1.0,
@@ -40,7 +160,7 @@ def makeGrating(res,
             contrast of the grating
 
     :Returns:
-        a square numpy array of size resXres
+        a square numpy array of size resXres (read-only; copy it to modify it)
 
     """
     tiny=0.0000000000001#to prevent the sinusoid ever being exactly at zero (for sqr wave)
@@ -88,6 +208,7 @@ def maskMatrix(matrix, shape='circle', radius=1.0, center=(0.0,0.0)):
     alphaMask = makeMask(matrix.shape[0],shape,radius, center=(0.0,0.0), range=[0,1])
     return matrix*alphaMask
 
+@_cached
 def makeMask(matrixSize, shape='circle', radius=1.0, center=(0.0,0.0),
              range=[-1,1], fringeWidth=0.2):
     """
@@ -110,6 +231,8 @@ def makeMask(matrixSize, shape='circle', radius=1.0, center=(0.0,0.0),
                 The proportion of the raisedCosine that is being blurred.
             range: 2x1 tuple or list (default=[-1,1])
                 The minimum and maximum value in the mask matrix
+
+    The returned array is read-only (copy it to modify it).
     """
     rad = makeRadialMatrix(matrixSize, center, radius)
     if shape=='ramp':
@@ -160,9 +283,10 @@ def makeMask(matrixSize, shape='circle', radius=1.0, center=(0.0,0.0),
     offset = range[0]
     return outArray*mag + offset
 
+@_cached
 def makeRadialMatrix(matrixSize, center=(0.0,0.0), radius=1.0):
     """Generate a square matrix where each element val is
-    its distance from the centre of the matrix
+    its distance from the centre of the matrix (read-only)
 
     :Parameters:
         matrixSize: integer
@@ -183,9 +307,11 @@ def makeRadialMatrix(matrixSize, center=(0.0,0.0), radius=1.0):
     rad = numpy.sqrt(numpy.power(xx,2) + numpy.power(yy,2))
     return rad
 
+@_cached
 def makeGauss(x, mean=0.0, sd=1.0, gain=1.0, base=0.0):
     """
-    Return the gaussian distribution for a given set of x-vals
+    Return the gaussian distribution for a given set of x-vals (read-only,
+    if x is an array)
 
    :Parameters:
         mean: float
@@ -146,6 +146,7 @@ class GratingStim(BaseVisualStim, TextureMixin, ColorMixin, ContainerMixin):
 
         #generate a displaylist ID
         self._listID = GL.glGenLists(1)
+        self._quadListID = None  # created when needed by _updateListShaders
 
         # JRG: doing self._updateList() here means MRO issues for RadialStim,
         # which inherits from GratingStim but has its own _updateList code.
@@ -263,6 +264,32 @@ class GratingStim(BaseVisualStim, TextureMixin, ColorMixin, ContainerMixin):
         #return the view to previous state
         GL.glPopMatrix()
 
+    def _batchKey(self):
+        #subclasses with their own drawing code (e.g. RadialStim) can't batch
+        if (not self.useShaders or
+                type(self).draw.__func__ is not GratingStim.draw.__func__ or
+                type(self)._updateListShaders.__func__ is not
+                GratingStim._updateListShaders.__func__):
+            return None
+        return (self.win._progSignedTexMask,
+                self._texID.value, self._maskID.value)
+
+    def _prepareBatchDraw(self):
+        if self._needTextureUpdate:
+            self.setTex(value=self.tex, log=False)
+        if self._needUpdate:
+            self._updateList()
+
+    def _drawBatched(self, win):
+        """Draw with the program and textures already bound (see
+        `Window.batchAutoDraw`)"""
+        GL.glPushMatrix()
+        win.setScale('pix')
+        desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
+        GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
+        GL.glCallList(self._quadListID)
+        GL.glPopMatrix()
+
     def _updateListShaders(self):
         """
         The user shouldn't need this method since it gets called
@@ -272,21 +299,11 @@ class GratingStim(BaseVisualStim, TextureMixin, ColorMixin, ContainerMixin):
         rather than using the .set() command
         """
         self._needUpdate = False
-        GL.glNewList(self._listID,GL.GL_COMPILE)
-        #setup the shaderprogram
-        GL.glUseProgram(self.win._progSignedTexMask)
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "texture"), 0) #set the texture to be texture unit 0
-        GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "mask"), 1)  # mask is texture unit 1
-        #mask
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self._maskID)
-        GL.glEnable(GL.GL_TEXTURE_2D)#implicitly disables 1D
-
-        #main texture
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
-        GL.glEnable(GL.GL_TEXTURE_2D)
-
+        #the quad goes in its own list so that it can be drawn in a batch
+        #(see _drawBatched) without binding the program and textures
+        if self._quadListID is None:
+            self._quadListID = GL.glGenLists(1)
+        GL.glNewList(self._quadListID,GL.GL_COMPILE)
         Ltex = -self._cycles[0]/2 - self.phase[0]+0.5
         Rtex = +self._cycles[0]/2 - self.phase[0]+0.5
         Ttex = +self._cycles[1]/2 - self.phase[1]+0.5
@@ -312,18 +329,14 @@ class GratingStim(BaseVisualStim, TextureMixin, ColorMixin, ContainerMixin):
         GL.glMultiTexCoord2f(GL.GL_TEXTURE1,Rmask,Tmask)
         GL.glVertex2f(vertsPix[3,0], vertsPix[3,1])
         GL.glEnd()
+        GL.glEndList()
 
+        GL.glNewList(self._listID,GL.GL_COMPILE)
+        #setup the shaderprogram and textures
+        self._bindShaderTextures(self.win._progSignedTexMask)
+        GL.glCallList(self._quadListID)
         #unbind the textures
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glDisable(GL.GL_TEXTURE_2D)#implicitly disables 1D
-        #main texture
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glDisable(GL.GL_TEXTURE_2D)
-
-        GL.glUseProgram(0)
-
+        self._unbindShaderTextures()
         GL.glEndList()
 
     #for the sake of older graphics cards------------------------------------
@@ -392,6 +405,8 @@ class GratingStim(BaseVisualStim, TextureMixin, ColorMixin, ContainerMixin):
     def __del__(self):
         try:
             GL.glDeleteLists(self._listID, 1)
+            if self._quadListID is not None:
+                GL.glDeleteLists(self._quadListID, 1)
         except:
             pass #probably we don't have a _listID property
         try:
@@ -91,6 +91,7 @@ class ImageStim(BaseVisualStim, ContainerMixin, ColorMixin, TextureMixin):
 
         #generate a displaylist ID
         self._listID = GL.glGenLists(1)
+        self._quadListID = None  # created when needed by _updateListShaders
         self._updateList()#ie refresh display list
 
         # set autoLog now that params have been initialised
@@ -107,28 +108,11 @@ class ImageStim(BaseVisualStim, ContainerMixin, ColorMixin, TextureMixin):
         rather than using the .set() command
         """
         self._needUpdate = False
-        GL.glNewList(self._listID,GL.GL_COMPILE)
-
-        #setup the shaderprogram
-        if self.isLumImage: #for a luminance image do recoloring
-            GL.glUseProgram(self.win._progSignedTexMask)
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "texture"), 0) #set the texture to be texture unit 0
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progSignedTexMask, "mask"), 1)  # mask is texture unit 1
-        else: #for an rgb image there is no recoloring
-            GL.glUseProgram(self.win._progImageStim)
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progImageStim, "texture"), 0) #set the texture to be texture unit 0
-            GL.glUniform1i(GL.glGetUniformLocation(self.win._progImageStim, "mask"), 1)  # mask is texture unit 1
-
-        #mask
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self._maskID)
-        GL.glEnable(GL.GL_TEXTURE_2D)#implicitly disables 1D
-
-        #main texture
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
-        GL.glEnable(GL.GL_TEXTURE_2D)
-
+        #the quad goes in its own list so that it can be drawn in a batch
+        #(see _drawBatched) without binding the program and textures
+        if self._quadListID is None:
+            self._quadListID = GL.glGenLists(1)
+        GL.glNewList(self._quadListID,GL.GL_COMPILE)
         vertsPix = self.verticesPix #access just once because it's slower than basic property
         GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
         # right bottom
@@ -148,20 +132,22 @@ class ImageStim(BaseVisualStim, ContainerMixin, ColorMixin, TextureMixin):
         GL.glMultiTexCoord2f(GL.GL_TEXTURE1,1,1)
         GL.glVertex2f(vertsPix[3,0], vertsPix[3,1])
         GL.glEnd()
+        GL.glEndList()
 
+        GL.glNewList(self._listID,GL.GL_COMPILE)
+        #setup the shaderprogram (recoloring only for a luminance image)
+        self._bindShaderTextures(self._shaderProgram())
+        GL.glCallList(self._quadListID)
         #unbind the textures
-        GL.glActiveTexture(GL.GL_TEXTURE1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glDisable(GL.GL_TEXTURE_2D)#implicitly disables 1D
-        #main texture
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        GL.glDisable(GL.GL_TEXTURE_2D)
-
-        GL.glUseProgram(0)
-
+        self._unbindShaderTextures()
         GL.glEndList()
 
+    def _shaderProgram(self):
+        if self.isLumImage: #for a luminance image do recoloring
+            return self.win._progSignedTexMask
+        else: #for an rgb image there is no recoloring
+            return self.win._progImageStim
+
     #for the sake of older graphics cards------------------------------------
     def _updateListNoShaders(self):
         """
@@ -211,6 +197,8 @@ class ImageStim(BaseVisualStim, ContainerMixin, ColorMixin, TextureMixin):
     def __del__(self):
         if hasattr(self, '_listID'):
             GL.glDeleteLists(self._listID, 1)
+        if getattr(self, '_quadListID', None) is not None:
+            GL.glDeleteLists(self._quadListID, 1)
         self.clearTextures()#remove textures from graphics card to prevent crash
 
     def draw(self, win=None):
@@ -233,6 +221,29 @@ class ImageStim(BaseVisualStim, ContainerMixin, ColorMixin, TextureMixin):
         #return the view to previous state
         GL.glPopMatrix()
 
+    def _batchKey(self):
+        #subclasses with their own drawing code (e.g. BufferImageStim) can't batch
+        if (not self.useShaders or
+                type(self).draw.__func__ is not ImageStim.draw.__func__):
+            return None
+        return (self._shaderProgram(), self._texID.value, self._maskID.value)
+
+    def _prepareBatchDraw(self):
+        if self._needTextureUpdate:
+            self.setImage(value=self._imName, log=False)
+        if self._needUpdate:
+            self._updateList()
+
+    def _drawBatched(self, win):
+        """Draw with the program and textures already bound (see
+        `Window.batchAutoDraw`)"""
+        GL.glPushMatrix()
+        win.setScale('pix')
+        desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
+        GL.glColor4f(desiredRGB[0],desiredRGB[1],desiredRGB[2], self.opacity)
+        GL.glCallList(self._quadListID)
+        GL.glPopMatrix()
+
     @attributeSetter
     def image(self, value):
         """The image file to be presented (most formats supported)
@@ -157,7 +157,7 @@ class MovieStim(BaseVisualStim, ContainerMixin):
         self._updateVertices()
 
         #check for pyglet
-        if win.winType!='pyglet':
+        if win.winType == 'pygame':
             logging.error('Movie stimuli can only be used with a pyglet window')
             core.quit()
 
@@ -189,7 +189,7 @@ class MovieStim2(BaseVisualStim, ContainerMixin):
         super(MovieStim2, self).__init__(win, units=units, name=name,
                                          autoLog=False)
         #check for pyglet
-        if win.winType != 'pyglet':
+        if win.winType == 'pygame':
             logging.error('Movie stimuli can only be used with a pyglet window')
             core.quit()
         self._retracerate = win._monitorFrameRate
@@ -34,6 +34,7 @@ from psychopy import sound
 from psychopy.tools.arraytools import val2array
 from psychopy.tools.attributetools import logAttrib, setAttribute
 from psychopy.visual.basevisual import BaseVisualStim, ContainerMixin
+from psychopy.visual.moviedecoder import FrameDecoder
 
 from moviepy.video.io.VideoFileClip import VideoFileClip
 
@@ -74,6 +75,9 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
                  vframe_callback=None,
                  fps=None,
                  interpolate = True,
+                 decodeAhead=4,
+                 dropFrames=True,
+                 waitForFrames=False,
         ):
         """
         :Parameters:
@@ -89,7 +93,21 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
             loop : bool, optional
                 Whether to start the movie over from the beginning if draw is
                 called and the movie is done.
-
+            decodeAhead : int
+                The number of frames decoded ahead of the one being shown, in
+                a background thread (0 decodes each frame when it is drawn).
+            dropFrames : *True* or False
+                If the movie falls behind its clock (e.g. because frames were
+                slow to draw) skip to the frame that is due now, to stay in
+                time with the sound. If False show every frame, even if late.
+            waitForFrames : True or *False*
+                If a frame hasn't been decoded by the time it is due, wait
+                for it (delaying the flip). If False the previous frame is
+                drawn again.
+
+        The numbers of frames skipped (`nDroppedFrames`), shown late
+        (`nLateFrames`) and drawn again because the next frame wasn't decoded
+        in time (`nRepeatedFrames`) are counted.
         """
         # what local vars are defined (these are the init params) for use
         # by __repr__
@@ -116,11 +134,14 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
         self.noAudio = noAudio
         self._audioStream = None
         self.useTexSubImage2D = True
+        self.decodeAhead = decodeAhead
+        self.dropFrames = dropFrames
+        self.waitForFrames = waitForFrames
+        self._decoder = None
 
         self._videoClock = Clock()
         self.loadMovie(self.filename)
         self.setVolume(volume)
-        self.nDroppedFrames = 0
 
         #size
         if size is None:
@@ -140,6 +161,12 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
         self._nextFrameT = None
         self._texID = None
         self.status = NOT_STARTED
+        self.nDroppedFrames = 0
+        self.nLateFrames = 0
+        self.nRepeatedFrames = 0
+        if self._decoder is not None:
+            self._decoder.stop()
+            self._decoder = None
 
     def setMovie(self, filename, log=True):
         """See `~MovieStim.loadMovie` (the functions are identical).
@@ -178,6 +205,9 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
         self._frameInterval = 1.0/self._mov.fps
         self.duration = self._mov.duration
         self.filename = filename
+        if self.decodeAhead:
+            self._decoder = FrameDecoder(self._mov, self._frameInterval,
+                                          self.duration, self.decodeAhead)
         self._updateFrameTexture()
         logAttrib(self, log, 'movie', filename)
 
@@ -268,13 +298,37 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
             self._videoClock.reset()
             self._nextFrameT = 0
 
-        #only advance if next frame (half of next retrace rate)
-        if self._nextFrameT > self.duration:
+        frameN = int(round(self._nextFrameT/self._frameInterval))
+        late = False
+        if self._numpyFrame is not None:
+            #only advance if next frame (half of next retrace rate)
+            t = self._videoClock.getTime() - self._retraceInterval/2.0
+            if self.status == PAUSED or self._nextFrameT > t:
+                return None
+            dueN = int(t/self._frameInterval)  # the frame that should be shown
+            if dueN > frameN and self.dropFrames:
+                self._dropFrames(frameN, dueN)
+                frameN = dueN
+                self._nextFrameT = frameN*self._frameInterval
+            late = dueN > frameN
+        if frameN*self._frameInterval > self.duration:
             self._onEos()
-        elif (self._numpyFrame is not None) and \
-            (self._nextFrameT > (self._videoClock.getTime()-self._retraceInterval/2.0)):
-            return None
-        self._numpyFrame = self._mov.get_frame(self._nextFrameT)
+            if self._mov is None:
+                return None
+            frameN = int(round(self._nextFrameT/self._frameInterval))
+
+        if self._decoder is None or self._decoder.stopped:
+            frame = self._mov.get_frame(frameN*self._frameInterval)
+        else:
+            wait = self.waitForFrames or self._numpyFrame is None
+            frame = self._decoder.getFrame(frameN, wait=wait)
+            if frame is None:
+                #not decoded yet: show the current frame again and retry
+                self.nRepeatedFrames += 1
+                return None
+        if late:
+            self.nLateFrames += 1
+        self._numpyFrame = frame
         useSubTex=self.useTexSubImage2D
         if self._texID is None:
             self._texID = GL.GLuint()
@@ -291,30 +345,34 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
         if self.interpolate:
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
             GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
-            if useSubTex is False:
-                GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB8,
-                    self._numpyFrame.shape[1],self._numpyFrame.shape[0], 0,
-                    GL.GL_RGB, GL.GL_UNSIGNED_BYTE, self._numpyFrame.ctypes)
-            else:
-                GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0,
-                    self._numpyFrame.shape[1], self._numpyFrame.shape[0],
-                    GL.GL_RGB, GL.GL_UNSIGNED_BYTE, self._numpyFrame.ctypes)
-
+            pixFormat = GL.GL_RGB
         else:
             GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MAG_FILTER,GL.GL_NEAREST)
             GL.glTexParameteri(GL.GL_TEXTURE_2D,GL.GL_TEXTURE_MIN_FILTER,GL.GL_NEAREST)
-            if useSubTex is False:
-                GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB8,
-                                self._numpyFrame.shape[1],self._numpyFrame.shape[0], 0,
-                                GL.GL_BGR, GL.GL_UNSIGNED_BYTE, self._numpyFrame.ctypes)
-            else:
-                GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0,
-                    self._numpyFrame.shape[1], self._numpyFrame.shape[0],
-                    GL.GL_BGR, GL.GL_UNSIGNED_BYTE, self._numpyFrame.ctypes)
+            pixFormat = GL.GL_BGR
+        #through PBOs if possible, so the frame is copied in the background
+        if useSubTex is False:
+            self.win.textureUploader.texImage2D(self._numpyFrame, GL.GL_RGB8,
+                pixFormat, GL.GL_UNSIGNED_BYTE)
+        else:
+            self.win.textureUploader.texSubImage2D(self._numpyFrame,
+                pixFormat, GL.GL_UNSIGNED_BYTE)
         GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_MODULATE)#?? do we need this - think not!
 
         if not self.status==PAUSED:
-            self._nextFrameT += self._frameInterval
+            frameN += 1
+        self._nextFrameT = frameN*self._frameInterval
+
+    def _dropFrames(self, frameN, dueN):
+        """Skip frames frameN to dueN-1 (which weren't shown in time)"""
+        for n in range(frameN, dueN):
+            self.nDroppedFrames += 1
+            if self.nDroppedFrames < reportNDroppedFrames:
+                logging.warning("MovieStim3 dropping video frame index: %d" % n)
+            elif self.nDroppedFrames == reportNDroppedFrames:
+                logging.warning("Multiple Movie frames have "
+                                "occurred - I'll stop bothering you "
+                                "about them!")
 
     def draw(self, win=None):
         """
@@ -379,6 +437,7 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
         """
         #video is easy: set both times to zero and update the frame texture
         self._nextFrameT = t
+        self._numpyFrame = None  # so the frame at t is shown, even if paused
         self._videoClock.reset(t)
         self._audioSeek(t)
 
@@ -400,6 +459,9 @@ class MovieStim3(BaseVisualStim, ContainerMixin):
             self.clearTextures()#remove textures from graphics card to prevent crash
         except:
             pass
+        if getattr(self, '_decoder', None) is not None:
+            self._decoder.stop()
+            self._decoder = None
         self._mov = None
         self._numpyFrame = None
         self._audioStream = None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+
+'''Decode the frames of a movie ahead of time in a background thread
+(used by `MovieStim3`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import threading
+
+import numpy
+
+from psychopy import logging
+
+
+class FrameDecoder(object):
+    """Decodes the frames of a clip (anything with a `get_frame(t)` method,
+    such as a moviepy VideoFileClip) in a background thread, up to `nFrames`
+    ahead of the one being shown, into a ring of frame buffers.
+
+    If decoding fails the error is logged and the decoder stops
+    (`stopped` becomes True), leaving its owner to decode frames itself.
+    """
+    def __init__(self, clip, frameInterval, duration, nFrames):
+        self._clip = clip
+        self._frameInterval = frameInterval
+        self._duration = duration
+        self._nFrames = nFrames
+        self._ring = None  # allocated for the size of the first frame
+        self._firstN = 0  # the oldest frame held (the one being shown)
+        self._nextN = 0  # the next frame to decode
+        self._generation = 0  # changed by a seek, to discard old frames
+        self._cond = threading.Condition()
+        self.stopped = False
+        thread = threading.Thread(target=self._run, name='MovieStim3Decoder')
+        thread.daemon = True
+        thread.start()
+
+    def getFrame(self, frameN, wait=True):
+        """Returns the frame `frameN` (an array that is only valid until
+        getFrame is called again), or None if it isn't decoded yet and `wait`
+        is False. Frames between the last one asked for and `frameN` are
+        skipped.
+        """
+        self._cond.acquire()
+        try:
+            if frameN < self._firstN or frameN >= self._nextN + self._nFrames:
+                #a seek, or too far ahead to decode all the frames before it
+                self._nextN = frameN
+                self._generation += 1
+            self._firstN = frameN
+            self._nextN = max(self._nextN, frameN)
+            self._cond.notifyAll()
+            while self._nextN <= frameN:
+                if not wait or self.stopped:
+                    return None
+                self._cond.wait()
+            return self._ring[frameN % self._nFrames]
+        finally:
+            self._cond.release()
+
+    def stop(self):
+        self._cond.acquire()
+        try:
+            self.stopped = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def _run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while not self.stopped and (
+                        self._nextN - self._firstN >= self._nFrames or
+                        self._nextN*self._frameInterval > self._duration):
+                    self._cond.wait()
+                if self.stopped:
+                    return
+                frameN, generation = self._nextN, self._generation
+            finally:
+                self._cond.release()
+
+            try:
+                frame = self._clip.get_frame(frameN*self._frameInterval)
+            except Exception as err:
+                #MovieStim3 decodes frames itself from now on
+                logging.error("MovieStim3 couldn't decode frame %i: %s"
+                              % (frameN, err))
+                self.stop()
+                return
+            #the slot is free: frames are only held up to nFrames behind
+            if self._ring is None:
+                self._ring = numpy.empty((self._nFrames,) + frame.shape,
+                                         frame.dtype)
+            self._ring[frameN % self._nFrames] = frame
+
+            self._cond.acquire()
+            try:
+                if generation == self._generation and frameN == self._nextN:
+                    self._nextN += 1
+                    self._cond.notifyAll()
+            finally:
+                self._cond.release()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python2
+
+'''Record every frame shown by a Window to disk while the experiment runs,
+reading frames back through pixel buffer objects (PBOs) and encoding them in
+a background thread (see `Window.recordMovie`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import os
+import ctypes
+import threading
+import subprocess
+import Queue
+
+import pyglet
+GL = pyglet.gl
+
+import numpy
+
+from psychopy import logging
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+reportNSkippedFrames = 5  # stop warning after this
+movieExtensions = ['.mp4', '.mov', '.avi', '.mkv', '.mpg', '.mpeg', '.webm']
+
+
+class MovieRecorder(object):
+    """Captures the frames of a :class:`~psychopy.visual.Window` as they are
+    flipped and writes them to `fileName`: a numbered image sequence (e.g.
+    'frame.png' gives frame000001.png, frame000002.png...) or, for movie
+    file extensions (.mp4, .mov, .avi...), a movie encoded by piping the
+    frames to `ffmpeg`.
+
+    Each frame is read into one of `nBuffers` PBOs without waiting for the
+    graphics card, and copied out a few frames later when the transfer has
+    finished. Frames then wait in a queue of at most `maxQueuedFrames` for
+    the encoding thread; if the encoder can't keep up, frames are skipped
+    (and counted) rather than using more memory or delaying the flip.
+    Skipped frames leave gaps in the numbering of an image sequence, while
+    in a movie the previous frame is repeated to keep the timing.
+
+    Without PBO support frames are read synchronously (but still encoded in
+    the background).
+    """
+    def __init__(self, win, fileName, fps=None, maxQueuedFrames=30,
+                 nBuffers=3, ffmpeg='ffmpeg'):
+        self.win = win
+        self.fileName = fileName
+        self.size = (int(win.size[0]), int(win.size[1]))
+        self.nCaptured = 0
+        self.nSkipped = 0
+        self.nWritten = 0
+        self._queue = Queue.Queue(maxsize=maxQueuedFrames)
+        self._error = None
+        fileRoot, fileExt = os.path.splitext(fileName)
+        if fileExt.lower() in movieExtensions:
+            if fps is None:
+                fps = win._monitorFrameRate or 60.0
+            self._writer = _FFmpegWriter(fileName, self.size, fps, ffmpeg)
+        else:
+            self._writer = _ImageSequenceWriter(fileRoot, fileExt)
+        if win._havePBOs:
+            self._buffers = (GL.GLuint * nBuffers)()
+            GL.glGenBuffers(nBuffers, self._buffers)
+            self._pending = [None] * nBuffers  # frame being read into each
+        else:
+            self._buffers = None
+        self._thread = threading.Thread(target=self._run,
+                                        name='MovieRecorder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def capture(self):
+        """Read the frame in the back buffer (of the default framebuffer);
+        called by Window.flip() just before the buffers are swapped"""
+        frameN = self.nCaptured
+        self.nCaptured += 1
+        width, height = self.size
+        GL.glReadBuffer(GL.GL_BACK)
+        if self._buffers is None:
+            if self._queue.full():
+                self._skip(frameN)
+                return
+            data = numpy.empty((height, width, 4), numpy.uint8)
+            GL.glReadPixels(0, 0, width, height, GL.GL_RGBA,
+                            GL.GL_UNSIGNED_BYTE, data.ctypes)
+            self._queue.put((frameN, data))
+            return
+        bufferN = frameN % len(self._buffers)
+        if self._pending[bufferN] is not None:
+            self._collect(bufferN)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self._buffers[bufferN])
+        GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, width*height*4, None,
+                        GL.GL_STREAM_READ)
+        #returns at once: the copy to the buffer happens in the background
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGBA,
+                        GL.GL_UNSIGNED_BYTE, None)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self._pending[bufferN] = frameN
+
+    def _collect(self, bufferN):
+        """Copy the frame read into buffer `bufferN` to the encoding queue"""
+        frameN = self._pending[bufferN]
+        self._pending[bufferN] = None
+        if self._queue.full():
+            self._skip(frameN)
+            return
+        width, height = self.size
+        data = numpy.empty((height, width, 4), numpy.uint8)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self._buffers[bufferN])
+        mapped = GL.glMapBuffer(GL.GL_PIXEL_PACK_BUFFER, GL.GL_READ_ONLY)
+        address = ctypes.cast(mapped, ctypes.c_void_p).value
+        if address:
+            ctypes.memmove(data.ctypes.data, address, data.nbytes)
+            GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        if address:
+            self._queue.put((frameN, data))
+        else:
+            self._skip(frameN)
+
+    def _skip(self, frameN):
+        self.nSkipped += 1
+        if self.nSkipped < reportNSkippedFrames:
+            logging.warning("MovieRecorder skipped frame %i (the encoder "
+                            "is falling behind)" % frameN)
+        elif self.nSkipped == reportNSkippedFrames:
+            logging.warning("Multiple recorded frames have been skipped - "
+                            "I'll stop bothering you about them!")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frameN, data = item
+            if self._error is not None:
+                continue  # keep emptying the queue
+            try:
+                self._writer.write(frameN, data)
+                self.nWritten += 1
+            except Exception as err:
+                self._error = err
+                logging.error("MovieRecorder couldn't write frame %i to %s: "
+                              "%s" % (frameN, self.fileName, err))
+
+    def close(self):
+        """Write the frames still in the buffers and queue, then close the
+        file(s). Returns the stats()"""
+        if self._buffers is not None:
+            pending = [(frameN, bufferN)
+                       for bufferN, frameN in enumerate(self._pending)
+                       if frameN is not None]
+            for frameN, bufferN in sorted(pending):
+                self._queue.put((frameN, self._read(bufferN)))
+            GL.glDeleteBuffers(len(self._buffers), self._buffers)
+            self._buffers = None
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._writer.close(self.nCaptured)
+        except Exception as err:
+            logging.error("MovieRecorder couldn't finish %s: %s"
+                          % (self.fileName, err))
+        stats = self.stats()
+        logging.info("MovieRecorder wrote %(written)i of %(captured)i frames "
+                     "(%(skipped)i skipped) to " % stats + self.fileName)
+        return stats
+
+    def _read(self, bufferN):
+        """Read buffer `bufferN` for close(), waiting for it if necessary"""
+        self._pending[bufferN] = None
+        width, height = self.size
+        data = numpy.empty((height, width, 4), numpy.uint8)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self._buffers[bufferN])
+        GL.glGetBufferSubData(GL.GL_PIXEL_PACK_BUFFER, 0, data.nbytes,
+                              data.ctypes.data)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        return data
+
+    def stats(self):
+        """Returns a dict with the numbers of frames captured, written,
+        skipped and queued (waiting to be written)"""
+        return {'captured': self.nCaptured, 'written': self.nWritten,
+                'skipped': self.nSkipped, 'queued': self._queue.qsize()}
+
+
+class _ImageSequenceWriter(object):
+    def __init__(self, fileRoot, fileExt):
+        self.nameFormat = fileRoot + '%06i' + fileExt
+
+    def write(self, frameN, data):
+        im = Image.fromarray(data[::-1, :, :3])  # GL rows are bottom-up
+        im.save(self.nameFormat % (frameN + 1))
+
+    def close(self, nFrames):
+        pass
+
+
+class _FFmpegWriter(object):
+    """Pipes raw RGBA frames to an ffmpeg process"""
+    def __init__(self, fileName, size, fps, ffmpeg):
+        self._args = [ffmpeg, '-y', '-loglevel', 'error',
+                      '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                      '-s', '%ix%i' % size, '-r', str(fps), '-i', '-',
+                      '-vf', 'vflip', '-pix_fmt', 'yuv420p', fileName]
+        self._process = None
+        self._lastFrame = None
+        self._nextFrameN = 0
+
+    def write(self, frameN, data):
+        if self._process is None:
+            try:
+                self._process = subprocess.Popen(self._args,
+                                                 stdin=subprocess.PIPE)
+            except OSError as err:
+                raise IOError("couldn't run %s (%s)" % (self._args[0], err))
+        #repeat the last frame in place of any skipped ones
+        while self._nextFrameN < frameN and self._lastFrame is not None:
+            self._process.stdin.write(self._lastFrame)
+            self._nextFrameN += 1
+        self._lastFrame = data.tostring()
+        self._process.stdin.write(self._lastFrame)
+        self._nextFrameN = frameN + 1
+
+    def close(self, nFrames):
+        if self._process is None:
+            return
+        while self._nextFrameN < nFrames:
+            self._process.stdin.write(self._lastFrame)
+            self._nextFrameN += 1
+        self._process.stdin.close()
+        if self._process.wait():
+            raise IOError("ffmpeg exited with code %i"
+                          % self._process.returncode)
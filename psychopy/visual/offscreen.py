@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+
+'''Offscreen OpenGL contexts made through EGL, so that stimuli can be
+rendered without a display, e.g. on a server with Mesa's llvmpipe
+(see `winType='offscreen'` in `Window`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import ctypes
+import ctypes.util
+
+import pyglet
+GL = pyglet.gl
+
+# EGL constants (from egl.h and eglext.h)
+EGL_DEFAULT_DISPLAY = None
+EGL_NO_CONTEXT = None
+EGL_NO_SURFACE = None
+EGL_NONE = 0x3038
+EGL_ALPHA_SIZE = 0x3021
+EGL_BLUE_SIZE = 0x3022
+EGL_GREEN_SIZE = 0x3023
+EGL_RED_SIZE = 0x3024
+EGL_DEPTH_SIZE = 0x3025
+EGL_STENCIL_SIZE = 0x3026
+EGL_SURFACE_TYPE = 0x3033
+EGL_RENDERABLE_TYPE = 0x3040
+EGL_HEIGHT = 0x3056
+EGL_WIDTH = 0x3057
+EGL_PBUFFER_BIT = 0x0001
+EGL_OPENGL_BIT = 0x0008
+EGL_OPENGL_API = 0x30A2
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+_egl = None  # the EGL library, loaded when the first window is made
+_display = None
+
+
+def _getDisplay():
+    """Load EGL and initialise its display (once). Mesa's surfaceless
+    platform is used if it's available, as it needs no X server at all"""
+    global _egl, _display
+    if _display is not None:
+        return _display
+    libName = ctypes.util.find_library('EGL') or 'libEGL.so.1'
+    try:
+        egl = ctypes.CDLL(libName)
+    except OSError:
+        raise RuntimeError("winType='offscreen' needs the EGL library "
+                           "(libEGL), e.g. from Mesa")
+    vp = ctypes.c_void_p
+    egl.eglGetDisplay.restype = vp
+    egl.eglGetDisplay.argtypes = [vp]
+    egl.eglInitialize.argtypes = [vp, vp, vp]
+    egl.eglBindAPI.argtypes = [ctypes.c_uint]
+    egl.eglChooseConfig.argtypes = [vp, vp, vp, ctypes.c_int, vp]
+    egl.eglCreateContext.restype = vp
+    egl.eglCreateContext.argtypes = [vp, vp, vp, vp]
+    egl.eglCreatePbufferSurface.restype = vp
+    egl.eglCreatePbufferSurface.argtypes = [vp, vp, vp]
+    egl.eglMakeCurrent.argtypes = [vp, vp, vp, vp]
+    egl.eglDestroySurface.argtypes = [vp, vp]
+    egl.eglDestroyContext.argtypes = [vp, vp]
+    egl.eglGetCurrentContext.restype = vp
+
+    display = None
+    if hasattr(egl, 'eglGetPlatformDisplay'):  # EGL 1.5
+        egl.eglGetPlatformDisplay.restype = vp
+        egl.eglGetPlatformDisplay.argtypes = [ctypes.c_uint, vp, vp]
+        display = egl.eglGetPlatformDisplay(EGL_PLATFORM_SURFACELESS_MESA,
+                                            None, None)
+    major, minor = ctypes.c_int(), ctypes.c_int()
+    if not (display and egl.eglInitialize(display, ctypes.byref(major),
+                                          ctypes.byref(minor))):
+        display = egl.eglGetDisplay(EGL_DEFAULT_DISPLAY)
+        if not (display and egl.eglInitialize(display, ctypes.byref(major),
+                                              ctypes.byref(minor))):
+            raise RuntimeError("Couldn't initialise an EGL display for an "
+                               "offscreen window")
+    if not egl.eglBindAPI(EGL_OPENGL_API):
+        raise RuntimeError("EGL doesn't support desktop OpenGL here, so "
+                           "offscreen windows can't be made")
+    _egl, _display = egl, display
+    return _display
+
+
+class OffscreenContext(GL.Context):
+    """The pyglet Context of an :class:`OffscreenWindow`, so that pyglet
+    (text, images, gl_info...) works as it would with a real window"""
+    def __init__(self, canvas, eglContext):
+        GL.Context.__init__(self, None)
+        self.canvas = canvas
+        self._eglContext = eglContext
+
+    def set_current(self):
+        surface = self.canvas._surface
+        if not _egl.eglMakeCurrent(_display, surface, surface,
+                                   self._eglContext):
+            raise RuntimeError("Couldn't make the offscreen context current")
+        GL.Context.set_current(self)
+
+    def destroy(self):
+        if _egl.eglGetCurrentContext() == self._eglContext:
+            _egl.eglMakeCurrent(_display, EGL_NO_SURFACE, EGL_NO_SURFACE,
+                                EGL_NO_CONTEXT)
+            GL.current_context = None
+        _egl.eglDestroyContext(_display, self._eglContext)
+        self._eglContext = None
+        self.detach()
+
+
+class OffscreenWindow(object):
+    """Stands in for the pyglet window of a Window with winType='offscreen'.
+
+    Rendering goes to an EGL pbuffer of `width` x `height` pixels, which
+    (like the front buffer of a real window) holds the last frame flipped.
+    There is no display, so there are no events, the mouse only moves if
+    set_mouse_position() is called, and flip() never waits for a refresh.
+    """
+    def __init__(self, width, height, stencil=False):
+        display = _getDisplay()
+        attribs = [EGL_RED_SIZE, 8, EGL_GREEN_SIZE, 8, EGL_BLUE_SIZE, 8,
+                   EGL_ALPHA_SIZE, 8, EGL_DEPTH_SIZE, 8,
+                   EGL_STENCIL_SIZE, 8 if stencil else 0,
+                   EGL_SURFACE_TYPE, EGL_PBUFFER_BIT,
+                   EGL_RENDERABLE_TYPE, EGL_OPENGL_BIT, EGL_NONE]
+        config = ctypes.c_void_p()
+        nConfigs = ctypes.c_int()
+        if not (_egl.eglChooseConfig(display,
+                                     (ctypes.c_int * len(attribs))(*attribs),
+                                     ctypes.byref(config), 1,
+                                     ctypes.byref(nConfigs))
+                and nConfigs.value):
+            raise RuntimeError("No EGL configuration suits an offscreen "
+                               "window")
+        size = [EGL_WIDTH, width, EGL_HEIGHT, height, EGL_NONE]
+        self._surface = _egl.eglCreatePbufferSurface(display, config,
+            (ctypes.c_int * len(size))(*size))
+        if not self._surface:
+            raise RuntimeError("Couldn't make a %ix%i pbuffer for an "
+                               "offscreen window" % (width, height))
+        eglContext = _egl.eglCreateContext(display, config, EGL_NO_CONTEXT,
+                                           None)
+        if not eglContext:
+            _egl.eglDestroySurface(display, self._surface)
+            raise RuntimeError("Couldn't make an EGL context for an "
+                               "offscreen window")
+        self.context = OffscreenContext(self, eglContext)
+        self.width, self.height = width, height
+        self.x = self.y = 0
+        self.screen = self  # it is the whole of its own (virtual) screen
+        self._mouse_x, self._mouse_y = width//2, height//2
+        self.switch_to()
+
+    def switch_to(self):
+        self.context.set_current()
+
+    def flip(self):
+        GL.glFlush()  # a pbuffer has no buffers to swap
+
+    def dispatch_events(self):
+        pass
+
+    def set_mouse_position(self, x, y):
+        self._mouse_x, self._mouse_y = x, y
+
+    def set_mouse_visible(self, visible=True):
+        pass
+
+    def set_exclusive_mouse(self, exclusive=True):
+        pass
+
+    def close(self):
+        if self._surface is None:
+            return
+        self.context.destroy()
+        _egl.eglDestroySurface(_display, self._surface)
+        self._surface = None
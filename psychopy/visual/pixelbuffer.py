@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+
+'''Streaming texture uploads through pixel buffer objects (PBOs), so that
+copying a large image or movie frame doesn't block drawing
+(see `Window.textureUploader`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import ctypes
+
+import pyglet
+GL = pyglet.gl
+
+import numpy
+
+from psychopy import logging
+
+
+class PixelBufferUploader(object):
+    """Uploads pixel data to textures through a ring of pixel unpack buffers.
+
+    Passing a numpy array straight to glTexImage2D (or glTexSubImage2D)
+    blocks until the driver has copied all of it. Here the data are copied
+    into a buffer (a plain memcpy into memory mapped by the driver) and the
+    texture is then filled from that buffer, which the graphics card does in
+    the background while the next frame is being prepared. Each upload uses
+    the next of `nBuffers` buffers (whose storage is renewed each time) so
+    that it never has to wait for the transfer from a previous one.
+
+    Data smaller than `minBytes` are uploaded directly, as are all data if
+    the graphics card doesn't support PBOs or `enabled` is set to False.
+    """
+    def __init__(self, enabled=True, nBuffers=3, minBytes=256*2**10):
+        self.enabled = enabled
+        self.nBuffers = nBuffers
+        self.minBytes = minBytes
+        self._buffers = None  # GL names, made when first needed
+        self._bufferN = 0
+        self.nStreamed = 0  # uploads through PBOs
+        self.nDirect = 0  # and without them
+
+    def texImage2D(self, data, internalFormat, pixFormat, dataType):
+        """Replace the texture bound to GL_TEXTURE_2D with `data` (a 2D or 3D
+        numpy array) as glTexImage2D would.
+        """
+        self._upload(data, internalFormat, pixFormat, dataType)
+
+    def texSubImage2D(self, data, pixFormat, dataType):
+        """Replace the contents of the texture bound to GL_TEXTURE_2D (which
+        must be the size of `data`) as glTexSubImage2D would.
+        """
+        self._upload(data, None, pixFormat, dataType)
+
+    def _upload(self, data, internalFormat, pixFormat, dataType):
+        data = numpy.ascontiguousarray(data)
+        height, width = data.shape[:2]
+        streamed = (self.enabled and data.nbytes >= self.minBytes and
+                    self._fillBuffer(data))
+        if streamed:
+            pixels = None  # i.e. from the start of the bound buffer
+            self.nStreamed += 1
+        else:
+            pixels = data.ctypes
+            self.nDirect += 1
+        if internalFormat is None:
+            GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height,
+                               pixFormat, dataType, pixels)
+        else:
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internalFormat, width, height,
+                            0, pixFormat, dataType, pixels)
+        if streamed:
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def _fillBuffer(self, data):
+        """Copy `data` into the next buffer and leave it bound to
+        GL_PIXEL_UNPACK_BUFFER. Returns False (with no buffer bound) if the
+        buffer couldn't be mapped.
+        """
+        if self._buffers is None:
+            self._buffers = (GL.GLuint * self.nBuffers)()
+            GL.glGenBuffers(self.nBuffers, self._buffers)
+        buffer = self._buffers[self._bufferN]
+        self._bufferN = (self._bufferN + 1) % self.nBuffers
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, buffer)
+        #new storage, so there's no waiting for the old contents to be used
+        GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, data.nbytes, None,
+                        GL.GL_STREAM_DRAW)
+        mapped = GL.glMapBuffer(GL.GL_PIXEL_UNPACK_BUFFER, GL.GL_WRITE_ONLY)
+        address = ctypes.cast(mapped, ctypes.c_void_p).value
+        if not address:
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+            logging.warning("Pixel buffer objects could not be mapped; "
+                            "uploading textures directly instead")
+            self.enabled = False
+            return False
+        ctypes.memmove(address, data.ctypes.data, data.nbytes)
+        GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+        return True
+
+    def stats(self):
+        """Returns a dict with the numbers of uploads made through pixel
+        buffers (streamed) and directly (direct)"""
+        return {'streamed': self.nStreamed, 'direct': self.nDirect}
@@ -0,0 +1,262 @@
+#!/usr/bin/env python2
+
+'''Decode image files in background threads before they are needed, so that
+setting the image of an ImageStim only has to upload it'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import os
+import threading
+import weakref
+from collections import OrderedDict, deque
+
+from psychopy import logging
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+_preloaders = weakref.WeakSet()  # ImagePreloaders that textures can come from
+
+
+def _fileKey(fileName):
+    """The identity of a file, which changes if the file is changed"""
+    fileStat = os.stat(fileName)
+    return (os.path.abspath(fileName), fileStat.st_mtime, fileStat.st_size)
+
+
+def takePreloadedImage(fileName):
+    """Returns the decoded image for `fileName` from any ImagePreloader (and
+    removes it from there), or None if no preloader has it.
+
+    The image is flipped top-to-bottom and converted to 'L' or 'RGBA', as
+    TextureMixin._createTexture would do for an RGB texture.
+    """
+    if not _preloaders or not os.path.isfile(fileName):
+        return None
+    key = _fileKey(fileName)
+    for preloader in list(_preloaders):
+        im = preloader._take(key)
+        if im is not None:
+            return im
+    return None
+
+
+def discardPreloadedImage(fileName):
+    """Remove `fileName` from any ImagePreloader (e.g. because its texture
+    was found in a TextureCache)"""
+    if not _preloaders or not os.path.isfile(fileName):
+        return
+    for preloader in list(_preloaders):
+        preloader.discard(fileName)
+
+
+class ImagePreloader(object):
+    """Decodes image files in background threads, ahead of when they are
+    needed by an :class:`~psychopy.visual.ImageStim` (or any stimulus
+    taking an image file as its texture). When a stimulus's image is set to
+    a file that has been preloaded, only the upload to the graphics card is
+    left to do.
+
+    Typical use, loading the images of the next trials during this one::
+
+        preloader = visual.ImagePreloader()
+        for trial in trials:
+            preloader.preloadTrials(trials, 'imageFile', nTrials=2)
+            image.image = trial['imageFile']  # decoded already
+            ...
+
+    Decoded images are held until they are used (or :meth:`discard`-ed) up
+    to `maxBytes` (which can be exceeded by the images being decoded when
+    it is reached). Files waiting to be decoded while that budget is used up
+    are decoded as space is freed, so discard (or :meth:`clear`) images that
+    won't be shown after all.
+    """
+    def __init__(self, maxBytes=256*2**20, nThreads=2):
+        """
+        :Parameters:
+
+            maxBytes:
+                the memory that decoded images may use
+            nThreads:
+                the number of images decoded at once
+        """
+        self.maxBytes = maxBytes
+        self.nBytes = 0
+        self.nHits = 0
+        self._cond = threading.Condition()
+        self._queue = deque()  # file names waiting to be decoded
+        self._decoding = set()  # file keys being decoded now
+        self._images = OrderedDict()  # file key: decoded image
+        self._stopped = False
+        self._threads = []
+        for threadN in range(nThreads):
+            thread = threading.Thread(target=self._run,
+                                      name='ImagePreloader%i' % threadN)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        _preloaders.add(self)
+
+    def preload(self, fileNames):
+        """Queue one file name, or a list of them, to be decoded (in that
+        order). Files already queued or decoded are skipped.
+        """
+        if isinstance(fileNames, basestring):
+            fileNames = [fileNames]
+        self._cond.acquire()
+        try:
+            for fileName in fileNames:
+                if fileName in self._queue or not os.path.isfile(fileName):
+                    continue
+                key = _fileKey(fileName)
+                if key in self._images or key in self._decoding:
+                    continue
+                self._queue.append(fileName)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def preloadTrials(self, trialHandler, column, nTrials=1):
+        """Queue the image files named in `column` of the next `nTrials`
+        trials of `trialHandler` (from its getFutureTrial()).
+        """
+        fileNames = []
+        for n in range(1, nTrials + 1):
+            trial = trialHandler.getFutureTrial(n)
+            if trial is None:
+                break
+            fileName = trial[column]
+            if fileName:
+                fileNames.append(fileName)
+        self.preload(fileNames)
+
+    def isReady(self, fileName):
+        """Whether `fileName` has been decoded (and not yet used)"""
+        if not os.path.isfile(fileName):
+            return False
+        self._cond.acquire()
+        try:
+            return _fileKey(fileName) in self._images
+        finally:
+            self._cond.release()
+
+    def discard(self, fileName):
+        """Forget `fileName` (whether queued or decoded)"""
+        if not os.path.isfile(fileName):
+            return
+        key = _fileKey(fileName)
+        self._cond.acquire()
+        try:
+            if fileName in self._queue:
+                self._queue.remove(fileName)
+            self._remove(key)
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def clear(self):
+        """Forget all queued and decoded images"""
+        self._cond.acquire()
+        try:
+            self._queue.clear()
+            self._images.clear()
+            self.nBytes = 0
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def stop(self):
+        """Stop the decoding threads (and forget all images)"""
+        self._cond.acquire()
+        try:
+            self._stopped = True
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+        self.clear()
+        _preloaders.discard(self)
+
+    def stats(self):
+        """Returns a dict with the numbers of images queued, decoding and
+        ready, the bytes they use, and how many have been used (hits)"""
+        self._cond.acquire()
+        try:
+            return {'queued': len(self._queue), 'decoding': len(self._decoding),
+                    'ready': len(self._images), 'nBytes': self.nBytes,
+                    'hits': self.nHits}
+        finally:
+            self._cond.release()
+
+    def _take(self, key):
+        """Remove and return the decoded image for the file `key`, waiting for
+        it if it is being decoded now; None if it isn't here"""
+        self._cond.acquire()
+        try:
+            while key in self._decoding:
+                self._cond.wait()
+            im = self._remove(key)
+            if im is not None:
+                self.nHits += 1
+                self._cond.notifyAll()  # there may be space to decode more
+            return im
+        finally:
+            self._cond.release()
+
+    def _remove(self, key):
+        im = self._images.pop(key, None)
+        if im is not None:
+            self.nBytes -= _imageBytes(im)
+        return im
+
+    def _run(self):
+        while True:
+            self._cond.acquire()
+            try:
+                while not self._stopped and (not self._queue or
+                                             self.nBytes >= self.maxBytes):
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                fileName = self._queue.popleft()
+                try:
+                    key = _fileKey(fileName)
+                except OSError:
+                    continue
+                self._decoding.add(key)
+            finally:
+                self._cond.release()
+
+            im = None
+            try:
+                im = _decode(fileName)
+            except Exception as err:
+                #the stimulus will try again (and report the error)
+                logging.warning("ImagePreloader couldn't decode %s: %s"
+                                % (fileName, err))
+
+            self._cond.acquire()
+            try:
+                self._decoding.discard(key)
+                if im is not None and not self._stopped:
+                    self._images[key] = im
+                    self.nBytes += _imageBytes(im)
+                self._cond.notifyAll()
+            finally:
+                self._cond.release()
+
+
+def _decode(fileName):
+    """Load, flip and convert an image as _createTexture would for an RGB
+    texture"""
+    im = Image.open(fileName)
+    im = im.transpose(Image.FLIP_TOP_BOTTOM)
+    if im.mode not in ['L', 'RGBA']:
+        im = im.convert('RGBA')
+    return im
+
+
+def _imageBytes(im):
+    return im.size[0]*im.size[1]*len(im.getbands())
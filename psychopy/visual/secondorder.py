@@ -461,9 +461,9 @@ class EnvelopeGrating(GratingStim):
     def clearTextures(self):
         """This will be used by the __del__ method of GratingStim
         """
-        GL.glDeleteTextures(1, self._carrierID)
-        GL.glDeleteTextures(1, self._envelopeID)
-        GL.glDeleteTextures(1, self._maskID)
+        self._deleteTexture(self._carrierID)
+        self._deleteTexture(self._envelopeID)
+        self._deleteTexture(self._maskID)
 
     def _calcEnvCyclesPerStim(self):
 
@@ -23,8 +23,11 @@ def print_log(shader):
         sys.stderr.write(log.value+'\n')
 
 
-def compileProgram(vertexSource=None, fragmentSource=None):
+def compileProgram(vertexSource=None, fragmentSource=None, attribLocations=None):
         """Create and compile a vertex and fragment shader pair from their sources (strings)
+
+        attribLocations is an optional dict of {attributeName: index} to bind
+        before linking (e.g. to put a per-vertex attribute at index 0)
         """
 
         def compileShader( source, shaderType ):
@@ -61,6 +64,10 @@ def compileProgram(vertexSource=None, fragmentSource=None):
                 )
                 GL.glAttachObjectARB(program, fragmentShader)
 
+        if attribLocations:
+                for name, index in attribLocations.items():
+                        GL.glBindAttribLocationARB(program, index, name)
+
         GL.glValidateProgramARB( program )
         GL.glLinkProgramARB(program)
 
@@ -201,3 +208,32 @@ vertSimple = """
             gl_Position =  ftransform();
     }
     """
+#ElementArrayStim (instanced): expands one quad per element from per-element
+#attributes (each has a divisor of 1) and a per-vertex corner in +/-1 units.
+#Vertices, texture and mask coords match those computed on the CPU by
+#ElementArrayStim._updateVertices and .updateTextureCoords
+vertElementArray = """
+    attribute vec2 corner;
+    attribute vec2 xy;
+    attribute float ori;
+    attribute vec2 size;
+    attribute vec2 sf;
+    attribute vec2 phase;
+    attribute vec4 rgba;
+    uniform vec2 fieldPos;
+    uniform vec2 pixScale;  // pixels per unit (x, y)
+    uniform float depth;
+    uniform float sfBySize;  // 1.0 if sf is in cycles/unit, 0.0 if cycles/element
+    void main() {
+            float radians = ori*0.017453292519943295;
+            vec2 w = vec2(-cos(radians), sin(radians))*size.x/2.0;
+            vec2 h = vec2(sin(radians), cos(radians))*size.y/2.0;
+            vec2 pos = (xy + fieldPos + corner.x*w + corner.y*h)*pixScale;
+            vec2 cycles = mix(sf, sf*size, sfBySize);
+            gl_FrontColor = rgba;
+            gl_TexCoord[0] = vec4(0.5 - phase.x - corner.x*cycles.x/2.0,
+                                  0.5 - phase.y + corner.y*cycles.y/2.0, 0.0, 1.0);
+            gl_TexCoord[1] = vec4((1.0 - corner.x)/2.0, (1.0 + corner.y)/2.0, 0.0, 1.0);
+            gl_Position = gl_ModelViewProjectionMatrix*vec4(pos, depth, 1.0);
+    }
+    """
@@ -9,6 +9,7 @@
 
 import os
 import glob
+from collections import OrderedDict
 
 # Ensure setting pyglet.options['debug_gl'] to False is done prior to any
 # other calls to pyglet or pyglet submodules, otherwise it may not get picked
@@ -58,6 +59,53 @@ defaultWrapWidth = {'cm': 15.0,
                      'pixels': 500,
                      }
 
+class TextLayoutCache(object):
+    """The pyglet text layouts made by TextStims in one
+    :class:`~psychopy.visual.Window` (see `Window.textLayoutCache`), keyed
+    on the text, font (with its size, bold and italic), alignment, wrap width
+    and color.
+
+    A TextStim setting text that has been laid out before, with the same
+    settings, uses the same layout (glyphs positioned in the vertex lists
+    that draw them from the font's glyph textures) rather than laying it out
+    again. The least recently used layouts are dropped when there are more
+    than `maxLayouts`. The numbers of hits and misses are counted (see
+    :meth:`stats`); set `enabled` to False to lay out all text again.
+    """
+    def __init__(self, maxLayouts=1000):
+        self.enabled = True
+        self.maxLayouts = maxLayouts
+        self._layouts = OrderedDict()  # key: layout, least recently used first
+        self.nHits = 0
+        self.nMisses = 0
+
+    def get(self, key, makeLayout):
+        """Returns the layout for `key`, calling makeLayout() to make it if
+        there isn't one"""
+        if not self.enabled:
+            return makeLayout()
+        layout = self._layouts.pop(key, None)
+        if layout is None:
+            self.nMisses += 1
+            layout = makeLayout()
+        else:
+            self.nHits += 1
+        self._layouts[key] = layout  # now the most recently used
+        while len(self._layouts) > self.maxLayouts:
+            self._layouts.popitem(last=False)
+        return layout
+
+    def clear(self):
+        """Forget all the layouts"""
+        self._layouts.clear()
+
+    def stats(self):
+        """Returns a dict with the numbers of hits and misses and of
+        layouts cached (nLayouts)"""
+        return {'hits': self.nHits, 'misses': self.nMisses,
+                'nLayouts': len(self._layouts)}
+
+
 class TextStim(BaseVisualStim, ColorMixin):
     """Class of text stimuli to be displayed in a :class:`~psychopy.visual.Window`
     """
@@ -96,6 +144,11 @@ class TextStim(BaseVisualStim, ColorMixin):
 
         In general, other attributes which merely affect the presentation of
         unchanged shapes are as fast as usual. This includes ``pos``, ``opacity`` etc.
+
+        Text that has been shown before (with the same font, height,
+        alignment and wrapWidth) is not laid out again, as its layout is kept
+        in the window's textLayoutCache. Use :meth:`preloadText` to lay out
+        all the texts of an experiment in advance.
         """
 
         #what local vars are defined (these are the init params) for use by __repr__
@@ -123,7 +176,7 @@ class TextStim(BaseVisualStim, ColorMixin):
 
         #generate the texture and list holders
         self._listID = GL.glGenLists(1)
-        if not self.win.winType=="pyglet":#pygame text needs a surface to render to
+        if self.win.winType == "pygame":#pygame text needs a surface to render to
             self._texID = GL.GLuint()
             GL.glGenTextures(1, ctypes.byref(self._texID))
 
@@ -181,7 +234,7 @@ class TextStim(BaseVisualStim, ColorMixin):
         """String. Set the font to be used for text rendering.
         font should be a string specifying the name of the font (in system resources)."""
         self.__dict__['font'] = None  #until we find one
-        if self.win.winType=="pyglet":
+        if self.win.winType != "pygame":
             self._font = pyglet.font.load(font, int(self._heightPix), dpi=72, italic=self.italic, bold=self.bold)
             self.__dict__['font'] = font
         else:
@@ -245,14 +298,47 @@ class TextStim(BaseVisualStim, ColorMixin):
         but use this method if you need to suppress the log message."""
         setAttribute(self, 'text', text, log)
 
+    def preloadText(self, texts):
+        """Lay out each of `texts` (e.g. the words of all trials) with the
+        current font, height, alignment and wrapWidth, so that setting the
+        text to any of them later is fast. The text shown doesn't change.
+
+        Only has an effect with pyglet windows (see
+        :class:`TextLayoutCache`).
+        """
+        if self.win.winType == "pygame":
+            return
+        if self._needSetText:
+            self.setText(log=False)
+        if self.useShaders:
+            color = (1.0, 1.0, 1.0, self.opacity)
+        else:
+            desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
+            color = (desiredRGB[0], desiredRGB[1], desiredRGB[2], self.opacity)
+        for text in texts:
+            self._getPygletText(unicode(text), color)
+
+    def _getPygletText(self, text, color):
+        """A pyglet.font.Text for `text` with the current settings, from the
+        window's textLayoutCache if it has been laid out before"""
+        def makeLayout():
+            return pyglet.font.Text(self._font, text,
+                                    halign=self.alignHoriz, valign=self.alignVert,
+                                    color=color,
+                                    width=self._wrapWidthPix)#width of the frame
+        layoutCache = getattr(self.win, 'textLayoutCache', None)
+        if layoutCache is None:
+            return makeLayout()
+        key = (text, self._font, self.alignHoriz, self.alignVert,
+               tuple(float(c) for c in color), float(self._wrapWidthPix))
+        return layoutCache.get(key, makeLayout)
+
     def _setTextShaders(self,value=None):
         """Set the text to be rendered using the current font
         """
-        if self.win.winType=="pyglet":
-            self._pygletTextObj = pyglet.font.Text(self._font, self.text,
-                                                       halign=self.alignHoriz, valign=self.alignVert,
-                                                       color = (1.0,1.0,1.0, self.opacity),
-                                                       width=self._wrapWidthPix)#width of the frame
+        if self.win.winType != "pygame":
+            self._pygletTextObj = self._getPygletText(self.text,
+                                                      (1.0,1.0,1.0, self.opacity))
 #            self._pygletTextObj = pyglet.text.Label(self.text,self.font, int(self._heightPix),
 #                                                       anchor_x=self.alignHoriz, anchor_y=self.alignVert,#the point we rotate around
 #                                                       halign=self.alignHoriz,
@@ -308,7 +394,7 @@ class TextStim(BaseVisualStim, ColorMixin):
         GL.glActiveTexture(GL.GL_TEXTURE1)
         GL.glEnable(GL.GL_TEXTURE_2D)
         GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-        if self.win.winType=="pyglet":
+        if self.win.winType != "pygame":
             #unbind the main texture
             GL.glActiveTexture(GL.GL_TEXTURE0)
 #            GL.glActiveTextureARB(GL.GL_TEXTURE0_ARB)
@@ -320,7 +406,7 @@ class TextStim(BaseVisualStim, ColorMixin):
             GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
             GL.glEnable(GL.GL_TEXTURE_2D)
 
-        if self.win.winType=="pyglet":
+        if self.win.winType != "pygame":
             GL.glActiveTexture(GL.GL_TEXTURE0)
             GL.glEnable(GL.GL_TEXTURE_2D)
             self._pygletTextObj.draw()
@@ -352,12 +438,9 @@ class TextStim(BaseVisualStim, ColorMixin):
         """
         desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
 
-        if self.win.winType=="pyglet":
-            self._pygletTextObj = pyglet.font.Text(self._font, self.text,
-                                                       halign=self.alignHoriz, valign=self.alignVert,
-                                                       color = (desiredRGB[0],desiredRGB[1], desiredRGB[2], self.opacity),
-                                                       width=self._wrapWidthPix,#width of the frame
-                                                       )
+        if self.win.winType != "pygame":
+            self._pygletTextObj = self._getPygletText(self.text,
+                (desiredRGB[0],desiredRGB[1], desiredRGB[2], self.opacity))
             self.width, self._fontHeightPix = self._pygletTextObj.width, self._pygletTextObj.height
         else:
             self._surf = self._font.render(value, self.antialias,
@@ -398,7 +481,7 @@ class TextStim(BaseVisualStim, ColorMixin):
         elif self.alignVert =='top': bottom=-self._fontHeightPix; top=0
         else: bottom=0.0; top=self._fontHeightPix
         Btex, Ttex, Ltex, Rtex = -0.01, 0.98, 0,1.0#there seems to be a rounding err in pygame font textures
-        if self.win.winType=="pyglet":
+        if self.win.winType != "pygame":
             #unbind the mask texture
             GL.glActiveTexture(GL.GL_TEXTURE1)
             GL.glEnable(GL.GL_TEXTURE_2D)
@@ -416,7 +499,7 @@ class TextStim(BaseVisualStim, ColorMixin):
             GL.glEnable(GL.GL_TEXTURE_2D)
             GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
 
-        if self.win.winType=="pyglet":
+        if self.win.winType != "pygame":
             self._pygletTextObj.draw()
         else:
             GL.glBegin(GL.GL_QUADS)                  # draw a 4 sided polygon
@@ -587,7 +670,7 @@ class TextStim(BaseVisualStim, ColorMixin):
 
         GL.glDisable(GL.GL_DEPTH_TEST) #should text have a depth or just on top?
         #update list if necss and then call it
-        if win.winType=='pyglet':
+        if win.winType != 'pygame':
             if self._needSetText:
                 self.setText()
             #and align based on x anchor
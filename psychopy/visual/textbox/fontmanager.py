@@ -6,10 +6,13 @@ Created on Sun Nov 10 12:18:45 2013
 """
 from __future__ import print_function
 import os,math
+import json
+import hashlib
 import numpy as np
 import unicodedata as ud
 from matplotlib import font_manager
 from psychopy.core import getTime
+from psychopy import logging, prefs
 
 try:
     from textureatlas import TextureAtlas
@@ -29,6 +32,22 @@ def nearestPow2(n):
 def nextPow2(n):
     return int(pow(2, ceil(log(n, 2))))
 
+# bump when the glyph rendering or the cached file layout changes
+ATLAS_CACHE_VERSION=1
+_font_file_hashes={}
+
+def getFontFileHash(font_path):
+    """
+    Return the sha1 hash of the contents of a font file (remembered for
+    each path, size and modification time).
+    """
+    stat=os.stat(font_path)
+    key=(os.path.abspath(font_path),stat.st_size,stat.st_mtime)
+    if key not in _font_file_hashes:
+        with open(font_path,'rb') as font_file:
+            _font_file_hashes[key]=hashlib.sha1(font_file.read()).hexdigest()
+    return _font_file_hashes[key]
+
 class FontManager(object):
     """
     FontManager provides a simple API for finding and loading font files (.ttf)
@@ -305,6 +324,19 @@ class FontInfo(object):
         return d
 
 class MonospaceFontAtlas(object):
+    """
+    The glyphs of a font, at a given size and dpi, rendered into one texture.
+
+    Rendering every glyph with FreeType can take seconds, so finished atlases
+    (the glyph bitmap and the glyph metrics) are saved to a cache directory,
+    keyed by the hash of the font file, the size and the dpi, and are loaded
+    from there (memory mapped) the next time the same font is used.
+    The directory is cache_dir, or 'fontAtlases_v<ATLAS_CACHE_VERSION>' in
+    the PsychoPy user prefs directory if that is None. Set use_cache to
+    False to always render the glyphs.
+    """
+    use_cache=True
+    cache_dir=None
     def __init__(self,font_info,size,dpi):
         self.font_info=font_info
         self.size=size
@@ -343,6 +375,11 @@ class MonospaceFontAtlas(object):
         self.max_tile_height = None
         self.max_bitmap_size = None
         self.total_bitmap_area=0
+        if self.use_cache and self._loadCachedAtlas():
+            self.atlas.upload()
+            self.createDisplayLists()
+            self._face=None
+            return
         # load font glyphs and calculate max. char size.
         # This is used when the altas is created to properly size the tex.
         # i.e. max glyph size * num glyphs
@@ -412,10 +449,85 @@ class MonospaceFontAtlas(object):
         # resize atlas
         height=nextPow2(self.atlas.max_y+1)
         self.atlas.resize(height)
+        if self.use_cache:
+            self._saveCachedAtlas()
         self.atlas.upload()
         self.createDisplayLists()
         self._face=None
 
+    def getCachePath(self):
+        """
+        Return the path (without extension) of the cache files for this
+        atlas.
+        """
+        cache_dir=self.cache_dir
+        if cache_dir is None:
+            cache_dir=os.path.join(prefs.paths['userPrefsDir'],
+                                   'fontAtlases_v%d'%ATLAS_CACHE_VERSION)
+        return os.path.join(cache_dir,"%s_%d_%d"%(
+                    getFontFileHash(self.font_info.path),self.size,self.dpi))
+
+    def _loadCachedAtlas(self):
+        """
+        Load the atlas bitmap (memory mapped) and the glyph metrics from the
+        cache. Returns False if they haven't been cached.
+        """
+        try:
+            cache_path=self.getCachePath()
+            if not os.path.isfile(cache_path+'.json'):
+                return False
+            with open(cache_path+'.json') as metrics_file:
+                metrics=json.load(metrics_file)
+            if metrics['version']!=ATLAS_CACHE_VERSION:
+                return False
+            data=np.load(cache_path+'.npy',mmap_mode='r')
+        except Exception as e:
+            logging.warning("Couldn't load cached font atlas for %s: %s"%(self.id,e))
+            return False
+        for charcode,glyph in metrics['glyphs'].iteritems():
+            charcode=int(charcode)
+            for k in ('offset','size','atlas_coords'):
+                glyph[k]=tuple(glyph[k])
+            self.charcode2glyph[charcode]=glyph
+            self.charcode2unichr[charcode]=glyph['unichar']
+        self.max_ascender = metrics['max_ascender']
+        self.max_descender = metrics['max_descender']
+        self.max_tile_width = metrics['max_tile_width']
+        self.max_tile_height = self.max_ascender+self.max_descender
+        self.max_bitmap_size = tuple(metrics['max_bitmap_size'])
+        self.total_bitmap_area = metrics['total_bitmap_area']
+        self.atlas=TextureAtlas(data.shape[1],data.shape[0],data.shape[2])
+        self.atlas.data=data
+        return True
+
+    def _saveCachedAtlas(self):
+        """
+        Save the atlas bitmap and glyph metrics to the cache (before the
+        glyph texcoords are normalised by createDisplayLists).
+        """
+        metrics=dict(version=ATLAS_CACHE_VERSION,
+                     font_path=self.font_info.path,
+                     max_ascender=self.max_ascender,
+                     max_descender=self.max_descender,
+                     max_tile_width=self.max_tile_width,
+                     max_bitmap_size=self.max_bitmap_size,
+                     total_bitmap_area=self.total_bitmap_area,
+                     glyphs=self.charcode2glyph)
+        try:
+            cache_path=self.getCachePath()
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+            #the metrics are written last: they mark a complete cache entry
+            tmp_path='%s.%d.tmp'%(cache_path,os.getpid())
+            with open(tmp_path,'wb') as data_file:
+                np.save(data_file,np.ascontiguousarray(self.atlas.data))
+            _replaceFile(tmp_path,cache_path+'.npy')
+            with open(tmp_path,'w') as metrics_file:
+                json.dump(metrics,metrics_file)
+            _replaceFile(tmp_path,cache_path+'.json')
+        except Exception as e:
+            logging.warning("Couldn't cache font atlas for %s: %s"%(self.id,e))
+
     def createDisplayLists(self):
         glyph_count=len(self.charcode2unichr)
         max_tile_width,max_tile_height=self.max_tile_width,self.max_tile_height
@@ -486,6 +598,11 @@ class MonospaceFontAtlas(object):
             self.charcode2unichr=None
 
 
+def _replaceFile(src,dst):
+    if os.path.exists(dst):
+        os.remove(dst) # os.rename can't replace files on Windows
+    os.rename(src,dst)
+
 try:
     from psychopy.visual.textbox.freetype_bf import Face,FT_LOAD_RENDER,FT_LOAD_FORCE_AUTOHINT,FT_Exception
 except Exception as e:
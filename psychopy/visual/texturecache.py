@@ -0,0 +1,164 @@
+#!/usr/bin/env python2
+
+'''A cache of the GL textures made by stimuli, so that stimuli with the same
+texture or mask (e.g. hundreds of Gabors) share one copy of it
+(see `Window.textureCache`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import os
+import ctypes
+import hashlib
+from collections import OrderedDict
+
+import pyglet
+GL = pyglet.gl
+
+import numpy
+
+#textures made by TextureMixin._createTexture from their name alone
+namedTextures = ['none', 'None', 'sin', 'sqr', 'saw', 'tri', 'sinXsin',
+                 'sqrXsqr', 'circle', 'gauss', 'cross', 'radRamp', 'raisedCos']
+
+
+class _CachedTexture(object):
+    """A GL texture in a :class:`TextureCache`, with the values that
+    _createTexture would otherwise return or set on the stimulus"""
+    def __init__(self, key, name, nBytes, wasLum, stimAttribs):
+        self.key = key
+        self.name = name
+        self.nBytes = nBytes
+        self.wasLum = wasLum
+        self.stimAttribs = stimAttribs
+        self.refCount = 1
+
+
+class TextureCache(object):
+    """Textures made by stimuli in one :class:`~psychopy.visual.Window`,
+    keyed on what they were made from (the name of a texture such as 'sin'
+    or 'gauss', an image file and its modification time, or the contents of
+    a numpy array) and the settings used to make them (res, pixFormat,
+    dataType, maskParams, interpolate, useShaders...).
+
+    A stimulus asking for a texture that is already in the cache uses the
+    same GL texture rather than making and uploading its own. Textures are
+    reference counted: when no stimulus uses one any more it stays in the
+    cache (in case it is wanted again) until the cache holds more than
+    `maxBytes`, when the least recently used unused textures are deleted.
+
+    The numbers of hits, misses and evictions are counted (see
+    :meth:`stats`). Set `enabled` to False to stop new textures being
+    shared.
+    """
+    def __init__(self, maxBytes=256*2**20):
+        self.enabled = True
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()  # key: entry, least recently used first
+        self._byName = {}  # GL texture name: entry
+        self.nBytes = 0
+        self.nHits = 0
+        self.nMisses = 0
+        self.nEvictions = 0
+
+    def getKey(self, tex, pixFormat, dataType, res, maskParams, interpolate,
+               forcePOW2, useShaders):
+        """The key for a texture made by _createTexture with these arguments,
+        or None if it can't be cached"""
+        if not self.enabled:
+            return None
+        if type(tex) == numpy.ndarray:
+            data = numpy.ascontiguousarray(tex)
+            source = ('array', data.shape, data.dtype.str,
+                      hashlib.sha1(data.view(numpy.uint8)).hexdigest())
+        elif tex is None or tex in namedTextures:
+            source = ('named', str(tex).lower())
+        elif type(tex) in [str, unicode, numpy.string_] and os.path.isfile(tex):
+            fileStat = os.stat(tex)
+            source = ('file', os.path.abspath(tex), fileStat.st_mtime,
+                      fileStat.st_size)
+        else:  # e.g. a PIL image
+            return None
+        return (source, res, pixFormat, dataType,
+                tuple(sorted(maskParams.items())), bool(interpolate), forcePOW2,
+                bool(useShaders))
+
+    def acquire(self, key, id):
+        """Point the texture `id` (a GL.GLuint, with no texture yet or one of
+        its own) at the cached texture for `key`. Returns the entry, or None
+        if there isn't one yet.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.nMisses += 1
+            return None
+        self._entries[key] = entry  # now the most recently used
+        self.nHits += 1
+        entry.refCount += 1
+        if id.value:
+            GL.glDeleteTextures(1, id)
+        id.value = entry.name
+        return entry
+
+    def add(self, key, id, nBytes, wasLum, stimAttribs):
+        """Adopt the texture just made in `id` as the one for `key`"""
+        entry = _CachedTexture(key, id.value, nBytes, wasLum, stimAttribs)
+        self._entries[key] = entry
+        self._byName[entry.name] = entry
+        self.nBytes += nBytes
+        self._evict()
+
+    def detach(self, id):
+        """If `id` is a cached texture, release it and give `id` a new
+        texture of its own (about to be replaced by _createTexture)"""
+        if self.release(id):
+            GL.glGenTextures(1, ctypes.byref(id))
+
+    def release(self, id):
+        """Stop using the cached texture in `id` (setting id to 0). Returns
+        False if it wasn't a cached texture (so the caller should delete it)
+        """
+        entry = self._byName.get(id.value)
+        if entry is None:
+            return False
+        entry.refCount -= 1
+        id.value = 0
+        self._evict()
+        return True
+
+    def _evict(self):
+        """Delete the least recently used unused textures until the cache
+        holds no more than maxBytes"""
+        if self.nBytes <= self.maxBytes:
+            return
+        for entry in self._entries.values():
+            if self.nBytes <= self.maxBytes:
+                break
+            if entry.refCount <= 0:
+                self._delete(entry)
+                self.nEvictions += 1
+
+    def _delete(self, entry):
+        del self._entries[entry.key]
+        del self._byName[entry.name]
+        self.nBytes -= entry.nBytes
+        GL.glDeleteTextures(1, GL.GLuint(entry.name))
+
+    def clear(self):
+        """Delete all the textures that no stimulus is using"""
+        for entry in self._entries.values():
+            if entry.refCount <= 0:
+                self._delete(entry)
+
+    def stats(self):
+        """Returns a dict with the numbers of hits, misses and evictions,
+        the number of textures cached (nTextures, of which nUnused aren't
+        being used by a stimulus) and their size in bytes (nBytes)
+        """
+        nUnused = len([entry for entry in self._entries.values()
+                       if entry.refCount <= 0])
+        return {'hits': self.nHits, 'misses': self.nMisses,
+                'evictions': self.nEvictions,
+                'nTextures': len(self._entries), 'nUnused': nUnused,
+                'nBytes': self.nBytes}
@@ -18,6 +18,8 @@ import weakref
 # Shaders will work but require OpenGL2.0 drivers AND PyOpenGL3.0+
 import pyglet
 pyglet.options['debug_gl'] = False
+from psychopy.platform_specific import setPygletOptions
+setPygletOptions()
 GL = pyglet.gl
 import ctypes
 
@@ -58,9 +60,14 @@ import psychopy.event
 from psychopy.tools.attributetools import attributeSetter, setAttribute
 from psychopy.tools.arraytools import val2array
 from psychopy import makeMovies
-from .text import TextStim
+from .text import TextStim, TextLayoutCache
 from .grating import GratingStim
 from .helpers import setColor
+from .windowframestats import FrameIntervalRecorder
+from .texturecache import TextureCache
+from .pixelbuffer import PixelBufferUploader
+from .movierecorder import MovieRecorder
+from .offscreen import OffscreenWindow
 from . import glob_vars
 
 try:
@@ -80,6 +87,10 @@ from psychopy.core import rush
 
 reportNDroppedFrames = 5  # stop raising warning after this
 
+# the phases of Window.flip() timed by the flip profiler (in order)
+flipProfilePhases = ('draw', 'fbo', 'events', 'swap', 'clear', 'blank',
+                     'callbacks', 'log')
+
 from psychopy.visual.gamma import getGammaRamp, setGammaRamp, setGamma
 #import pyglet.gl, pyglet.window, pyglet.image, pyglet.font, pyglet.event
 from . import shaders as _shaders
@@ -174,8 +185,12 @@ class Window(object):
             allowGUI :  *None*, True or False (if None prefs are used)
                 If set to False, window will be drawn with no frame and
                 no buttons to close etc...
-            winType :  *None*, 'pyglet', 'pygame'
-                If None then PsychoPy will revert to user/site preferences
+            winType :  *None*, 'pyglet', 'pygame', 'offscreen'
+                If None then PsychoPy will revert to user/site preferences.
+                'offscreen' renders (to a framebuffer object) without any
+                display, through EGL, e.g. to make stimulus images on a
+                server with getMovieFrame(). There are no events and flip()
+                doesn't wait for a screen refresh.
             monitor : *None*, string or a `~psychopy.monitors.Monitor` object
                 The monitor to be used during the experiment
             units :  *None*, 'height' (of the window), 'norm' (normalised),
@@ -352,16 +367,32 @@ class Window(object):
         self.frameClock = core.Clock()  # from psycho/core
         self.frames = 0  # frames since last fps calc
         self.movieFrames = []  # list of captured frames (Image objects)
+        self.movieRecorder = None  # see recordMovie()
 
         self.recordFrameIntervals = False
         # Allows us to omit the long timegap that follows each time turn it off
         self.recordFrameIntervalsJustTurnedOn = False
         self.nDroppedFrames = 0
-        self.frameIntervals = []
+        # last intervals are kept in a ring buffer (with stats of all of them)
+        self._frameIntervals = FrameIntervalRecorder()
+
+        # flip profiler (see recordFlipProfile), a ring buffer of timestamps
+        self.__dict__['recordFlipProfile'] = False
+        self._flipProfile = None
+        self._flipProfileN = 0
+        self._flipStamps = numpy.zeros(len(flipProfilePhases)+1, 'f8')
 
         self._toDraw = []
         self._toDrawDepths = []
         self._eventDispatchers = []
+        self.__dict__['batchAutoDraw'] = False
+        self.batchStats = {}  # updated by flip() when batchAutoDraw is True
+        #textures shared between stimuli (see _createTexture)
+        self.textureCache = TextureCache()
+        #large textures and movie frames are uploaded through PBOs
+        self.textureUploader = PixelBufferUploader(enabled=self._havePBOs)
+        #pyglet text layouts shared between TextStims (see TextStim.preloadText)
+        self.textLayoutCache = TextLayoutCache()
 
         self.lastFrameT = core.getTime()
         self.waitBlanking = waitBlanking
@@ -370,7 +401,7 @@ class Window(object):
         # over several frames with no drawing
         self._monitorFrameRate=None
         self.monitorFramePeriod=0.0 #for testing  when to stop drawing a stim
-        if checkTiming:
+        if checkTiming and self.winType != 'offscreen':  # has no refresh
             self._monitorFrameRate = self.getActualFrameRate()
         if self._monitorFrameRate is not None:
             self.monitorFramePeriod=1.0/self._monitorFrameRate
@@ -449,6 +480,82 @@ class Window(object):
         but use this method if you need to suppress the log message."""
         setAttribute(self, 'recordFrameIntervals', value, log)
 
+    @property
+    def frameIntervals(self):
+        """The recorded frame intervals (s) as a numpy array, oldest first.
+
+        Only the most recent intervals are held in memory (100000 by default,
+        see :meth:`setFrameIntervalsSize`); use
+        :meth:`streamFrameIntervals` to keep all of them on disk and
+        :meth:`frameStats` for statistics of all intervals.
+
+        Assigning a sequence (e.g. `win.frameIntervals = []`) replaces the
+        recorded intervals and resets the statistics.
+        """
+        return self._frameIntervals.last()
+
+    @frameIntervals.setter
+    def frameIntervals(self, intervals):
+        self._frameIntervals.reset()
+        self._frameIntervals.extend(intervals)
+
+    def setFrameIntervalsSize(self, size):
+        """Set how many frame intervals are held in memory (this clears
+        the recorded intervals)
+        """
+        self._frameIntervals.stopStream()
+        self._frameIntervals = FrameIntervalRecorder(size=size)
+
+    def frameStats(self, percentiles=(50, 95, 99)):
+        """Statistics of the frame intervals recorded since the last reset,
+        cheap enough to call while an experiment is running.
+
+        Returns a dict with keys 'n', 'nDropped', 'mean', 'sd', 'min',
+        'max' (in s) and 'percentiles' (a dict of {q: value}, estimated to
+        0.1 ms).
+        """
+        return self._frameIntervals.stats(percentiles=percentiles)
+
+    def streamFrameIntervals(self, fileName=None, every=600):
+        """Append recorded frame intervals to a file every `every` frames
+        (as comma-separated values, like :meth:`saveFrameIntervals`), so
+        that long runs are kept in full without holding them in memory.
+
+        Call with fileName=None to write any remaining intervals and close
+        the file (this is also done by :meth:`close`).
+        """
+        if fileName is None:
+            self._frameIntervals.stopStream()
+        else:
+            self._frameIntervals.startStream(fileName, every=every)
+
+    def recordMovie(self, fileName=None, fps=None, maxQueuedFrames=30,
+                    ffmpeg='ffmpeg'):
+        """Record every frame flipped from now on to `fileName`: a
+        numbered image sequence (e.g. 'frame.png' gives frame000001.png...)
+        or, for a movie extension such as .mp4, a movie encoded by `ffmpeg`
+        (which must be installed) at `fps` (by default the monitor's frame
+        rate).
+
+        Unlike :meth:`getMovieFrame` this keeps at most `maxQueuedFrames`
+        frames in memory: they are read back asynchronously (through pixel
+        buffer objects, where supported) and written by a background thread.
+        Frames the writer can't keep up with are skipped and reported.
+
+        Call with fileName=None to write the remaining frames and stop
+        (this is also done by :meth:`close`). Returns the recorder's stats
+        (frames captured, written, skipped) when stopping.
+        """
+        stats = None
+        if self.movieRecorder is not None:
+            stats = self.movieRecorder.close()
+            self.movieRecorder = None
+        if fileName is not None:
+            self.movieRecorder = MovieRecorder(self, fileName, fps=fps,
+                                               maxQueuedFrames=maxQueuedFrames,
+                                               ffmpeg=ffmpeg)
+        return stats
+
     def saveFrameIntervals(self, fileName=None, clear=True):
         """Save recorded screen frame intervals to disk, as comma-separated
         values.
@@ -462,15 +569,181 @@ class Window(object):
         """
         if not fileName:
             fileName = 'lastFrameIntervals.log'
-        if len(self.frameIntervals):
-            intervalStr = str(self.frameIntervals)[1:-1]
+        intervals = self._frameIntervals.last()
+        if len(intervals):
+            intervalStr = ', '.join([repr(float(val)) for val in intervals])
             f = open(fileName, 'w')
             f.write(intervalStr)
             f.close()
         if clear:
-            self.frameIntervals = []
+            self._frameIntervals.reset()
             self.frameClock.reset()
 
+    @attributeSetter
+    def batchAutoDraw(self, value):
+        """Set to `True` to draw runs of neighbouring autoDraw stimuli as
+        batches, binding the OpenGL state (shader program, texture and mask)
+        only when it differs from that of the previous stimulus rather than
+        binding and unbinding it for every stimulus.
+
+        Currently GratingStim and ImageStim (with shaders) can be batched.
+        Stimuli are still drawn in the same order, so the savings come from
+        neighbours that share a program, texture or mask (e.g. Gabors sharing
+        textures through `win.textureCache`). Put such stimuli next to each
+        other in the autoDraw list to get the most from batching.
+
+        After each flip `win.batchStats` reports the number of autoDraw
+        stimuli ('nStimuli'), how many were drawn in batches ('nBatched')
+        and how many program/texture bindings that took ('nStateChanges')
+        compared with drawing them one by one ('nStateChangesSaved').
+        """
+        self.__dict__['batchAutoDraw'] = value
+
+    def _drawAutoDrawBatched(self):
+        """Draw the autoDraw stimuli in their usual order, with runs of
+        neighbouring stimuli that can be batched sharing their GL state
+        """
+        nBatched = nStateChanges = nStateChangesSaved = 0
+        batch = []
+        for thisStim in self._toDraw + [None]:
+            key = None
+            if thisStim is not None and hasattr(thisStim, '_prepareBatchDraw'):
+                thisStim._prepareBatchDraw()
+                key = thisStim._batchKey()
+            if batch and key is None:
+                nChanges = self._drawBatch(batch)
+                nBatched += len(batch)
+                nStateChanges += nChanges
+                # drawn one at a time each stim binds (3) and unbinds (3)
+                nStateChangesSaved += 6*len(batch) - nChanges
+                batch = []
+            if thisStim is None:
+                break
+            elif key is None:
+                thisStim.draw()
+            else:
+                batch.append((key, thisStim))
+        self.batchStats = {'nStimuli': len(self._toDraw),
+                           'nBatched': nBatched,
+                           'nStateChanges': nStateChanges,
+                           'nStateChangesSaved': nStateChangesSaved}
+
+    def _drawBatch(self, batch):
+        """Draw a list of (key, stim) in order, binding only the parts of
+        the state that change from one stim to the next. Returns the number
+        of bindings.
+        """
+        firstStim = batch[0][1]
+        firstStim._selectWindow(self)
+        prevKey = None
+        nChanges = 0
+        for key, thisStim in batch:
+            nChanges += thisStim._bindShaderTextures(key[0], prevKey)
+            thisStim._drawBatched(self)
+            prevKey = key
+        nChanges += firstStim._unbindShaderTextures()
+        return nChanges
+
+    @attributeSetter
+    def recordFlipProfile(self, value):
+        """Set to `True` to time each phase of `.flip()`, to find out what
+        is taking the time when frames are dropped.
+
+        The phases are drawing the autoDraw stimuli ('draw'), rendering the
+        framebuffer object ('fbo'), dispatching window events ('events'),
+        swapping the buffers ('swap'), resetting the view and clearing the
+        back buffer ('clear'), waiting for the vertical blank ('blank'),
+        running the `callOnFlip` functions ('callbacks') and frame interval
+        bookkeeping plus `logOnFlip` messages ('log').
+
+        Timestamps go into a preallocated ring buffer of the last
+        `nFrames` flips (see :meth:`resetFlipProfile`) so recording adds
+        very little to each flip.
+
+        see also:
+            Window.getFlipProfile(), Window.reportFlipProfile()
+        """
+        if value and self._flipProfile is None:
+            self.resetFlipProfile()
+        self.__dict__['recordFlipProfile'] = value
+
+    def resetFlipProfile(self, nFrames=3600):
+        """Clear the flip profile and set how many flips it can hold
+        (older flips are overwritten once full).
+        """
+        self._flipProfile = numpy.zeros((nFrames, len(flipProfilePhases)+1),
+                                        'f8')
+        self._flipProfileN = 0
+
+    def getFlipProfile(self):
+        """Return the flips recorded with `recordFlipProfile` (oldest
+        first) as a numpy structured array with fields:
+
+            - 'frameN': the number of the flip since the profile was reset
+            - 't': time the flip started (core.getTime() timebase)
+            - 'gap': time since the end of the previous flip (time spent
+              by the script drawing, checking keys etc. NaN for the first)
+            - one field for each of the phases (see `recordFlipProfile`)
+            - 'total': duration of the whole flip
+
+        All times are in seconds.
+        """
+        dtype = ([('frameN', 'i8'), ('t', 'f8'), ('gap', 'f8')] +
+                 [(phase, 'f8') for phase in flipProfilePhases] +
+                 [('total', 'f8')])
+        if self._flipProfile is None:
+            return numpy.zeros(0, dtype)
+        size = len(self._flipProfile)
+        n = min(self._flipProfileN, size)
+        firstN = self._flipProfileN - n
+        idx = numpy.arange(firstN, self._flipProfileN) % size
+        stamps = self._flipProfile[idx]
+        profile = numpy.zeros(n, dtype)
+        profile['frameN'] = numpy.arange(firstN, self._flipProfileN)
+        profile['t'] = stamps[:, 0]
+        profile['gap'] = numpy.nan
+        profile['gap'][1:] = stamps[1:, 0] - stamps[:-1, -1]
+        durations = numpy.diff(stamps, axis=1)
+        for phaseN, phase in enumerate(flipProfilePhases):
+            profile[phase] = durations[:, phaseN]
+        profile['total'] = stamps[:, -1] - stamps[:, 0]
+        return profile
+
+    def reportFlipProfile(self, threshold=None):
+        """Return a summary (as text) of the recorded flip profile: the
+        mean, SD and max of each phase, and for the flips that ended more
+        than `threshold` seconds after the previous one (by default the
+        same threshold used to count dropped frames) which phase took longest.
+        """
+        profile = self.getFlipProfile()
+        if not len(profile):
+            return 'No flips have been profiled (see Window.recordFlipProfile)'
+        if threshold is None:
+            threshold = self._refreshThreshold
+        phases = ('gap',) + flipProfilePhases
+        ends = profile['t'] + profile['total']
+        intervals = numpy.diff(ends)
+        # the interval ending at flip i is due to the gap before it and flip i
+        slow = numpy.nonzero(intervals > threshold)[0] + 1
+        culprits = dict((phase, 0) for phase in phases)
+        for frameIdx in slow:
+            durations = [profile[phase][frameIdx] for phase in phases]
+            culprits[phases[int(numpy.argmax(durations))]] += 1
+        lines = ['Flip profile of %i flips, %i intervals > %.2fms' %
+                 (len(profile), len(slow), threshold*1000),
+                 '%-10s %8s %8s %8s %8s' % ('phase', 'mean', 'SD', 'max',
+                                            'slowest')]
+        for phase in phases + ('total',):
+            vals = profile[phase][numpy.isfinite(profile[phase])]*1000
+            if not len(vals):
+                vals = numpy.zeros(1)
+            lines.append('%-10s %8.3f %8.3f %8.3f %8s' %
+                         (phase, vals.mean(), vals.std(), vals.max(),
+                          culprits.get(phase, '')))
+        lines.append('(times in ms; slowest = number of long intervals in '
+                     'which that phase took longest)')
+        return '\n'.join(lines)
+
     def onResize(self, width, height):
         '''A default resize event handler.
 
@@ -539,9 +812,19 @@ class Window(object):
         win.flip(clearBuffer=False)#the screen is not cleared (so represent
         the previous screen)
         """
-        for thisStim in self._toDraw:
-            thisStim.draw()
+        profiling = self.recordFlipProfile
+        if profiling:
+            stamps = self._flipStamps
+            stamps[0] = core.getTime()
+
+        if self.batchAutoDraw:
+            self._drawAutoDrawBatched()
+        else:
+            for thisStim in self._toDraw:
+                thisStim.draw()
 
+        if profiling:
+            stamps[1] = core.getTime()
         flipThisFrame = self._startOfFlip()
         if self.useFBO:
             if flipThisFrame:
@@ -571,8 +854,12 @@ class Window(object):
 
         #call this before flip() whether FBO was used or not
         self._afterFBOrender()
+        if self.movieRecorder is not None and flipThisFrame:
+            self.movieRecorder.capture()
+        if profiling:
+            stamps[2] = core.getTime()
 
-        if self.winType == "pyglet":
+        if self.winType != "pygame":
             #make sure this is current context
             if glob_vars.currWindow != self:
                 self.winHandle.switch_to()
@@ -590,9 +877,13 @@ class Window(object):
             # movie updating
             if pyglet.version < '1.2':
                 pyglet.media.dispatch_events()  # for sounds to be processed
+            if profiling:
+                stamps[3] = core.getTime()
             if flipThisFrame:
                 self.winHandle.flip()
         else:
+            if profiling:  # pygame events are pumped after the swap
+                stamps[3] = core.getTime()
             if pygame.display.get_init():
                 if flipThisFrame:
                     pygame.display.flip()
@@ -600,6 +891,8 @@ class Window(object):
                 pygame.event.pump()
             else:
                 core.quit()  # we've unitialised pygame so quit
+        if profiling:
+            stamps[4] = core.getTime()
 
         if self.useFBO:
             if flipThisFrame:
@@ -638,6 +931,8 @@ class Window(object):
 
         #reset returned buffer for next frame
         self._endOfFlip(clearBuffer)
+        if profiling:
+            stamps[5] = core.getTime()
 
         #waitBlanking
         if self.waitBlanking and flipThisFrame:
@@ -653,11 +948,15 @@ class Window(object):
 
         #get timestamp
         now = logging.defaultClock.getTime()
+        if profiling:
+            stamps[6] = core.getTime()
 
         # run other functions immediately after flip completes
         for callEntry in self._toCall:
             callEntry['function'](*callEntry['args'], **callEntry['kwargs'])
         del self._toCall[:]
+        if profiling:
+            stamps[7] = core.getTime()
 
         # do bookkeeping
         if self.recordFrameIntervals:
@@ -667,8 +966,9 @@ class Window(object):
             if self.recordFrameIntervalsJustTurnedOn:  # don't do anything
                 self.recordFrameIntervalsJustTurnedOn = False
             else:  # past the first frame since turned on
-                self.frameIntervals.append(deltaT)
-                if deltaT > self._refreshThreshold:
+                dropped = deltaT > self._refreshThreshold
+                self._frameIntervals.append(deltaT, dropped=dropped)
+                if dropped:
                     self.nDroppedFrames += 1
                     if self.nDroppedFrames < reportNDroppedFrames:
                         logging.warning('t of last frame was %.2fms (=1/%i)' %
@@ -686,6 +986,10 @@ class Window(object):
                         t=now,
                         obj=logEntry['obj'])
         del self._toLog[:]
+        if profiling:
+            stamps[8] = core.getTime()
+            self._flipProfile[self._flipProfileN % len(self._flipProfile)] = stamps
+            self._flipProfileN += 1
 
         #keep the system awake (prevent screen-saver or sleep)
         platform_specific.sendStayAwake()
@@ -813,6 +1117,7 @@ class Window(object):
         Frames are stored in memory until a .saveMovieFrames(filename) command
         is issued. You can issue getMovieFrame() as often
         as you like and then save them all in one go when finished.
+        To record every frame of a long run use :meth:`recordMovie` instead.
 
         The back buffer will return the frame that hasn't yet been 'flipped'
         to be visible on screen but has the advantage that the mouse and any
@@ -833,6 +1138,11 @@ class Window(object):
         #do the reading of the pixels
         if buffer == 'back':
             GL.glReadBuffer(GL.GL_BACK)
+        elif self.winType == 'offscreen':
+            #flip() leaves the frame in the (only) buffer of the pbuffer
+            if self.useFBO:
+                GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, 0)
+            GL.glReadBuffer(GL.GL_BACK)
         else:
             GL.glReadBuffer(GL.GL_FRONT)
             if self.useFBO:
@@ -840,13 +1150,14 @@ class Window(object):
 
         #fetch the data with glReadPixels
         #pyglet.gl stores the data in a ctypes buffer
-        bufferDat = (GL.GLubyte * (4 * self.size[0] * self.size[1]))()
-        GL.glReadPixels(0, 0, self.size[0], self.size[1],
+        size = (int(self.size[0]), int(self.size[1]))  # newer PIL needs a tuple
+        bufferDat = (GL.GLubyte * (4 * size[0] * size[1]))()
+        GL.glReadPixels(0, 0, size[0], size[1],
                         GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, bufferDat)
         try:
-            im = Image.fromstring(mode='RGBA', size=self.size, data=bufferDat)
+            im = Image.fromstring(mode='RGBA', size=size, data=bufferDat)
         except Exception:
-            im = Image.frombytes(mode='RGBA', size=self.size, data=bufferDat)
+            im = Image.frombytes(mode='RGBA', size=size, data=bufferDat)
         im = im.transpose(Image.FLIP_TOP_BOTTOM)
         im = im.convert('RGB')
 
@@ -938,6 +1249,20 @@ class Window(object):
         if clearFrames:
             self.movieFrames = []
 
+    def _getRegionBox(self, rect):
+        """The corners of `rect` (Left Top Right Bottom, norm units) in pixels
+        and its width and height, as read by _getRegionOfFrame"""
+        x, y = self.size  # of window, not image
+
+        # box corners in pix
+        box = [(rect[0]/2. + 0.5)*x, (rect[1]/-2. + 0.5)*y,  # Left Top
+               (rect[2]/2. + 0.5)*x, (rect[3]/-2. + 0.5)*y]  # Right Bottom
+        box = map(int, box)
+
+        horz = box[2] - box[0]
+        vert = box[3] - box[1]
+        return box, horz, vert
+
     def _getRegionOfFrame(self, rect=[-1, 1, 1, -1],
                           buffer='front', power2=False, squarePower2=False):
         """
@@ -952,16 +1277,9 @@ class Window(object):
         """
         # Ideally: rewrite using GL frame buffer object; glReadPixels == slow
 
-        x, y = self.size  # of window, not image
         imType = 'RGBA'  # not tested with anything else
 
-        # box corners in pix
-        box = [(rect[0]/2. + 0.5)*x, (rect[1]/-2. + 0.5)*y,  # Left Top
-               (rect[2]/2. + 0.5)*x, (rect[3]/-2. + 0.5)*y]  # Right Bottom
-        box = map(int, box)
-
-        horz = box[2] - box[0]
-        vert = box[3] - box[1]
+        box, horz, vert = self._getRegionBox(rect)
 
         if buffer == 'back':
             GL.glReadBuffer(GL.GL_BACK)
@@ -999,6 +1317,8 @@ class Window(object):
     def close(self):
         """Close the window (and reset the Bits++ if necess)."""
         self._closed=True
+        if self.movieRecorder is not None:  # while there's still a context
+            self.recordMovie(None)
 
         try:
             openWindows.remove(self)
@@ -1025,6 +1345,8 @@ class Window(object):
                     ioHubConnection.ACTIVE_CONNECTION.unregisterPygletWindowHandles(_hw_handle)
             except:
                 pass
+        elif self.winType == 'offscreen':
+            self.winHandle.close()
         else:
             #pygame.quit()
             pygame.display.quit()
@@ -1034,6 +1356,7 @@ class Window(object):
                 self.bits.reset()
         except:
             pass
+        self._frameIntervals.stopStream()
         try:
             logging.flush()
         except:
@@ -1057,6 +1380,7 @@ class Window(object):
                 self._progSignedTexMask = self._shaders['signedTexMask']
                 self._progSignedTexMask1D = self._shaders['signedTexMask1D']
                 self._progImageStim = self._shaders['imageStim']
+                self._progElementArray = self._shaders['elementArray']
         elif blendMode=='add':
             GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE)
             if hasattr(self, '_shaders'):
@@ -1064,6 +1388,7 @@ class Window(object):
                 self._progSignedTexMask = self._shaders['signedTexMask_adding']
                 self._progSignedTexMask1D = self._shaders['signedTexMask1D_adding']
                 self._progImageStim = self._shaders['imageStim_adding']
+                self._progElementArray = self._shaders['elementArray_adding']
     def setBlendMode(self, blendMode, log=None):
         """Usually you can use 'stim.attribute = value' syntax instead,
         but use this method if you need to suppress the log message."""
@@ -1125,7 +1450,7 @@ class Window(object):
 
         # if it is None then this will be done during window setup
         if self.winHandle is not None:
-            if self.winType == 'pyglet':
+            if self.winType != 'pygame':
                 self.winHandle.switch_to()
             GL.glClearColor(desiredRGB[0], desiredRGB[1], desiredRGB[2], 1.0)
 
@@ -1134,7 +1459,7 @@ class Window(object):
         """
         global GL
         self.rgb = val2array(newRGB, False, length=3)
-        if self.winType == 'pyglet' and glob_vars.currWindow != self:
+        if self.winType != 'pygame' and glob_vars.currWindow != self:
             self.winHandle.switch_to()
             glob_vars.currWindow = self
         GL.glClearColor((self.rgb[0]+1.0)/2.0,
@@ -1198,7 +1523,7 @@ class Window(object):
     def gammaRamp(self, newRamp):
         if self.winType == 'pyglet':
             self.winHandle.setGammaRamp(self.winHandle, newRamp)
-        else: #pyglet
+        elif self.winType == 'pygame':
             self.winHandle.set_gamma_ramp(newRamp[:,0], newRamp[:,1], newRamp[:,2])
 
     def _checkGamma(self, gamma=None):
@@ -1326,13 +1651,7 @@ class Window(object):
         if self.stereo and not GL.gl_info.have_extension('GL_STEREO'):
             logging.warning('A stereo window was requested but the graphics '
                             'card does not appear to support GL_STEREO')
-        if self.useFBO: #check for necessary extensions
-            if not GL.gl_info.have_extension('GL_EXT_framebuffer_object'):
-                logging.warn("Trying to use a framebuffer pbject but GL_EXT_framebuffer_object is not supported. Disabling")
-                self.useFBO=False
-            if not GL.gl_info.have_extension('GL_ARB_texture_float'):
-                logging.warn("Trying to use a framebuffer pbject but GL_ARB_texture_float is not supported. Disabling")
-                self.useFBO=False
+        self._checkFBOExtensions()
         #add these methods to the pyglet window
         self.winHandle.setGamma = setGamma
         self.winHandle.setGammaRamp = setGammaRamp
@@ -1382,6 +1701,29 @@ class Window(object):
                     winhwnds.append(self._hw_handle)
                 ioHubConnection.ACTIVE_CONNECTION.registerPygletWindowHandles(*winhwnds)
 
+    def _checkFBOExtensions(self):
+        if self.useFBO: #check for necessary extensions
+            if not GL.gl_info.have_extension('GL_EXT_framebuffer_object'):
+                logging.warn("Trying to use a framebuffer pbject but GL_EXT_framebuffer_object is not supported. Disabling")
+                self.useFBO=False
+            if not GL.gl_info.have_extension('GL_ARB_texture_float'):
+                logging.warn("Trying to use a framebuffer pbject but GL_ARB_texture_float is not supported. Disabling")
+                self.useFBO=False
+
+    def _setupOffscreen(self):
+        self.winType = "offscreen"
+        self.winHandle = OffscreenWindow(int(self.size[0]), int(self.size[1]),
+                                         stencil=self.allowStencil)
+        self._hw_handle = None
+        glob_vars.currWindow = self
+        #draw to a framebuffer object; flip() copies each frame to the pbuffer
+        self.useFBO = True
+        self._checkFBOExtensions()
+        if self.autoLog:
+            logging.info('configured offscreen %ix%i window (%s)'
+                         % (self.size[0], self.size[1],
+                            GL.gl_info.get_renderer()))
+
     def _setupPygame(self):
         #we have to do an explicit import of pyglet.gl from pyglet
         # (only when using pygame backend)
@@ -1445,10 +1787,12 @@ class Window(object):
             self._setupPygame()
         elif self.winType == "pyglet":
             self._setupPyglet()
+        elif self.winType == "offscreen":
+            self._setupOffscreen()
         #check whether shaders are supported
         # also will need to check for ARB_float extension,
         # but that should be done after context is created
-        self._haveShaders = (self.winType == 'pyglet' and
+        self._haveShaders = (self.winType != 'pygame' and
                              pyglet.gl.gl_info.get_version() >= '2.0')
 
         #setup screen color
@@ -1477,6 +1821,14 @@ class Window(object):
         #this needs to be done AFTER the context has been created
         if not GL.gl_info.have_extension('GL_ARB_texture_float'):
             self._haveShaders = False
+        #instanced drawing (used by ElementArrayStim)
+        self._haveInstancing = (self._haveShaders and
+            GL.gl_info.have_extension('GL_ARB_instanced_arrays') and
+            GL.gl_info.have_extension('GL_ARB_draw_instanced'))
+        #pixel buffer objects (for streaming texture uploads)
+        self._havePBOs = (self.winType != 'pygame' and
+            (pyglet.gl.gl_info.get_version() >= '2.1' or
+             GL.gl_info.have_extension('GL_ARB_pixel_buffer_object')))
 
         GL.glClear(GL.GL_COLOR_BUFFER_BIT)
 
@@ -1513,6 +1865,12 @@ class Window(object):
         self._shaders['signedTexMask1D_adding'] = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragSignedColorTexMask1D_adding)
         self._shaders['imageStim'] = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragImageStim)
         self._shaders['imageStim_adding'] = _shaders.compileProgram(_shaders.vertSimple, _shaders.fragImageStim_adding)
+        #ElementArrayStim expands its elements in the vertex shader
+        corner = {'corner': 0}  # per-vertex attrib must be at index 0
+        self._shaders['elementArray'] = _shaders.compileProgram(_shaders.vertElementArray,
+            _shaders.fragSignedColorTexMask, attribLocations=corner)
+        self._shaders['elementArray_adding'] = _shaders.compileProgram(_shaders.vertElementArray,
+            _shaders.fragSignedColorTexMask_adding, attribLocations=corner)
 
     def _setupFrameBuffer(self):
         # Setup framebuffer
@@ -1623,10 +1981,10 @@ class Window(object):
         self.recordFrameIntervals = True
         for frameN in range(nMaxFrames):
             self.flip()
-            if (len(self.frameIntervals) >= nIdentical and
-                    (numpy.std(self.frameIntervals[-nIdentical:]) <
-                     (threshold/1000.0))):
-                rate = 1.0/numpy.mean(self.frameIntervals[-nIdentical:])
+            intervals = self._frameIntervals.last(nIdentical)
+            if (len(intervals) >= nIdentical and
+                    (numpy.std(intervals) < (threshold/1000.0))):
+                rate = 1.0/numpy.mean(intervals)
                 if self.screen is None:
                     scrStr = ""
                 else:
@@ -1635,7 +1993,7 @@ class Window(object):
                     logging.debug('Screen%s actual frame rate measured at %.2f' %
                               (scrStr, rate))
                 self.recordFrameIntervals = recordFrmIntsOrig
-                self.frameIntervals = []
+                self._frameIntervals.reset()
                 return rate
         #if we got here we reached end of maxFrames with no consistent value
         logging.warning("Couldn't measure a consistent frame rate.\n"
@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+
+'''Fixed-size storage and running statistics for the frame intervals of a
+:class:`~psychopy.visual.Window` (see `Window.recordFrameIntervals`)'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2015 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+import numpy
+
+
+class FrameIntervalRecorder(object):
+    """Keeps the most recent `size` frame intervals in a preallocated ring
+    buffer, along with statistics of all intervals since the last reset
+    (count, mean, SD, min, max, dropped frames and a histogram for
+    percentiles). Adding an interval takes constant time and memory.
+
+    Optionally intervals are also appended to a file every `every` frames
+    (see :meth:`startStream`) so that long runs can be kept in full.
+    """
+    def __init__(self, size=100000, binWidth=0.0001, maxInterval=0.2):
+        """
+        :parameters:
+
+            size:
+                the number of intervals held in memory
+
+            binWidth, maxInterval:
+                resolution and range (s) of the histogram used for
+                percentiles (longer intervals all go in the last bin)
+        """
+        self.size = int(size)
+        self.binWidth = binWidth
+        self._buf = numpy.zeros(self.size, 'f8')
+        self._hist = numpy.zeros(int(round(maxInterval/binWidth)) + 1, 'i8')
+        self._stream = None
+        self.streamEvery = 0
+        self.reset()
+
+    def reset(self):
+        """Forget all intervals and statistics (a stream stays open)"""
+        self.flushStream()
+        self._n = 0
+        self._nStreamed = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = numpy.inf
+        self._max = -numpy.inf
+        self._hist[:] = 0
+        self.nDropped = 0
+
+    def __len__(self):
+        return min(self._n, self.size)
+
+    def append(self, interval, dropped=False):
+        """Add an interval (in s), flagging whether it was a dropped frame"""
+        self._buf[self._n % self.size] = interval
+        self._n += 1
+        # Welford's running mean and sum of squared deviations
+        delta = interval - self._mean
+        self._mean += delta/self._n
+        self._m2 += delta*(interval - self._mean)
+        if interval < self._min:
+            self._min = interval
+        if interval > self._max:
+            self._max = interval
+        binN = int(interval/self.binWidth)
+        if binN >= len(self._hist):
+            binN = len(self._hist) - 1
+        elif binN < 0:
+            binN = 0
+        self._hist[binN] += 1
+        if dropped:
+            self.nDropped += 1
+        if self._stream is not None and \
+                self._n - self._nStreamed >= self.streamEvery:
+            self.flushStream()
+
+    def extend(self, intervals):
+        for interval in intervals:
+            self.append(interval)
+
+    def last(self, n=None):
+        """Return (a copy of) the last n intervals held, oldest first"""
+        nHeld = len(self)
+        if n is None or n > nHeld:
+            n = nHeld
+        idx = numpy.arange(self._n - n, self._n) % self.size
+        return self._buf[idx]
+
+    def percentile(self, q):
+        """Estimate of the q-th percentile (0-100) of all intervals since the
+        last reset, to the resolution of the histogram.
+        """
+        if not self._n:
+            return numpy.nan
+        cum = numpy.cumsum(self._hist)
+        binN = numpy.searchsorted(cum, q/100.0*self._n)
+        binN = min(binN, len(self._hist) - 1)
+        # report the bin centre, but never beyond the observed range
+        return min(max((binN + 0.5)*self.binWidth, self._min), self._max)
+
+    def stats(self, percentiles=(50, 95, 99)):
+        """Return a dict of statistics of all intervals since the last reset
+
+            - n, nDropped, mean, sd, min, max (times in s)
+            - percentiles: a dict of {q: value}
+        """
+        n = self._n
+        stats = {'n': n, 'nDropped': self.nDropped}
+        if n:
+            stats.update({'mean': self._mean, 'min': self._min,
+                          'max': self._max})
+        else:
+            stats.update({'mean': numpy.nan, 'min': numpy.nan,
+                          'max': numpy.nan})
+        if n > 1:
+            stats['sd'] = numpy.sqrt(self._m2/(n - 1))
+        else:
+            stats['sd'] = numpy.nan
+        stats['percentiles'] = dict((q, self.percentile(q))
+                                    for q in percentiles)
+        return stats
+
+    def startStream(self, fileName, every=600):
+        """Append intervals to `fileName` (as comma-separated values, like
+        `Window.saveFrameIntervals`) every `every` frames.
+        """
+        self.stopStream()
+        every = int(every)
+        if not 0 < every <= self.size:
+            raise ValueError('every must be between 1 and the size of the '
+                             'buffer (%i)' % self.size)
+        self._stream = open(fileName, 'w')
+        self._streamStarted = False
+        self.streamEvery = every
+        self._nStreamed = self._n  # earlier intervals aren't streamed
+
+    def flushStream(self):
+        """Write any intervals not yet in the stream file"""
+        if self._stream is None:
+            return
+        # anything older than the buffer has been lost (can only happen if
+        # flushStream wasn't called for more than `size` frames)
+        first = max(self._nStreamed, self._n - self.size)
+        if first < self._n:
+            idx = numpy.arange(first, self._n) % self.size
+            txt = ', '.join([repr(float(val)) for val in self._buf[idx]])
+            if self._streamStarted:
+                txt = ', ' + txt
+            self._stream.write(txt)
+            self._stream.flush()
+            self._streamStarted = True
+        self._nStreamed = self._n
+
+    def stopStream(self):
+        """Write remaining intervals and close the stream file"""
+        if self._stream is not None:
+            self.flushStream()
+            self._stream.close()
+            self._stream = None